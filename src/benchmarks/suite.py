@@ -0,0 +1,274 @@
+import argparse
+import datetime
+import fnmatch
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+if __name__ == "__main__":
+    # run as a script: make the src packages importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from experiments.basic_stats import generate_stats
+from experiments.extended_stats import compute_attack_defense
+from simulation.runner import run_simulations
+from simulation.skill_provider import SkillProvider
+from simulation.world_cup_simulation import WC_TEAMS, simulate_world_cup
+from util.preprocessing import CHUNK_SIZE, RAW_CSV, process_chunks
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+HISTORY_JSON = "benchmarks/history.json"
+
+# fixed-size, fixed-seed benchmarks of the pipeline stages. every run appends one record
+# (time and peak python memory per benchmark) to HISTORY_JSON; `compare` diffs two records
+# and flags regressions.
+#
+#   python benchmarks/suite.py run [--sizes 1x 10x 100x] [--only 'simulate*'] [--repeat 3]
+#   python benchmarks/suite.py compare [--base -2] [--head -1] [--threshold 0.1]
+#
+# times are the best of `repeat` runs; memory is the tracemalloc peak of one extra run
+# (numpy and pandas buffers are counted, torch tensors are not).
+# the synthetic histories resample results_raw.csv: SIZES[s] times as many rows, each
+# shifted by up to 10 years so copies of a match do not collapse into duplicates.
+
+SEED = 0
+SIZES = {"1x": 1, "10x": 10, "100x": 100}
+DEFAULT_SIZES = ("1x", "10x")
+REPEAT = 3
+THRESHOLD = 0.10
+
+# short SVI fits per model (torch / pyro are only imported by these)
+FIT_MODELS = ("elo", "hierarchical", "time_decay", "dixon_coles")
+FIT_STEPS = 300
+FIT_SAMPLES = 100
+FIT_CSV = "data/processed/results_last_10yrs.csv"
+
+
+# ============================================================
+# DATA
+# ============================================================
+def synthetic_raw(scale, seed=SEED):
+    """results_raw.csv resampled to scale times its rows (scale 1: the file itself)."""
+    raw = pd.read_csv(os.path.join(BASE_DIR, RAW_CSV))
+    if scale == 1:
+        return raw
+    rng = np.random.default_rng(seed)
+    rows = raw.iloc[rng.integers(len(raw), size=scale * len(raw))].reset_index(drop=True)
+    shift = pd.to_timedelta(rng.integers(0, 3650, size=len(rows)), unit="D")
+    rows["date"] = (pd.to_datetime(rows["date"]) + shift).dt.strftime("%Y-%m-%d")
+    return rows.sort_values("date", kind="stable", ignore_index=True)
+
+
+def _chunks(df, chunk_size=CHUNK_SIZE):
+    return (df.iloc[i:i + chunk_size] for i in range(0, len(df), chunk_size))
+
+
+def _clean(raw):
+    return process_chunks(_chunks(raw), np.zeros(0, dtype=np.uint64))[0]
+
+
+# ============================================================
+# BENCHMARKS
+# ============================================================
+class Benchmark:
+    """setup() builds the inputs (not timed), fn(inputs) is the measured call."""
+
+    def __init__(self, name, setup, fn, repeat=REPEAT):
+        self.name = name
+        self.setup = setup
+        self.fn = fn
+        self.repeat = repeat
+
+
+def _data_benchmarks(size):
+    scale = SIZES[size]
+    repeat = REPEAT if scale == 1 else 1
+    cache = {}
+
+    def raw():
+        if "raw" not in cache:
+            cache["raw"] = synthetic_raw(scale)
+        return cache["raw"]
+
+    def clean():
+        if "clean" not in cache:
+            cache["clean"] = _clean(raw())
+        return cache["clean"]
+
+    return [
+        Benchmark(f"preprocess/{size}", raw, _clean, repeat),
+        Benchmark(f"generate_stats/{size}", clean, generate_stats, repeat),
+        Benchmark(f"compute_attack_defense/{size}", clean, compute_attack_defense, repeat),
+    ]
+
+
+def _fit_benchmarks():
+    def setup():
+        from models.approximate import fit_svi
+        from models.data import MatchData
+
+        data = MatchData.from_dataframe(pd.read_csv(os.path.join(BASE_DIR, FIT_CSV)))
+        # torch loads its optimizer machinery on first use, keep that out of the timings
+        fit_svi("elo", data, num_steps=1, num_samples=1, verbose=False)
+        return data
+
+    def fit(model):
+        def run(data):
+            from models.approximate import fit_svi
+
+            return fit_svi(model, data, num_steps=FIT_STEPS, num_samples=FIT_SAMPLES, seed=SEED, verbose=False)
+        return run
+
+    return [Benchmark(f"fit_svi/{model}", setup, fit(model), repeat=1) for model in FIT_MODELS]
+
+
+def _simulation_benchmarks():
+    def provider():
+        return SkillProvider(np.random.default_rng(SEED).normal(size=(1000, len(WC_TEAMS))))
+
+    def per_match(sp):
+        rng = np.random.default_rng(SEED)
+        random.seed(SEED)
+        np.random.seed(SEED)
+        for _ in range(1000):
+            simulate_world_cup(sp.skill_func(rng), verbose=False)
+
+    return [
+        Benchmark("simulate_world_cup/1k", provider, per_match, repeat=1),
+        Benchmark("simulate_batch/1k", provider, lambda sp: run_simulations(sp, 1_000, seed=SEED)),
+        Benchmark("simulate_batch/100k", provider, lambda sp: run_simulations(sp, 100_000, seed=SEED)),
+    ]
+
+
+def benchmarks(sizes=DEFAULT_SIZES):
+    suite = []
+    for size in sizes:
+        suite += _data_benchmarks(size)
+    return suite + _fit_benchmarks() + _simulation_benchmarks()
+
+
+def measure(bench, repeat=None):
+    """{"seconds": best time, "mean_seconds", "repeat", "peak_mb", "rows"} of one benchmark."""
+    inputs = bench.setup()
+    times = []
+    for _ in range(bench.repeat if repeat is None else repeat):
+        gc.collect()
+        start = time.perf_counter()
+        bench.fn(inputs)
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    bench.fn(inputs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": min(times), "mean_seconds": float(np.mean(times)), "repeat": len(times),
+            "peak_mb": peak / 2 ** 20, "rows": len(inputs) if isinstance(inputs, pd.DataFrame) else None}
+
+
+# ============================================================
+# HISTORY
+# ============================================================
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_history(path=HISTORY_JSON):
+    path = os.path.join(BASE_DIR, path)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def run(sizes=DEFAULT_SIZES, only=None, repeat=None, path=HISTORY_JSON, verbose=True):
+    """Runs the benchmarks (names matching the glob only) and appends the record to path."""
+    results = {}
+    for bench in benchmarks(sizes):
+        if only and not fnmatch.fnmatch(bench.name, only):
+            continue
+        results[bench.name] = measure(bench, repeat)
+        if verbose:
+            r = results[bench.name]
+            print(f"{bench.name:<34} {r['seconds']:9.3f}s  peak {r['peak_mb']:9.1f} MB")
+
+    record = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "results": results,
+    }
+    history = load_history(path) + [record]
+    os.makedirs(os.path.dirname(os.path.join(BASE_DIR, path)), exist_ok=True)
+    with open(os.path.join(BASE_DIR, path), "w") as f:
+        json.dump(history, f, indent=1)
+    return record
+
+
+def compare(history, base=-2, head=-1, threshold=THRESHOLD):
+    """
+    Benchmarks of two history records side by side. A benchmark regresses if its time or
+    its peak memory grew by more than threshold (relative).
+    """
+    a, b = history[base]["results"], history[head]["results"]
+    rows = []
+    for name in [n for n in b if n in a]:
+        time_ratio = b[name]["seconds"] / a[name]["seconds"]
+        mem_ratio = b[name]["peak_mb"] / a[name]["peak_mb"] if a[name]["peak_mb"] else 1.0
+        rows.append({"benchmark": name, "base_s": a[name]["seconds"], "head_s": b[name]["seconds"],
+                     "time_ratio": time_ratio, "base_mb": a[name]["peak_mb"], "head_mb": b[name]["peak_mb"],
+                     "mem_ratio": mem_ratio,
+                     "regression": time_ratio > 1 + threshold or mem_ratio > 1 + threshold})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pipeline benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_cmd = commands.add_parser("run", help="run the benchmarks and append the results to the history")
+    run_cmd.add_argument("--sizes", nargs="+", default=list(DEFAULT_SIZES), choices=list(SIZES))
+    run_cmd.add_argument("--only", help="glob on benchmark names, e.g. 'simulate*'")
+    run_cmd.add_argument("--repeat", type=int, help="timed runs per benchmark (default: per benchmark)")
+    cmp_cmd = commands.add_parser("compare", help="compare two history records, exit 1 on regressions")
+    cmp_cmd.add_argument("--base", type=int, default=-2, help="history index of the baseline record")
+    cmp_cmd.add_argument("--head", type=int, default=-1, help="history index of the new record")
+    cmp_cmd.add_argument("--threshold", type=float, default=THRESHOLD, help="relative slowdown that counts")
+    for cmd in (run_cmd, cmp_cmd):
+        cmd.add_argument("--history", default=HISTORY_JSON)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run(args.sizes, args.only, args.repeat, args.history)
+        return 0
+
+    history = load_history(args.history)
+    if len(history) < 2:
+        print("need at least two benchmark runs to compare")
+        return 1
+    df = compare(history, args.base, args.head, args.threshold)
+    with pd.option_context("display.width", 200, "display.float_format", "{:.3f}".format):
+        print(df.to_string(index=False))
+    regressions = df[df["regression"]]
+    if len(regressions):
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions['benchmark'])}")
+        return 1
+    print(f"\nno regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,12 @@
 import pandas as pd
 import os
+import sys
+
+if __name__ == "__main__":
+    # run as a script: make the src packages importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.team_aggregates import TeamLong
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 RESULTS_FULL_CSV = "data/processed/results_full.csv"
@@ -9,53 +16,41 @@ RESULTS_5Y_CSV = "data/processed/results_last_5yrs.csv"
 ACTIVE_CSV = RESULTS_5Y_CSV
 PRINT_ALL = False
 
-def generate_stats(df: pd.DataFrame) -> pd.DataFrame:
+def generate_stats(df: pd.DataFrame, as_of=None, windows=None):
     """
     Calculates basic statistics (W-L-D) for every team in the dataset.
+    as_of:   only use matches before this date.
+    windows: list of start dates or (start, end) pairs; returns {window: stats_df} for
+             all of them from one pass over the matches.
     """
-    stats = {}
+    long = TeamLong(df)
+    win = long.goals_for > long.goals_against
+    draw = long.goals_for == long.goals_against
+    loss = long.goals_for < long.goals_against
 
-    # get all unique teams
-    all_teams = pd.concat([df['home_team'], df['away_team']]).unique()
-    
-    for team in all_teams:
-        
-        # home matches
-        home_games = df[df['home_team'] == team]
-        home_wins = (home_games['result'] == 'home_win').sum()
-        home_draws = (home_games['result'] == 'draw').sum()
-        home_losses = (home_games['result'] == 'away_win').sum()
-        
-        # away matches
-        away_games = df[df['away_team'] == team]
-        away_wins = (away_games['result'] == 'away_win').sum()
-        away_draws = (away_games['result'] == 'draw').sum()
-        away_losses = (away_games['result'] == 'home_win').sum()
-        
-        # aggregate
-        total_games = len(home_games) + len(away_games)
-        total_wins = home_wins + away_wins
-        total_losses = home_losses + away_losses
-        total_draws = home_draws + away_draws
-
-        stats[team] = {
-            'Total Games': total_games,
-            'Wins': total_wins,
-            'Losses': total_losses,
-            'Draws': total_draws,
-            'Home Wins': home_wins,
-            'Home Losses': home_losses,
-            'Away Wins': away_wins,
-            'Away Losses': away_losses
+    results = {}
+    for window, mask in long.window_masks(as_of, windows).items():
+        present = long.present(mask)
+        home, away = mask & long.is_home, mask & ~long.is_home
+        columns = {
+            'Total Games': long.count(mask),
+            'Wins': long.count(mask & win),
+            'Losses': long.count(mask & loss),
+            'Draws': long.count(mask & draw),
+            'Home Wins': long.count(home & win),
+            'Home Losses': long.count(home & loss),
+            'Away Wins': long.count(away & win),
+            'Away Losses': long.count(away & loss),
         }
+        stats_df = pd.DataFrame({k: v[present] for k, v in columns.items()},
+                                index=pd.Index(long.teams[present], name='Team'))
+
+        stats_df['Win %'] = (stats_df['Wins'] / stats_df['Total Games'] * 100).round(2)
+
+        # sort by total games played
+        results[window] = stats_df.sort_values(by='Total Games', ascending=False)
 
-    stats_df = pd.DataFrame.from_dict(stats, orient='index')
-    stats_df.index.name = 'Team'
-    
-    stats_df['Win %'] = (stats_df['Wins'] / stats_df['Total Games'] * 100).round(2)
-    
-    # sort by total games played
-    return stats_df.sort_values(by='Total Games', ascending=False)
+    return results if windows is not None else results[None]
 
 
 def main():
@@ -1,6 +1,14 @@
 import numpy as np
 import pandas as pd
 import os
+import sys
+
+if __name__ == "__main__":
+    # run as a script: make the src packages importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.team_aggregates import TeamLong, grouped_weighted_median
+from util.tournament_weights import tournament_weights
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 RESULTS_FULL_CSV = "data/processed/results_full.csv"
@@ -8,6 +16,7 @@ RESULTS_10Y_CSV = "data/processed/results_last_10yrs.csv"
 RESULTS_5Y_CSV = "data/processed/results_last_5yrs.csv"
 
 ACTIVE_CSV = RESULTS_10Y_CSV
+TEAM_STRENGTH_CSV = "data/derived/team_strengths_weighted_median.csv"
 
 MIN_MATCHES = 20
 SHRINK_K = 25
@@ -83,40 +92,39 @@ def scoreline_distribution(df):
 # ============================================================
 # 5. TEAM GOAL PROFILES
 # ============================================================
-def team_goal_profiles(df):
-    print("\n=== TEAM GOAL PROFILES (GF/GA) ===")  # GF ... Goals for | GA ... Goals Against
-
-    teams = pd.concat([df["home_team"], df["away_team"]]).unique()
-    data = {}
-
-    for team in teams:
-        home = df[df["home_team"] == team]
-        away = df[df["away_team"] == team]
-
-        matches = len(home) + len(away)
-        if matches == 0:
-            continue
+def team_goal_profiles(df, as_of=None, windows=None):
+    """
+    Goals for / against per team. as_of and windows as in basic_stats.generate_stats;
+    with windows, returns {window: profile_df}.
+    """
+    long = TeamLong(df)
+    results = {}
 
-        gf = home["home_score"].sum() + away["away_score"].sum()
-        ga = home["away_score"].sum() + away["home_score"].sum()
+    for window, mask in long.window_masks(as_of, windows).items():
+        present = long.present(mask)
+        matches = long.count(mask)[present]
+        gf = long.count(mask, long.goals_for)[present]
+        ga = long.count(mask, long.goals_against)[present]
 
-        data[team] = {
+        df_gp = pd.DataFrame({
             "matches": matches,
             "goals_for": gf,
             "goals_against": ga,
             "avg_gf": gf / matches,
             "avg_ga": ga / matches,
-        }
+        }, index=long.teams[present], dtype=float)
+
+        print("\n=== TEAM GOAL PROFILES (GF/GA) ===" + ("" if window is None else f" {window}"))  # GF ... Goals for | GA ... Goals Against
 
-    df_gp = pd.DataFrame(data).T
+        print("\nMost scoring teams:")
+        print(df_gp[df_gp["matches"] >= MIN_MATCHES].sort_values("avg_gf", ascending=False).head(15))
 
-    print("\nMost scoring teams:")
-    print(df_gp[df_gp["matches"] >= MIN_MATCHES].sort_values("avg_gf", ascending=False).head(15))
+        print("\nBest defensive teams (lowest GA):")
+        print(df_gp[df_gp["matches"] >= MIN_MATCHES].sort_values("avg_ga").head(15))
 
-    print("\nBest defensive teams (lowest GA):")
-    print(df_gp[df_gp["matches"] >= MIN_MATCHES].sort_values("avg_ga").head(15))
+        results[window] = df_gp
 
-    return df_gp
+    return results if windows is not None else results[None]
 
 
 # ============================================================
@@ -134,7 +142,31 @@ def weighted_median(values, weights):
     return values[np.searchsorted(cumsum, cutoff)]
 
 
-def compute_attack_defense(df):
+class AttackDefenseInputs:
+    """
+    Everything compute_attack_defense needs that does not depend on DECAY_LAMBDA / SHRINK_K:
+    the team-perspective goals, the sort orders for the weighted medians, match ages and
+    tournament weights. Build it once to evaluate many settings cheaply.
+    """
+
+    def __init__(self, df):
+        dates = pd.to_datetime(df["date"])
+        days_ago = (dates.max() - dates).dt.days.to_numpy()
+        self.long = TeamLong(df)
+        self.days_ago = np.concatenate([days_ago, days_ago])
+        self.tournament_weight = np.tile(tournament_weights(df["tournament"]), 2)
+
+        self.matches = self.long.count(np.ones(len(self.long.codes), dtype=bool))
+        self.keep = np.flatnonzero(self.matches >= MIN_MATCHES)
+        self.gf_order = np.lexsort((self.long.goals_for, self.long.codes))
+        self.ga_order = np.lexsort((self.long.goals_against, self.long.codes))
+
+    def weights(self, decay_lambda=DECAY_LAMBDA):
+        # Recency + tournament weight
+        return np.exp(-decay_lambda * self.days_ago) * self.tournament_weight
+
+
+def compute_attack_defense(df, decay_lambda=DECAY_LAMBDA, shrink_k=SHRINK_K):
     """
     Compute attack and defense strengths for teams using weighted medians.
 
@@ -144,87 +176,37 @@ def compute_attack_defense(df):
     Values are log-transformed and normalized to [0,1]. Teams with fewer than MIN_MATCHES are skipped.
 
     Parameters:
-        df (pd.DataFrame): Match results with 'home_team', 'away_team',
+        df (pd.DataFrame or AttackDefenseInputs): Match results with 'home_team', 'away_team',
                            'home_score', 'away_score', 'date', 'tournament'.
+        decay_lambda, shrink_k: recency decay and shrinkage strength.
 
     Returns:
         pd.DataFrame: Team strengths including matches, weighted medians, raw and normalized attack/defense.
     """
-
-    df = df.copy()
-    df["date"] = pd.to_datetime(df["date"])
-    current_date = df["date"].max()
-
-    # Tournament importance
-    major = [
-        "fifa world cup", "fifa world cup qualification",
-        "uefa euro", "uefa euro qualification",
-        "copa américa", "copa américa qualification",
-        "african cup of nations", "african cup of nations qualification",
-        "afc asian cup", "afc asian cup qualification",
-        "gold cup", "gold cup qualification",
-        "uefa nations league", "concacaf nations league"
-    ]
-    friendlies = ["friendly", "kirin challenge cup", "three nations cup", "tri nation tournament", "tri-nations series", "island games", "fifa series"]
-    minor_regional = ["baltic cup", "saff cup", "aff championship", "aff championship qualification",
-                      "conifa world football cup qualification", "conifa asia cup",
-                      "conifa south america football cup", "conifa africa football cup"]
-
-    def get_tournament_weight(name):
-        t = str(name).lower()
-        if t in major:
-            if "world cup" in t: return 1.5
-            if "euro" in t or "copa américa" in t or "african cup" in t or "afc asian cup" in t or "gold cup" in t: return 1.3
-            return 1.2
-        elif t in friendlies:
-            return 1.0
-        elif t in minor_regional:
-            return 0.9
-        return 1.0
-
-    # Recency + tournament weight
-    df["days_ago"] = (current_date - df["date"]).dt.days
-    df["weight"] = np.exp(-DECAY_LAMBDA * df["days_ago"]) * df["tournament"].apply(get_tournament_weight)
-
-    teams = pd.concat([df["home_team"], df["away_team"]]).unique()
-    strengths = []
-
-    all_gf = np.concatenate([df["home_score"], df["away_score"]])
-    all_ga = np.concatenate([df["away_score"], df["home_score"]])
-    all_weights = np.concatenate([df["weight"], df["weight"]])
-    global_median_gf = weighted_median(all_gf, all_weights)
-    global_median_ga = weighted_median(all_ga, all_weights)
-
-    for team in teams:
-        home = df[df["home_team"] == team]
-        away = df[df["away_team"] == team]
-        matches = len(home) + len(away)
-        if matches < MIN_MATCHES:
-            continue
-
-        gf_values = np.concatenate([home["home_score"], away["away_score"]])
-        gf_weights = np.concatenate([home["weight"], away["weight"]])
-        gf_median = weighted_median(gf_values, gf_weights)
-        gf_shrink = (gf_median * matches + SHRINK_K * global_median_gf) / (matches + SHRINK_K)
-
-        ga_values = np.concatenate([home["away_score"], away["home_score"]])
-        ga_weights = np.concatenate([home["weight"], away["weight"]])
-        ga_median = weighted_median(ga_values, ga_weights)
-        ga_shrink = (ga_median * matches + SHRINK_K * global_median_ga) / (matches + SHRINK_K)
-
-        attack_raw = gf_shrink / global_median_gf
-        defense_raw = global_median_ga / ga_shrink
-
-        strengths.append({
-            "team": team,
-            "matches": matches,
-            "median_gf_weighted": round(gf_shrink, 3),
-            "median_ga_weighted": round(ga_shrink, 3),
-            "attack_strength_raw": round(attack_raw, 3),
-            "defense_strength_raw": round(defense_raw, 3)
-        })
-
-    df_strengths = pd.DataFrame(strengths)
+    inputs = df if isinstance(df, AttackDefenseInputs) else AttackDefenseInputs(df)
+    long, keep = inputs.long, inputs.keep
+    weight = inputs.weights(decay_lambda)
+
+    global_median_gf = weighted_median(long.goals_for, weight)
+    global_median_ga = weighted_median(long.goals_against, weight)
+
+    matches = inputs.matches[keep]
+    gf_median = grouped_weighted_median(long.codes, long.goals_for, weight, long.n_teams, inputs.gf_order)[keep]
+    ga_median = grouped_weighted_median(long.codes, long.goals_against, weight, long.n_teams, inputs.ga_order)[keep]
+    gf_shrink = (gf_median * matches + shrink_k * global_median_gf) / (matches + shrink_k)
+    ga_shrink = (ga_median * matches + shrink_k * global_median_ga) / (matches + shrink_k)
+
+    attack_raw = gf_shrink / global_median_gf
+    defense_raw = global_median_ga / ga_shrink
+
+    df_strengths = pd.DataFrame({
+        "team": long.teams[keep],
+        "matches": matches,
+        "median_gf_weighted": np.round(gf_shrink, 3),
+        "median_ga_weighted": np.round(ga_shrink, 3),
+        "attack_strength_raw": np.round(attack_raw, 3),
+        "defense_strength_raw": np.round(defense_raw, 3)
+    })
     df_strengths["attack_strength"] = np.log1p(df_strengths["attack_strength_raw"])
     df_strengths["attack_strength"] = (df_strengths["attack_strength"] - df_strengths["attack_strength"].min()) / \
                                       (df_strengths["attack_strength"].max() - df_strengths["attack_strength"].min())
@@ -236,6 +218,20 @@ def compute_attack_defense(df):
     return df_strengths
 
 
+def attack_defense_grid(df, decay_lambdas=(DECAY_LAMBDA,), shrink_ks=(SHRINK_K,)):
+    """compute_attack_defense for every (decay_lambda, shrink_k) pair, sharing the sorted inputs."""
+    inputs = AttackDefenseInputs(df)
+    return {
+        (decay_lambda, shrink_k): compute_attack_defense(inputs, decay_lambda, shrink_k)
+        for decay_lambda in decay_lambdas for shrink_k in shrink_ks
+    }
+
+
+def save_team_strengths(df_strengths, path=TEAM_STRENGTH_CSV):
+    """Writes the table the attack/defense notebooks read as priors."""
+    df_strengths.to_csv(os.path.join(BASE_DIR, path), index=False)
+
+
 # ============================================================
 # MAIN
 # ============================================================
@@ -0,0 +1,141 @@
+import time
+import numpy as np
+import pandas as pd
+import torch
+import pyro
+from pyro.infer import SVI, Trace_ELBO
+from pyro.infer.autoguide import AutoLaplaceApproximation, AutoNormal, init_to_value
+from pyro.optim import ClippedAdam
+
+from models.fit import NUM_SAMPLES, Fit, _model
+from util import instrumentation
+
+# fast approximate inference for the full match history, where NUTS takes too long:
+#   fit_svi:     stochastic variational inference, mean-field normal guide, likelihood on
+#                random minibatches of matches (subsample_size in the pyro models). cheapest
+#                per step, but mean-field ignores the correlation of alpha with the team
+#                parameters, so posterior spreads come out too narrow.
+#   fit_laplace: MAP estimate plus a gaussian at the mode (inverse hessian of the full-data
+#                negative log posterior), i.e. correlated posterior draws at the cost of one
+#                hessian. close to NUTS for these (nearly gaussian) posteriors.
+# both return a models.fit.Fit whose samples look like mcmc.get_samples(), so
+# Fit.skill_provider and the simulations work unchanged.
+
+NUM_STEPS = 2000
+SUBSAMPLE_SIZE = 2048
+LEARNING_RATE = 0.02
+
+# the MAP optimum is deterministic (full data), so fewer and larger steps suffice
+MAP_STEPS = 500
+MAP_LEARNING_RATE = 0.05
+
+
+def _train(model_fn, guide, data, num_steps, lr, subsample_size):
+    # learning rate decays to a tenth over the run, which settles the minibatch noise
+    svi = SVI(model_fn, guide, ClippedAdam({"lr": lr, "lrd": 0.1 ** (1 / num_steps)}), Trace_ELBO())
+    # a subsample as large as the data is the full data, without the index gathers
+    subsample_size = None if subsample_size is None or subsample_size >= data.n_matches else subsample_size
+    losses = np.empty(num_steps)
+    with instrumentation.span("train"):
+        for step in range(num_steps):
+            losses[step] = svi.step(data, subsample_size)
+    instrumentation.count("svi/steps", num_steps)
+    return losses
+
+
+@torch.no_grad()
+def _draws(guide, data, num_samples):
+    """{site: tensor (num_samples, ...)} from repeated guide calls, like mcmc.get_samples()."""
+    with instrumentation.span("draws"):
+        draws = [guide(data) for _ in range(num_samples)]
+    return {site: torch.stack([d[site] for d in draws]) for site in draws[0]}
+
+
+def _init_options(warm_start):
+    return {} if warm_start is None else {"init_loc_fn": init_to_value(values=warm_start["init_values"])}
+
+
+def fit_svi(model, data, num_steps=NUM_STEPS, subsample_size=SUBSAMPLE_SIZE, lr=LEARNING_RATE,
+            num_samples=NUM_SAMPLES, seed=0, verbose=True, warm_start=None):
+    """
+    Fits a model (name in MODELS or a model function) to a MatchData with SVI and an
+    AutoNormal guide; each step sees subsample_size random matches (None: all of them).
+    Returns a Fit with num_samples guide draws; fit.info["losses"] holds the ELBO trace.
+    warm_start: optional dict with the guide's init_values {site: tensor} and optionally
+                its scales, see models.warm_start.
+    """
+    name, model_fn = _model(model)
+    pyro.set_rng_seed(seed)
+    pyro.clear_param_store()
+    guide = AutoNormal(model_fn, init_scale=0.05, **_init_options(warm_start))
+    if warm_start is not None and "scales" in warm_start:
+        guide(data)  # creates the guide parameters
+        for site, scale in warm_start["scales"].items():
+            setattr(guide.scales, site, scale)
+
+    start = time.perf_counter()
+    with instrumentation.span("fit_svi"):
+        losses = _train(model_fn, guide, data, num_steps, lr, subsample_size)
+        samples = _draws(guide, data, num_samples)
+    fit_time = time.perf_counter() - start
+
+    if verbose:
+        print(f"{name}: SVI {num_steps} steps (subsample {subsample_size}) on {data.n_matches} matches "
+              f"in {fit_time:.1f}s")
+    info = {"method": "svi", "losses": losses, "subsample_size": subsample_size}
+    fit = Fit(name, samples, data.team_to_idx, fit_time, info)
+    fit.guide = guide
+    return fit
+
+
+def fit_laplace(model, data, num_steps=MAP_STEPS, subsample_size=None, lr=MAP_LEARNING_RATE,
+                num_samples=NUM_SAMPLES, seed=0, verbose=True, warm_start=None):
+    """
+    MAP estimate by SVI with a delta guide (subsample_size as in fit_svi, by default the full
+    data), then the Laplace approximation around it on the full data. Returns a Fit with
+    num_samples draws from the resulting multivariate normal.
+    warm_start: optional dict with init_values {site: tensor} to start the MAP search from.
+    """
+    name, model_fn = _model(model)
+    pyro.set_rng_seed(seed)
+    pyro.clear_param_store()
+    guide = AutoLaplaceApproximation(model_fn, **_init_options(warm_start))
+
+    start = time.perf_counter()
+    with instrumentation.span("fit_laplace"):
+        losses = _train(model_fn, guide, data, num_steps, lr, subsample_size)
+        with instrumentation.span("hessian"):
+            laplace = guide.laplace_approximation(data)
+        samples = _draws(laplace, data, num_samples)
+    fit_time = time.perf_counter() - start
+
+    if verbose:
+        print(f"{name}: MAP {num_steps} steps + Laplace on {data.n_matches} matches in {fit_time:.1f}s")
+    info = {"method": "laplace", "losses": losses, "subsample_size": subsample_size}
+    fit = Fit(name, samples, data.team_to_idx, fit_time, info)
+    fit.guide = laplace
+    return fit
+
+
+def compare_fits(fit, reference):
+    """
+    Per-site agreement of an approximate fit with a reference (e.g. NUTS) fit on the same
+    teams: mean absolute difference and correlation of the posterior means, and the median
+    ratio of posterior standard deviations (below 1: the approximation is overconfident).
+    Team vectors are centred first: a common shift of attack and defense cancels in the
+    likelihood, so only their differences between teams are identified.
+    """
+    a, b = fit.numpy_samples(), reference.numpy_samples()
+    rows = []
+    for site in b:
+        mean_a, mean_b = a[site].mean(axis=0).ravel(), b[site].mean(axis=0).ravel()
+        if mean_a.size > 1:
+            mean_a, mean_b = mean_a - mean_a.mean(), mean_b - mean_b.mean()
+        sd_a, sd_b = a[site].std(axis=0).ravel(), b[site].std(axis=0).ravel()
+        rows.append({
+            "site": site,
+            "mean_abs_diff": np.abs(mean_a - mean_b).mean(),
+            "mean_corr": np.corrcoef(mean_a, mean_b)[0, 1] if mean_a.size > 1 else np.nan,
+            "sd_ratio": np.median(sd_a / sd_b),
+        })
+    return pd.DataFrame(rows)
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import torch
+
+from models.data import DEFAULT_LAMBDA_DECAY, MatchData
+from models.fit import NUM_SAMPLES, Fit, fit_nuts
+from simulation.skill_provider import SkillProvider
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+CACHE_DIR = "data/cache/posteriors"
+MAX_BYTES = 1 << 30
+
+# content-addressed cache of fitted posteriors and the skill tables derived from them, so
+# a notebook only runs MCMC when the data or the settings changed.
+# a key is the hash of the processed data file's bytes, the model name and the settings;
+# every entry is one compressed .npz (arrays plus a json "meta" record) named by its key.
+# the file modification time doubles as the last access time: hits touch it, and when the
+# cache grows past max_bytes the least recently used entries are deleted.
+
+_file_hashes = {}
+
+
+def file_hash(path):
+    """sha256 of a file's bytes; remembered per (path, size, mtime) within the process."""
+    stat = os.stat(path)
+    memo = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+    if memo not in _file_hashes:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _file_hashes[memo] = h.hexdigest()
+    return _file_hashes[memo]
+
+
+def _json_default(value):
+    # functions (e.g. the fit function) by name, numpy scalars and the rest by str
+    return getattr(value, "__name__", None) or str(value)
+
+
+def cache_key(data_path, model_name, **settings):
+    """Key of a result computed from data_path with the given model and (json-able) settings."""
+    record = json.dumps({"data": file_hash(data_path), "model": model_name, **settings},
+                        sort_keys=True, default=_json_default)
+    return hashlib.sha256(record.encode()).hexdigest()[:32]
+
+
+class PosteriorCache:
+    """Entries of named numpy arrays plus a json-able meta dict, LRU-evicted by total size."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.cache_dir = os.path.join(BASE_DIR, cache_dir)
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def meta(self, key):
+        """The meta dict of an entry without loading its arrays, or None."""
+        try:
+            with np.load(self._path(key)) as f:
+                return json.loads(f["meta"].item())
+        except FileNotFoundError:
+            return None
+
+    def get(self, key):
+        """(arrays, meta) of an entry, or None. Marks the entry as recently used."""
+        path = self._path(key)
+        try:
+            with np.load(path) as f:
+                meta = json.loads(f["meta"].item())
+                arrays = {name: f[name] for name in f.files if name != "meta"}
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return arrays, meta
+
+    def put(self, key, arrays, meta=None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # written under a temporary name and renamed, so readers never see half an entry
+        tmp = os.path.join(self.cache_dir, f".{key}.{os.getpid()}.npz")
+        np.savez_compressed(tmp, meta=np.array(json.dumps(meta or {}, default=str)), **arrays)
+        os.replace(tmp, self._path(key))
+        self.evict(keep=key)
+
+    def entries(self):
+        """Dataframe of the entries (key, bytes, last_used), most recently used first."""
+        rows = []
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".npz") and not name.startswith("."):
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                    rows.append({"key": name[:-4], "bytes": stat.st_size,
+                                 "last_used": pd.Timestamp(stat.st_mtime, unit="s")})
+        df = pd.DataFrame(rows, columns=["key", "bytes", "last_used"])
+        return df.sort_values("last_used", ascending=False, ignore_index=True)
+
+    def evict(self, keep=None):
+        """Deletes least recently used entries until the cache fits max_bytes."""
+        entries = self.entries()
+        over = entries["bytes"].cumsum() > self.max_bytes
+        for key in entries.loc[over, "key"]:
+            if key != keep:
+                self.invalidate(key)
+
+    def invalidate(self, key=None, model_name=None):
+        """
+        Deletes one entry, every entry of a model, or (no arguments) the whole cache.
+        Returns the number of entries removed.
+        """
+        removed = 0
+        for k in ([key] if key is not None else self.entries()["key"]):
+            if model_name is not None and (self.meta(k) or {}).get("model_name") != model_name:
+                continue
+            try:
+                os.remove(self._path(k))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def cached_fit(model, data_path, lambda_decay=DEFAULT_LAMBDA_DECAY, num_samples=NUM_SAMPLES, seed=0,
+               fit=fit_nuts, cache=None, **fit_kwargs):
+    """
+    Posterior of model (a name in MODELS) fitted on the processed results csv at data_path,
+    from the cache if the same data and settings were fitted before, otherwise fitted with
+    fit (fit_nuts, fit_chains, fit_svi, ...) and stored. fit_kwargs are part of the key.
+    Returns a Fit; fit.cache_key is its key.
+    """
+    cache = PosteriorCache() if cache is None else cache
+    key = _posterior_key(model, data_path, lambda_decay, num_samples, seed, fit, fit_kwargs)
+    hit = cache.get(key)
+    if hit is not None:
+        arrays, meta = hit
+        team_to_idx = {team: i for i, team in enumerate(meta["teams"])}
+        result = Fit(meta["model_name"], {site: torch.from_numpy(v) for site, v in arrays.items()},
+                     team_to_idx, meta["fit_time"], meta["info"])
+    else:
+        data = MatchData.from_dataframe(pd.read_csv(data_path), lambda_decay=lambda_decay)
+        result = fit(model, data, num_samples=num_samples, seed=seed, **fit_kwargs)
+        # keep the json-able run info (e.g. chain seeds), not tensors or loss traces
+        info = {k: v for k, v in result.info.items() if isinstance(v, (int, float, str, list))}
+        meta = {"model_name": result.model_name, "teams": sorted(result.team_to_idx, key=result.team_to_idx.get),
+                "fit_time": result.fit_time, "info": info}
+        cache.put(key, result.numpy_samples(), meta)
+    result.cache_key = key
+    return result
+
+
+# fit arguments that only change what is printed
+_DISPLAY_KWARGS = ("progress", "verbose")
+
+
+def _posterior_key(model, data_path, lambda_decay, num_samples, seed, fit, fit_kwargs):
+    settings = {k: v for k, v in fit_kwargs.items() if k not in _DISPLAY_KWARGS}
+    return cache_key(data_path, model, kind="posterior", fit=fit, lambda_decay=lambda_decay,
+                     num_samples=num_samples, seed=seed, **settings)
+
+
+def cached_skill_provider(model, data_path, shrinkage=0.0, attack_prior=None, defense_prior=None,
+                          lambda_decay=DEFAULT_LAMBDA_DECAY, num_samples=NUM_SAMPLES, seed=0, fit=fit_nuts,
+                          cache=None, **fit_kwargs):
+    """
+    SkillProvider of the World Cup teams from cached_fit(...) with the given shrinkage
+    toward the prior dicts. The skill table is cached as well (keyed by the posterior's key,
+    shrinkage and priors), so a hit neither fits nor loads the posterior.
+    """
+    cache = PosteriorCache() if cache is None else cache
+    posterior_key = _posterior_key(model, data_path, lambda_decay, num_samples, seed, fit, fit_kwargs)
+    key = cache_key(data_path, model, kind="skills", posterior=posterior_key, shrinkage=shrinkage,
+                    attack_prior=attack_prior, defense_prior=defense_prior)
+    hit = cache.get(key)
+    if hit is not None:
+        arrays, meta = hit
+        return SkillProvider(arrays["skills"], meta["teams"])
+    posterior = cached_fit(model, data_path, lambda_decay, num_samples, seed, fit, cache, **fit_kwargs)
+    provider = posterior.skill_provider(attack_prior, defense_prior, shrinkage)
+    cache.put(key, {"skills": provider.skills}, {"model_name": model, "teams": provider.teams})
+    return provider
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import torch
+
+# model inputs built once per dataset: index / goal tensors in float32 plus every
+# data-dependent constant the likelihoods need (decay weights, dixon-coles masks), so the
+# model functions only do tensor arithmetic on the latent variables.
+
+DEFAULT_LAMBDA_DECAY = 0.001
+
+# dixon-coles robust adjustment (dc_robust_adjust in the notebook)
+DC_GAMMA_LOW = 0.1
+DC_GAMMA_HIGH = 0.2
+DC_THRESHOLD_HIGH = 5
+
+
+class MatchData:
+    """
+    Tensors for the pyro models, one entry per match.
+    team_to_idx maps team name -> index into the attack / defense / skill vectors.
+    """
+
+    def __init__(self, home_idx, away_idx, home_goals, away_goals, neutral, days_ago, team_to_idx,
+                 lambda_decay=DEFAULT_LAMBDA_DECAY, gamma_low=DC_GAMMA_LOW, gamma_high=DC_GAMMA_HIGH,
+                 threshold_high=DC_THRESHOLD_HIGH):
+        self.team_to_idx = dict(team_to_idx)
+        self.n_teams = len(self.team_to_idx)
+        self.n_matches = len(home_idx)
+        self.lambda_decay = lambda_decay
+        self.gamma_low = gamma_low
+
+        home_goals = np.asarray(home_goals, dtype=np.float32)
+        away_goals = np.asarray(away_goals, dtype=np.float32)
+        self.home_idx = torch.as_tensor(np.asarray(home_idx, dtype=np.int64))
+        self.away_idx = torch.as_tensor(np.asarray(away_idx, dtype=np.int64))
+        self.home_goals = torch.from_numpy(home_goals)
+        self.away_goals = torch.from_numpy(away_goals)
+        self.home_adv_indicator = torch.from_numpy((~np.asarray(neutral, dtype=bool)).astype(np.float32))
+
+        # elo: home win 1, draw 0.5, away win 0
+        self.outcome = torch.from_numpy((np.sign(home_goals - away_goals) + 1) / 2)
+
+        # time decay
+        self.days_ago = np.asarray(days_ago, dtype=np.float32)
+        self.weights = torch.from_numpy(np.exp(-lambda_decay * self.days_ago).astype(np.float32))
+
+        # dixon-coles: low-score mask and the high-score factor are fixed by the data
+        total = home_goals + away_goals
+        self.dc_low_mask = torch.from_numpy((home_goals <= 2) & (away_goals <= 2))
+        high = np.where(total > threshold_high, np.exp(-gamma_high * (total - threshold_high)), 1.0)
+        self.dc_high_factor = torch.from_numpy(high.astype(np.float32))
+
+    # per-match tensors, indexed together by batch()
+    MATCH_TENSORS = ("home_idx", "away_idx", "home_goals", "away_goals", "home_adv_indicator",
+                     "outcome", "weights", "dc_low_mask", "dc_high_factor")
+
+    def batch(self, idx):
+        """The per-match tensors at idx (e.g. a minibatch), plus the scalar settings."""
+        batch = MatchBatch()
+        for name in self.MATCH_TENSORS:
+            setattr(batch, name, getattr(self, name)[idx])
+        batch.gamma_low = self.gamma_low
+        return batch
+
+    @property
+    def teams(self):
+        return sorted(self.team_to_idx, key=self.team_to_idx.get)
+
+    @classmethod
+    def from_dataframe(cls, df, team_to_idx=None, reference_date=None, **kwargs):
+        """
+        From a processed results dataframe. Teams are indexed in order of first appearance
+        (as in the notebooks) unless team_to_idx is given; days_ago counts from
+        reference_date, by default the last match date.
+        """
+        if team_to_idx is None:
+            teams = pd.unique(df[["home_team", "away_team"]].values.ravel())
+            team_to_idx = {team: i for i, team in enumerate(teams)}
+        dates = pd.to_datetime(df["date"])
+        reference_date = dates.max() if reference_date is None else pd.Timestamp(reference_date)
+        return cls(
+            df["home_team"].map(team_to_idx).to_numpy(),
+            df["away_team"].map(team_to_idx).to_numpy(),
+            df["home_score"].to_numpy(),
+            df["away_score"].to_numpy(),
+            df["neutral"].to_numpy(),
+            (reference_date - dates).dt.days.to_numpy(),
+            team_to_idx,
+            **kwargs,
+        )
+
+    @classmethod
+    def from_match_store(cls, store, reference_date=None, **kwargs):
+        """From a util.match_store.MatchStore; uses the store's global team codes."""
+        days = np.asarray(store.days)
+        reference = days.max() if reference_date is None else \
+            (np.datetime64(pd.Timestamp(reference_date).date(), "D") - np.datetime64("1970-01-01", "D")).astype(int)
+        return cls(store.home, store.away, store.home_score, store.away_score, store.neutral,
+                   reference - days, store.team_to_idx, **kwargs)
+
+
+class MatchBatch:
+    """A subset of MatchData's per-match tensors, see MatchData.batch."""
@@ -0,0 +1,183 @@
+import json
+import math
+import os
+import numpy as np
+import pandas as pd
+
+from simulation.skill_provider import SkillProvider
+from simulation.world_cup_simulation import WC_TEAMS
+from util.match_store import EPOCH, load_match_store
+from util.tournament_weights import tournament_weights
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+ELO_STATE = "data/processed/elo_state.npz"
+
+# classic sequential elo over the match store (util/match_store.py), in date order.
+# ratings live in one array indexed by the store's team codes, which are append-only, so a
+# checkpoint stays valid when preprocessing appends matches: the engine remembers how many
+# store rows it has seen and only plays the new ones.
+#
+# per match: expected home score e = 1 / (1 + 10^(-(r_home + home_advantage - r_away) / 400))
+# (no home advantage on neutral ground), result s = 1 / 0.5 / 0, and both teams move by
+# k * (s - e). k is K_FACTOR times the tournament importance weight (util/tournament_weights.py).
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 30.0
+HOME_ADVANTAGE = 100.0
+ELO_SCALE = 400.0
+
+
+def elo_to_skill(ratings):
+    """
+    Elo ratings on the skill scale of the simulation: match_probabilities uses a logistic
+    in the skill difference, which matches the elo expectation for this scaling.
+    """
+    return (np.asarray(ratings, dtype=np.float64) - INITIAL_RATING) * math.log(10) / ELO_SCALE
+
+
+class EloEngine:
+    """
+    Elo ratings of every store team, updated match by match.
+    k_by_tournament: optional {tournament name: k} overriding K_FACTOR * tournament weight.
+    """
+
+    def __init__(self, k_factor=K_FACTOR, home_advantage=HOME_ADVANTAGE, initial_rating=INITIAL_RATING,
+                 k_by_tournament=None):
+        self.k_factor = k_factor
+        self.home_advantage = home_advantage
+        self.initial_rating = initial_rating
+        self.k_by_tournament = dict(k_by_tournament or {})
+        self.reset()
+
+    def reset(self):
+        self.teams = []
+        self.ratings = np.zeros(0)
+        self.played = np.zeros(0, dtype=np.int32)
+        self.n_processed = 0
+        self.last_match = None
+
+    @property
+    def team_to_idx(self):
+        return {team: i for i, team in enumerate(self.teams)}
+
+    def _settings(self):
+        return {"k_factor": self.k_factor, "home_advantage": self.home_advantage,
+                "initial_rating": self.initial_rating, "k_by_tournament": self.k_by_tournament}
+
+    def _k_per_tournament(self, tournaments):
+        k = self.k_factor * tournament_weights(tournaments)
+        for i, name in enumerate(tournaments):
+            k[i] = self.k_by_tournament.get(name, k[i])
+        return k
+
+    @staticmethod
+    def _row(store, i):
+        return [int(store.columns[name][i]) for name in ("days", "home", "away", "home_score", "away_score")]
+
+    def update(self, store=None, until=None):
+        """
+        Plays the store's matches after the ones already seen, up to (excluding) date until.
+        If the store no longer starts with the matches of the checkpoint (e.g. preprocessing
+        rebuilt it), the ratings are recomputed from scratch. Returns the number of matches played.
+        """
+        store = load_match_store() if store is None else store
+        if self.n_processed and (len(store) < self.n_processed
+                                 or self._row(store, self.n_processed - 1) != self.last_match):
+            self.reset()
+
+        end = len(store) if until is None else int(np.searchsorted(
+            store.days, (np.datetime64(pd.Timestamp(until).date(), "D") - EPOCH).astype(np.int64), side="left"))
+        start = self.n_processed
+        if end <= start:
+            return 0
+
+        # new teams join at the initial rating
+        n_new = store.n_teams - len(self.teams)
+        self.teams = list(store.teams)
+        self.ratings = np.concatenate([self.ratings, np.full(n_new, self.initial_rating)])
+        self.played = np.concatenate([self.played, np.zeros(n_new, dtype=np.int32)])
+
+        rows = slice(start, end)
+        home, away = store.home[rows].tolist(), store.away[rows].tolist()
+        hs, as_ = store.home_score[rows].astype(np.int64), store.away_score[rows].astype(np.int64)
+        result = ((np.sign(hs - as_) + 1) / 2).tolist()
+        k = self._k_per_tournament(store.tournaments)[store.tournament[rows]].tolist()
+        bonus = (self.home_advantage * ~np.asarray(store.neutral[rows])).tolist()
+
+        # sequential by nature; plain python floats are much faster than numpy scalars here
+        ratings = self.ratings.tolist()
+        scale = ELO_SCALE
+        for h, a, s, kk, b in zip(home, away, result, k, bonus):
+            e = 1.0 / (1.0 + 10.0 ** ((ratings[a] - ratings[h] - b) / scale))
+            delta = kk * (s - e)
+            ratings[h] += delta
+            ratings[a] -= delta
+
+        self.ratings = np.array(ratings)
+        self.played += np.bincount(np.concatenate([home, away]), minlength=len(self.teams)).astype(np.int32)
+        self.n_processed = end
+        self.last_match = self._row(store, end - 1)
+        return end - start
+
+    def table(self):
+        """Rating and number of matches per team that has played, best first."""
+        df = pd.DataFrame({"team": self.teams, "rating": self.ratings, "played": self.played})
+        return df[df["played"] > 0].sort_values("rating", ascending=False, ignore_index=True)
+
+    def skill_provider(self, teams=WC_TEAMS):
+        """Current ratings as a (single-draw) SkillProvider for simulate_world_cup and the batched engine."""
+        return SkillProvider.from_samples(elo_to_skill(self.ratings)[None], self.team_to_idx, teams)
+
+    def save(self, path=ELO_STATE):
+        meta = {"settings": self._settings(), "teams": self.teams, "n_processed": self.n_processed,
+                "last_match": self.last_match}
+        np.savez(os.path.join(BASE_DIR, path), meta=np.array(json.dumps(meta, ensure_ascii=False)),
+                 ratings=self.ratings, played=self.played)
+
+    @classmethod
+    def load(cls, path=ELO_STATE):
+        with np.load(os.path.join(BASE_DIR, path)) as f:
+            meta = json.loads(f["meta"].item())
+            engine = cls(**meta["settings"])
+            engine.ratings, engine.played = f["ratings"], f["played"]
+        engine.teams = meta["teams"]
+        engine.n_processed = meta["n_processed"]
+        engine.last_match = meta["last_match"]
+        return engine
+
+
+def update_ratings(path=ELO_STATE, store=None, **settings):
+    """
+    Loads the checkpoint at path (a fresh engine with settings if there is none, or if its
+    settings differ), plays the new matches of the store and saves the checkpoint again.
+    """
+    engine = EloEngine(**settings)
+    if os.path.exists(os.path.join(BASE_DIR, path)):
+        saved = EloEngine.load(path)
+        if saved._settings() == engine._settings():
+            engine = saved
+    engine.update(store)
+    engine.save(path)
+    return engine
+
+
+def rating_snapshots(dates, store=None, **settings):
+    """
+    Ratings before each of the given dates, in one pass over the store.
+    Returns a date x team dataframe (teams that have not played yet are at the initial rating).
+    """
+    store = load_match_store() if store is None else store
+    engine = EloEngine(**settings)
+    dates = sorted(pd.to_datetime(pd.Series(dates)))
+    rows = []
+    for date in dates:
+        engine.update(store, until=date)
+        rows.append(np.concatenate([engine.ratings, np.full(store.n_teams - len(engine.ratings), engine.initial_rating)]))
+    return pd.DataFrame(np.array(rows), index=pd.DatetimeIndex(dates), columns=store.teams)
+
+
+def snapshot_skill_provider(snapshots, date, teams=WC_TEAMS):
+    """SkillProvider from the rating_snapshots row of date."""
+    row = snapshots.loc[pd.Timestamp(date)]
+    return SkillProvider.from_samples(elo_to_skill(row.to_numpy())[None],
+                                      {team: i for i, team in enumerate(row.index)}, teams)
@@ -0,0 +1,238 @@
+import math
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import torch
+import pyro
+from pyro.infer import MCMC, NUTS
+from pyro.infer.autoguide import init_to_value
+from pyro.ops.stats import effective_sample_size, split_gelman_rubin
+
+from models.pyro_models import MODELS
+from simulation.skill_provider import SkillProvider
+from util import instrumentation
+
+# notebook defaults
+NUM_SAMPLES = 800
+WARMUP_STEPS = 300
+
+
+class Fit:
+    """
+    Result of a model fit.
+    samples:     posterior draws as from mcmc.get_samples(), {site: tensor (n_draws, ...)}
+    team_to_idx: team name -> index into the attack / defense / team_skill dimension
+    fit_time:    wall-clock seconds of inference
+    """
+
+    def __init__(self, model_name, samples, team_to_idx, fit_time, info=None):
+        self.model_name = model_name
+        self.samples = samples
+        self.team_to_idx = team_to_idx
+        self.fit_time = fit_time
+        self.info = info or {}
+
+    def get_samples(self, group_by_chain=False):
+        if group_by_chain:
+            n_chains = self.info.get("num_chains", 1)
+            return {site: v.reshape((n_chains, -1) + v.shape[1:]) for site, v in self.samples.items()}
+        return self.samples
+
+    def numpy_samples(self):
+        return {site: value.detach().cpu().numpy() for site, value in self.samples.items()}
+
+    def skill_provider(self, attack_prior=None, defense_prior=None, shrinkage=0.0):
+        """
+        SkillProvider over the World Cup teams: team_skill for the elo model, otherwise
+        attack / defense shrunk toward the priors as in the notebooks.
+        """
+        samples = self.numpy_samples()
+        if "team_skill" in samples:
+            return SkillProvider.from_samples(samples["team_skill"], self.team_to_idx)
+        return SkillProvider.from_posterior(samples["attack"], samples["defense"], self.team_to_idx,
+                                            attack_prior, defense_prior, shrinkage)
+
+
+def _model(model):
+    return (model, MODELS[model]) if isinstance(model, str) else (model.__name__, model)
+
+
+class _WarmNUTS(NUTS):
+    """NUTS that starts adaptation from a given step size and inverse mass matrix."""
+
+    def __init__(self, model, step_size, inverse_mass_matrix, **kwargs):
+        super().__init__(model, **kwargs)
+        self._warm_step_size = step_size
+        self._warm_inverse_mass_matrix = inverse_mass_matrix
+
+    def _initialize_adapter(self):
+        super()._initialize_adapter()
+        adapter = self._adapter
+        if self._warm_inverse_mass_matrix is not None:
+            adapter.mass_matrix_adapter.inverse_mass_matrix = self._warm_inverse_mass_matrix
+        if self._warm_step_size is not None:
+            # same reset as reset_step_size_adaptation, centred on the known step size
+            adapter.step_size = self._warm_step_size
+            adapter._step_size_adapt_scheme.prox_center = math.log(10 * self._warm_step_size)
+            adapter._step_size_adapt_scheme.reset()
+
+
+def _kernel(model_fn, jit_compile, warm_start):
+    options = {"jit_compile": jit_compile, "ignore_jit_warnings": True}
+    if warm_start is None:
+        return NUTS(model_fn, **options)
+    return _WarmNUTS(model_fn, warm_start.get("step_size"), warm_start.get("inverse_mass_matrix"),
+                     init_strategy=init_to_value(values=warm_start["init_values"]),
+                     adapt_mass_matrix=warm_start.get("adapt_mass_matrix", True), **options)
+
+
+class _NutsStats:
+    """
+    MCMC hook_fn for instrumented runs: time of the kernel setup (initial trace, jit) and of
+    the warmup and sampling iterations, NUTS tree depth (number of doublings) per iteration.
+    """
+
+    def __init__(self, kernel):
+        self.depth = 0
+        self.last = time.perf_counter()
+        setup, build_tree = kernel.setup, kernel._build_tree
+
+        def timed_setup(*args, **kwargs):
+            result = setup(*args, **kwargs)
+            now = time.perf_counter()
+            instrumentation.add_time("setup", now - self.last)
+            self.last = now
+            return result
+
+        def tracked_build_tree(z, r, z_grads, log_slice, direction, tree_depth, energy_current):
+            # the recursion passes the remaining depth, so the outermost call has the largest
+            self.depth = max(self.depth, tree_depth + 1)
+            return build_tree(z, r, z_grads, log_slice, direction, tree_depth, energy_current)
+
+        kernel.setup, kernel._build_tree = timed_setup, tracked_build_tree
+
+    def __call__(self, kernel, params, stage, i):
+        now = time.perf_counter()
+        phase = "warmup" if stage.startswith("Warmup") else "sampling"
+        instrumentation.add_time(phase, now - self.last)
+        instrumentation.observe(f"nuts/{phase}_tree_depth", self.depth)
+        self.depth, self.last = 0, now
+
+
+def fit_nuts(model, data, num_samples=NUM_SAMPLES, warmup_steps=WARMUP_STEPS, jit_compile=True,
+             seed=0, progress=True, verbose=True, warm_start=None):
+    """
+    Fits a model (name in MODELS or a model function) to a MatchData with NUTS.
+    jit_compile traces the potential energy once with torch.jit, which removes most of
+    pyro's per-step python overhead. Returns a Fit; the fit time is also printed.
+    warm_start: optional dict with init_values {site: tensor} and optionally step_size,
+                inverse_mass_matrix (as kernel.inverse_mass_matrix) and adapt_mass_matrix,
+                see models.warm_start.
+    """
+    name, model_fn = _model(model)
+    pyro.set_rng_seed(seed)
+    pyro.clear_param_store()
+
+    kernel = _kernel(model_fn, jit_compile, warm_start)
+    hook = _NutsStats(kernel) if instrumentation.enabled() else None
+    mcmc = MCMC(kernel, num_samples=num_samples, warmup_steps=warmup_steps, num_chains=1,
+                disable_progbar=not progress, hook_fn=hook)
+    start = time.perf_counter()
+    with warnings.catch_warnings(), instrumentation.span("fit_nuts"):
+        # recent torch versions deprecate torch.jit.trace, which pyro's jit_compile uses
+        warnings.filterwarnings("ignore", message=".*torch.jit.trace.*", category=FutureWarning)
+        mcmc.run(data)
+    fit_time = time.perf_counter() - start
+    if hook is not None:
+        instrumentation.count("nuts/iterations", warmup_steps + num_samples)
+        instrumentation.count("nuts/divergences", len(mcmc.diagnostics()["divergences"]["chain 0"]))
+
+    if verbose:
+        print(f"{name}: NUTS {warmup_steps} warmup + {num_samples} samples on {data.n_matches} matches "
+              f"in {fit_time:.1f}s")
+    info = {"step_size": kernel.step_size, "inverse_mass_matrix": kernel.inverse_mass_matrix}
+    fit = Fit(name, mcmc.get_samples(), data.team_to_idx, fit_time, info)
+    fit.mcmc = mcmc
+    return fit
+
+
+def _run_chain(model, data, num_samples, warmup_steps, jit_compile, seed, threads, warm_start=None,
+               instrumented=False):
+    """
+    One chain in a worker process; returns the samples as numpy, the fit time, the adapted
+    kernel state and, if instrumented, the summary of the chain's own Recorder.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    if not instrumented:
+        fit = fit_nuts(model, data, num_samples, warmup_steps, jit_compile, seed, progress=False, verbose=False,
+                       warm_start=warm_start)
+        return fit.numpy_samples(), fit.fit_time, fit.info, None
+    with instrumentation.instrument() as recorder:
+        fit = fit_nuts(model, data, num_samples, warmup_steps, jit_compile, seed, progress=False, verbose=False,
+                       warm_start=warm_start)
+    return fit.numpy_samples(), fit.fit_time, fit.info, recorder.summary()
+
+
+def diagnostics(samples_by_chain):
+    """
+    Split R-hat and effective sample size of every scalar parameter.
+    samples_by_chain: {site: (chains, draws, ...)}. Returns a dataframe, one row per element.
+    """
+    rows = []
+    for site, x in samples_by_chain.items():
+        x = torch.as_tensor(x, dtype=torch.float64)
+        r_hat = split_gelman_rubin(x, chain_dim=0, sample_dim=1).reshape(-1)
+        n_eff = effective_sample_size(x, chain_dim=0, sample_dim=1).reshape(-1)
+        for i in range(r_hat.numel()):
+            rows.append({"site": site, "index": i, "r_hat": r_hat[i].item(), "n_eff": n_eff[i].item()})
+    return pd.DataFrame(rows)
+
+
+def fit_chains(model, data, num_chains=4, num_samples=NUM_SAMPLES, warmup_steps=WARMUP_STEPS,
+               jit_compile=True, seed=0, workers=None, verbose=True, warm_start=None):
+    """
+    Runs num_chains independent NUTS chains, in parallel processes (one per chain unless
+    workers is given) with seeds spawned from seed, and merges their samples.
+    The returned Fit has the draws of all chains concatenated chain by chain,
+    get_samples(group_by_chain=True) splits them again, and fit.diagnostics holds split
+    R-hat and ESS per parameter (see diagnostics()). To keep the effective sample count of
+    a single long chain, num_samples can be lowered to about 1/num_chains of it.
+    warm_start: as in fit_nuts, shared by all chains.
+    """
+    name, _ = _model(model)
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(num_chains)]
+    workers = num_chains if workers is None else workers
+    args = [model] * num_chains, [data] * num_chains, [num_samples] * num_chains, \
+        [warmup_steps] * num_chains, [jit_compile] * num_chains, seeds
+    warm = [warm_start] * num_chains
+
+    start = time.perf_counter()
+    if workers <= 1:
+        results = list(map(_run_chain, *args, [None] * num_chains, warm))
+    else:
+        # one torch thread per chain, the processes already use the cores.
+        # instrumented chains report their spans and counters back to the caller's Recorder
+        instrumented = [instrumentation.enabled()] * num_chains
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_chain, *args, [1] * num_chains, warm, instrumented))
+        for r in results:
+            instrumentation.merge(r[3])
+    fit_time = time.perf_counter() - start
+
+    by_chain = {site: np.stack([r[0][site] for r in results]) for site in results[0][0]}
+    samples = {site: torch.from_numpy(x.reshape((-1,) + x.shape[2:])) for site, x in by_chain.items()}
+    info = {"num_chains": num_chains, "seeds": seeds, "chains": [r[2] for r in results],
+            "chain_fit_times": [r[1] for r in results]}
+    fit = Fit(name, samples, data.team_to_idx, fit_time, info)
+    fit.diagnostics = diagnostics(by_chain)
+
+    if verbose:
+        worst = fit.diagnostics.sort_values("r_hat", ascending=False).iloc[0]
+        print(f"{name}: {num_chains} chains x ({warmup_steps} warmup + {num_samples} samples) "
+              f"on {data.n_matches} matches in {fit_time:.1f}s; "
+              f"max R-hat {worst.r_hat:.3f} ({worst.site}[{worst['index']}]), "
+              f"min ESS {fit.diagnostics.n_eff.min():.0f}")
+    return fit
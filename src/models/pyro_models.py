@@ -0,0 +1,102 @@
+import torch
+import pyro
+import pyro.distributions as dist
+
+# the notebook models as importable functions. each takes a models.data.MatchData, so
+# every data-dependent tensor (indices, masks, decay weights) is built once outside
+# the model and the model body only touches the latent variables.
+#
+# subsample_size: if set, the likelihood is evaluated on a random minibatch of matches
+# (scaled up by pyro.plate), for stochastic variational inference on the full history.
+
+
+def _matches(data, subsample_size):
+    """The matches plate and the match tensors of the current (sub)sample."""
+    plate = pyro.plate("matches", data.n_matches, subsample_size=subsample_size)
+    return plate, (lambda idx: data if subsample_size is None else data.batch(idx))
+
+
+def _attack_defense_latents(data):
+    # Team-level latent variables
+    attack = pyro.sample("attack", dist.Normal(0., 1.).expand([data.n_teams]).to_event(1))
+    defense = pyro.sample("defense", dist.Normal(0., 1.).expand([data.n_teams]).to_event(1))
+
+    # Global parameters
+    alpha = pyro.sample("alpha", dist.Normal(0., 1.))
+    home_adv = pyro.sample("home_adv", dist.Normal(0., 0.5))
+    return attack, defense, alpha, home_adv
+
+
+def _attack_defense_rates(m, attack, defense, alpha, home_adv):
+    # Expected goals
+    lambda_home = torch.exp(alpha + attack[m.home_idx] - defense[m.away_idx] + home_adv * m.home_adv_indicator)
+    lambda_away = torch.exp(alpha + attack[m.away_idx] - defense[m.home_idx])
+    return lambda_home, lambda_away
+
+
+def elo_model(data, subsample_size=None):
+    # all-in-one skill (ELO) of each team (latent)
+    team_skill = pyro.sample("team_skill", dist.Normal(0., 1.).expand([data.n_teams]).to_event(1))
+
+    plate, batch = _matches(data, subsample_size)
+    with plate as idx:
+        m = batch(idx)
+        # win probability (observe matches to inform team skill)
+        prob_home_win = torch.sigmoid(team_skill[m.home_idx] - team_skill[m.away_idx])
+        # draws are observed as 0.5, which is outside the bernoulli support, hence no validation
+        pyro.sample("obs", dist.Bernoulli(prob_home_win, validate_args=False), obs=m.outcome)
+
+
+def attack_defense_model(data, subsample_size=None):
+    latents = _attack_defense_latents(data)
+
+    plate, batch = _matches(data, subsample_size)
+    with plate as idx:
+        m = batch(idx)
+        lambda_home, lambda_away = _attack_defense_rates(m, *latents)
+        pyro.sample("obs_home", dist.Poisson(lambda_home), obs=m.home_goals)
+        pyro.sample("obs_away", dist.Poisson(lambda_away), obs=m.away_goals)
+
+
+def time_decay_model(data, subsample_size=None):
+    latents = _attack_defense_latents(data)
+
+    # Weighted likelihood
+    plate, batch = _matches(data, subsample_size)
+    with plate as idx:
+        m = batch(idx)
+        lambda_home, lambda_away = _attack_defense_rates(m, *latents)
+        pyro.sample("obs_home", dist.Poisson(lambda_home).mask(m.weights), obs=m.home_goals)
+        pyro.sample("obs_away", dist.Poisson(lambda_away).mask(m.weights), obs=m.away_goals)
+
+
+def dc_robust_adjust(data, lambda_h, lambda_a):
+    """
+    Dixon-Coles low-score correction times the high-score down-weighting.
+    Both masks and the high-score factor are precomputed in MatchData (or its batch).
+    """
+    low = torch.clamp(1 - data.gamma_low * (lambda_h * lambda_a), min=1e-3)
+    return torch.where(data.dc_low_mask, low, torch.ones_like(low)) * data.dc_high_factor
+
+
+def dixon_coles_robust_model(data, subsample_size=None):
+    latents = _attack_defense_latents(data)
+
+    plate, batch = _matches(data, subsample_size)
+    with plate as idx:
+        m = batch(idx)
+        lambda_home, lambda_away = _attack_defense_rates(m, *latents)
+        adjustment = dc_robust_adjust(m, lambda_home, lambda_away)
+        pyro.sample("obs_home", dist.Poisson(lambda_home * adjustment), obs=m.home_goals)
+        pyro.sample("obs_away", dist.Poisson(lambda_away * adjustment), obs=m.away_goals)
+
+
+# latent sites indexed by team (data.team_to_idx); the rest are global
+TEAM_SITES = ("attack", "defense", "team_skill")
+
+MODELS = {
+    "elo": elo_model,
+    "hierarchical": attack_defense_model,
+    "time_decay": time_decay_model,
+    "dixon_coles": dixon_coles_robust_model,
+}
@@ -0,0 +1,141 @@
+import json
+import numpy as np
+import torch
+
+from models.approximate import fit_laplace, fit_svi
+from models.fit import NUM_SAMPLES, fit_nuts
+from models.pyro_models import TEAM_SITES
+
+# warm-started refits after new matches are appended to the data.
+# the state of the last fit (NUTS: last draw, adapted step size and diagonal inverse mass
+# matrix; SVI: guide locations and scales; Laplace: the MAP point) is saved next to the
+# posterior, and the refit on the extended data starts from it, with a shortened warmup
+# (or far fewer optimisation steps) instead of adapting from scratch.
+# team-indexed sites are matched by team name, so new teams simply extend the vectors:
+# they start at the prior mean with the widest spread of the known teams.
+
+REFIT_WARMUP_STEPS = 50
+REFIT_SVI_STEPS = 300
+REFIT_MAP_STEPS = 100
+
+
+class FitState:
+    """
+    What a refit needs from a previous fit, as numpy arrays per latent site.
+    method:      "nuts", "svi" or "laplace"
+    values:      last NUTS draw / guide location, {site: array}
+    spreads:     NUTS inverse mass matrix diagonal / SVI guide scale, {site: array} (None for laplace)
+    step_size:   adapted NUTS step size
+    team_to_idx: team name -> index into the team-indexed sites (TEAM_SITES)
+    """
+
+    def __init__(self, model_name, method, team_to_idx, values, spreads=None, step_size=None):
+        self.model_name = model_name
+        self.method = method
+        self.team_to_idx = dict(team_to_idx)
+        self.values = values
+        self.spreads = spreads
+        self.step_size = step_size
+
+    @classmethod
+    def from_fit(cls, fit):
+        """State of a models.fit / models.approximate Fit (for several chains: the last chain)."""
+        method = fit.info.get("method", "nuts")
+        if method == "nuts":
+            info = fit.info["chains"][-1] if "chains" in fit.info else fit.info
+            values = {site: v[-1].detach().cpu().numpy() for site, v in fit.samples.items()}
+            spreads = _split_mass_matrix(info["inverse_mass_matrix"], values)
+            return cls(fit.model_name, method, fit.team_to_idx, values, spreads, info["step_size"])
+
+        values = {site: v.detach().cpu().numpy() for site, v in fit.guide.median().items()}
+        spreads = None
+        if method == "svi":
+            spreads = {site: fit.guide._get_loc_and_scale(site)[1].detach().cpu().numpy() for site in values}
+        return cls(fit.model_name, method, fit.team_to_idx, values, spreads)
+
+    def save(self, path):
+        arrays = {f"values/{site}": v for site, v in self.values.items()}
+        arrays.update({f"spreads/{site}": v for site, v in (self.spreads or {}).items()})
+        meta = {"model_name": self.model_name, "method": self.method, "step_size": self.step_size,
+                "teams": sorted(self.team_to_idx, key=self.team_to_idx.get)}
+        np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            meta = json.loads(f["meta"].item())
+            values = {k.split("/", 1)[1]: f[k] for k in f.files if k.startswith("values/")}
+            spreads = {k.split("/", 1)[1]: f[k] for k in f.files if k.startswith("spreads/")}
+        team_to_idx = {team: i for i, team in enumerate(meta["teams"])}
+        return cls(meta["model_name"], meta["method"], team_to_idx, values, spreads or None, meta["step_size"])
+
+    def for_teams(self, team_to_idx):
+        """
+        The state re-indexed to another team_to_idx: known teams keep their values, new teams
+        get 0 (the prior mean) and the largest spread of their site, dropped teams are removed.
+        """
+        idx = np.array([self.team_to_idx.get(team, -1) for team in sorted(team_to_idx, key=team_to_idx.get)])
+        known = idx >= 0
+
+        def reindex(arrays, fill):
+            if arrays is None:
+                return None
+            out = dict(arrays)
+            for site in TEAM_SITES:
+                if site in out:
+                    out[site] = np.where(known, out[site][idx], fill(out[site])).astype(out[site].dtype)
+            return out
+
+        return FitState(self.model_name, self.method, team_to_idx,
+                        reindex(self.values, lambda v: 0.0), reindex(self.spreads, np.max), self.step_size)
+
+    def warm_start(self, adapt_mass_matrix=False):
+        """warm_start argument for fit_nuts / fit_svi / fit_laplace (teams must match the data)."""
+        warm = {"init_values": {site: torch.as_tensor(v) for site, v in self.values.items()}}
+        if self.method == "nuts":
+            # pyro's diagonal mass matrix is one block over the sorted site names
+            sites = tuple(sorted(self.spreads))
+            warm["inverse_mass_matrix"] = {sites: torch.as_tensor(np.concatenate(
+                [self.spreads[site].ravel() for site in sites]))}
+            warm["step_size"] = self.step_size
+            warm["adapt_mass_matrix"] = adapt_mass_matrix
+        elif self.method == "svi":
+            warm["scales"] = {site: torch.as_tensor(v) for site, v in self.spreads.items()}
+        return warm
+
+
+def _split_mass_matrix(inverse_mass_matrix, values):
+    """Diagonal inverse mass matrix {(sites...): flat} -> {site: array shaped like the site}."""
+    spreads = {}
+    for sites, flat in inverse_mass_matrix.items():
+        if flat.dim() != 1:
+            raise ValueError("warm starts only support a diagonal mass matrix")
+        flat = flat.detach().cpu().numpy()
+        offset = 0
+        for site in sites:
+            size = values[site].size
+            spreads[site] = flat[offset:offset + size].reshape(values[site].shape)
+            offset += size
+    return spreads
+
+
+def refit(state, data, model=None, warmup_steps=REFIT_WARMUP_STEPS, num_samples=NUM_SAMPLES,
+          num_steps=None, adapt_mass_matrix=False, seed=0, verbose=True, **kwargs):
+    """
+    Refits state's model on data (typically the old data plus new matches), starting from
+    state. NUTS keeps the saved mass matrix unless adapt_mass_matrix, and only re-tunes the
+    step size during warmup_steps; SVI / Laplace run num_steps (default REFIT_SVI_STEPS /
+    REFIT_MAP_STEPS) optimisation steps. model overrides state.model_name, e.g. for a model
+    function not in MODELS; kwargs go to the fit function. Returns a Fit.
+    For several NUTS chains pass state.for_teams(...).warm_start() to fit_chains directly.
+    """
+    model = state.model_name if model is None else model
+    warm = state.for_teams(data.team_to_idx).warm_start(adapt_mass_matrix)
+    if state.method == "nuts":
+        return fit_nuts(model, data, num_samples, warmup_steps, seed=seed, verbose=verbose,
+                        warm_start=warm, **kwargs)
+    if state.method == "svi":
+        return fit_svi(model, data, REFIT_SVI_STEPS if num_steps is None else num_steps, num_samples=num_samples,
+                       seed=seed, verbose=verbose, warm_start=warm, **kwargs)
+    return fit_laplace(model, data, REFIT_MAP_STEPS if num_steps is None else num_steps, num_samples=num_samples,
+                       seed=seed, verbose=verbose, warm_start=warm, **kwargs)
@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+if __name__ == "__main__":
+    # run as a script: make the src packages importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation.aggregation import PlacementAggregator
+from simulation.runner import run_simulations
+from simulation.skill_provider import SkillProvider
+from simulation.tournament_format import FORMATS, get_format
+
+# command line entry point: stage probabilities from precomputed skills, without the
+# notebooks. only numpy and pandas are imported (no torch / pyro), so a run starts in a
+# fraction of a second; plotting libraries are only loaded for --plot.
+#
+#   cd src && python -m simulation skills.npz -n 100000 --seed 0 [--out probs.csv] [--plot probs.png]
+#
+# skill files:
+#   .npy  skills (n_draws, n_teams) or (n_teams,), columns in the format's team order
+#   .npz  "skills" or "team_skill" (n_draws, n_teams), or "attack" and "defense" posterior
+#         draws; team names either as a "teams" array or in a json "meta" record (the
+#         entries of models/cache.py work as they are). without names the columns are in
+#         the format's team order.
+
+
+def _file_teams(arrays):
+    if "teams" in arrays:
+        return [str(team) for team in arrays["teams"]]
+    if "meta" in arrays:
+        return json.loads(arrays["meta"].item()).get("teams")
+    return None
+
+
+def load_skills(path, fmt="world_cup_2026"):
+    """SkillProvider over the format's teams from a .npy / .npz skill or posterior-draw file."""
+    fmt = get_format(fmt)
+    if path.endswith(".npy"):
+        return SkillProvider(np.load(path), fmt.teams)
+
+    with np.load(path) as f:
+        arrays = {name: f[name] for name in f.files}
+    teams = _file_teams(arrays) or fmt.teams
+    team_to_idx = {team: i for i, team in enumerate(teams)}
+    for name in ("skills", "team_skill"):
+        if name in arrays:
+            return SkillProvider.from_samples(arrays[name], team_to_idx, fmt.teams)
+    if "attack" in arrays and "defense" in arrays:
+        return SkillProvider.from_posterior(arrays["attack"], arrays["defense"], team_to_idx, teams=fmt.teams)
+    raise ValueError(f"{path}: expected a 'skills', 'team_skill' or 'attack' / 'defense' array, "
+                     f"found {sorted(arrays)}")
+
+
+def plot_probabilities(prob_df, path, title):
+    """Stage probability heatmap as in the notebooks."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.figure(figsize=(12, max(4, 0.2 * len(prob_df))))
+    sns.heatmap(prob_df, annot=True, fmt=".2f", cmap="YlGnBu", cbar_kws={"label": "Probability"})
+    plt.title(title)
+    plt.ylabel("Team")
+    plt.xlabel("Stage")
+    plt.yticks(rotation=0)
+    plt.savefig(path, bbox_inches="tight")
+    plt.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m simulation",
+                                     description="stage probabilities from precomputed skills")
+    parser.add_argument("skills", help=".npy / .npz skill or posterior-draw file")
+    parser.add_argument("-n", "--n-sims", type=int, default=100_000, help="number of tournaments")
+    parser.add_argument("--format", default="world_cup_2026", choices=sorted(FORMATS))
+    parser.add_argument("--seed", type=int, help="seed (results are reproducible for a given seed)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--sort", default="WINNER", help="stage to sort the table by (one of the format's stages)")
+    parser.add_argument("--top", type=int, help="only print the first rows")
+    parser.add_argument("--out", help="write the table to a .csv or .json file")
+    parser.add_argument("--plot", help="save a heatmap of the table (needs matplotlib and seaborn)")
+    args = parser.parse_args(argv)
+
+    fmt = get_format(args.format)
+    if args.sort not in fmt.stages:
+        parser.error(f"argument --sort: invalid choice: {args.sort!r} (choose from {', '.join(fmt.stages)})")
+    provider = load_skills(args.skills, fmt)
+    start = time.perf_counter()
+    aggregator = run_simulations(provider, args.n_sims, workers=args.workers, seed=args.seed, fmt=fmt,
+                                 aggregator=PlacementAggregator(fmt.teams, fmt.stages))
+    elapsed = time.perf_counter() - start
+    prob_df = aggregator.to_dataframe(args.sort)
+
+    print(f"{fmt.name}: {args.n_sims} tournaments, {provider.n_draws} skill draws, {elapsed:.2f}s")
+    table = prob_df if args.top is None else prob_df.head(args.top)
+    print(table.to_string(float_format="{:.3f}".format))
+
+    if args.out:
+        if args.out.endswith(".json"):
+            prob_df.to_json(args.out, orient="index", indent=1)
+        else:
+            prob_df.to_csv(args.out, index_label="team")
+    if args.plot:
+        plot_probabilities(prob_df, args.plot, f"{fmt.name} stage probabilities by team")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import time
+from statistics import NormalDist
+import numpy as np
+
+from simulation.aggregation import PlacementAggregator
+from simulation.runner import DEFAULT_CHUNK_SIZE, run_simulations
+from simulation.variance_reduction import StageEstimate
+from simulation.world_cup_simulation import STAGES, WC_TEAMS
+
+# sequential monte carlo: simulate in batches until the requested probabilities are
+# known precisely enough, instead of a fixed N = 1000.
+# precision is the half-width of the wilson score interval of each team/stage probability,
+# which stays sensible for long shots with p close to 0 (unlike p +- z * se).
+
+
+class AdaptiveEstimate(StageEstimate):
+    """StageEstimate plus the achieved interval half-widths and why the run stopped."""
+
+    def __init__(self, prob, se, n_sims, half_width, target, stop_reason, elapsed):
+        super().__init__(prob, se, n_sims)
+        self.half_width = half_width
+        self.target = target
+        self.stop_reason = stop_reason
+        self.elapsed = elapsed
+
+    @property
+    def converged(self):
+        return self.stop_reason == "converged"
+
+
+def wilson_half_width(counts, n, confidence=0.95):
+    """Half-width of the wilson score interval for counts successes out of n."""
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = counts / n
+    return z / (1 + z ** 2 / n) * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2))
+
+
+def target_mask(stages=("WINNER",), teams=None):
+    """(48, 7) bool mask of the probabilities that must reach the requested precision."""
+    mask = np.zeros((len(WC_TEAMS), len(STAGES)), dtype=bool)
+    rows = slice(None) if teams is None else [WC_TEAMS.index(t) for t in teams]
+    cols = [STAGES.index(s) for s in stages]
+    mask[np.ix_(np.arange(len(WC_TEAMS))[rows], cols)] = True
+    return mask
+
+
+def simulate_until_precise(skills, half_width=0.005, stages=("WINNER",), teams=None, confidence=0.95,
+                           batch_size=DEFAULT_CHUNK_SIZE, max_sims=1_000_000, max_seconds=None,
+                           seed=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Runs batches of batch_size tournaments until every requested team/stage probability has a
+    confidence interval of at most +- half_width, or max_sims / max_seconds is reached.
+
+    skills:        as for run_simulations (array or SkillProvider)
+    stages, teams: which probabilities to target; teams=None means all 48,
+                   e.g. stages=("WINNER", "R16") for every team's WINNER and R16 probabilities.
+
+    Every batch gets its own child of SeedSequence(seed) and is run by run_simulations in
+    chunks of chunk_size, so a run is reproducible whatever the worker count and the first
+    k batches are the same whatever the stopping point. With workers > 1, use a batch_size
+    of several chunks.
+    Returns an AdaptiveEstimate; stop_reason is "converged", "max_sims" or "max_seconds".
+    """
+    if max_sims < 1:
+        raise ValueError(f"max_sims must be at least 1, got {max_sims}")
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+    target = target_mask(stages, teams)
+    seed_seq = np.random.SeedSequence(seed)
+    aggregator = PlacementAggregator()
+    start = time.perf_counter()
+
+    while True:
+        n = min(batch_size, max_sims - aggregator.n_sims)
+        counts = run_simulations(skills, n, workers=workers, seed=seed_seq.spawn(1)[0], chunk_size=chunk_size)
+        aggregator.update_counts(counts, n)
+
+        width = wilson_half_width(aggregator.counts, aggregator.n_sims, confidence)
+        elapsed = time.perf_counter() - start
+        if (width[target] <= half_width).all():
+            stop_reason = "converged"
+        elif aggregator.n_sims >= max_sims:
+            stop_reason = "max_sims"
+        elif max_seconds is not None and elapsed >= max_seconds:
+            stop_reason = "max_seconds"
+        else:
+            continue
+        break
+
+    prob = aggregator.probabilities()
+    se = np.sqrt(prob * (1 - prob) / aggregator.n_sims)
+    return AdaptiveEstimate(prob, se, aggregator.n_sims, width, target, stop_reason, elapsed)
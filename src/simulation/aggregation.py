@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from simulation.world_cup_simulation import STAGES, WC_TEAMS, stage_counts
+
+
+class PlacementAggregator:
+    """
+    Streaming replacement for `all_results[team].append(stage)` + Counter.
+
+    Keeps a fixed (teams x stages) integer count matrix that is updated as batches
+    of simulations arrive, so memory does not grow with the number of simulations.
+    Optionally spills every simulation's outcome to a memory-mapped uint8 .npy file
+    of shape (capacity, len(teams)), one row per tournament, values are indices into stages.
+    """
+
+    def __init__(self, teams=WC_TEAMS, stages=STAGES, spill_path=None, capacity=None):
+        self.teams = list(teams)
+        self.stages = list(stages)
+        self.team_to_idx = {team: i for i, team in enumerate(self.teams)}
+        self.stage_to_idx = {stage: i for i, stage in enumerate(self.stages)}
+        self.counts = np.zeros((len(self.teams), len(self.stages)), dtype=np.int64)
+        self.n_sims = 0
+
+        self.outcomes = None
+        if spill_path is not None:
+            if capacity is None:
+                raise ValueError("capacity is required when spilling outcomes to disk")
+            self.outcomes = np.lib.format.open_memmap(
+                spill_path, mode="w+", dtype=np.uint8, shape=(capacity, len(self.teams))
+            )
+
+    def update(self, reached):
+        """Adds a batch of simulations, (n_sims, teams) stage indices as from simulate_stages_batch."""
+        reached = np.asarray(reached, dtype=np.uint8)
+        n = reached.shape[0]
+        if self.outcomes is not None:
+            if self.n_sims + n > self.outcomes.shape[0]:
+                raise ValueError(f"spill file is full ({self.outcomes.shape[0]} simulations)")
+            self.outcomes[self.n_sims:self.n_sims + n] = reached
+        self.counts += stage_counts(reached, len(self.stages))
+        self.n_sims += n
+
+    def update_counts(self, counts, n_sims):
+        """Adds pre-aggregated (teams, stages) counts of n_sims simulations, e.g. from run_simulations."""
+        if self.outcomes is not None:
+            raise ValueError("per-simulation outcomes are needed when spilling, use update()")
+        self.counts += np.asarray(counts, dtype=np.int64)
+        self.n_sims += n_sims
+
+    def add_placements(self, placements):
+        """Adds one result of simulate_world_cup, i.e. {team: stage_name}."""
+        row = np.zeros((1, len(self.teams)), dtype=np.uint8)
+        for team, stage in placements.items():
+            row[0, self.team_to_idx[team]] = self.stage_to_idx[stage]
+        self.update(row)
+
+    def probabilities(self):
+        """(teams, stages) array of stage probabilities."""
+        return self.counts / max(self.n_sims, 1)
+
+    def to_dataframe(self, sort_by="WINNER"):
+        """Stage probability table as built in the notebooks (prob_df), teams as rows."""
+        prob_df = pd.DataFrame(self.probabilities(), index=self.teams, columns=self.stages)
+        if sort_by is not None:
+            prob_df = prob_df.sort_values(sort_by, ascending=False)
+        return prob_df
+
+    def flush(self):
+        """Writes spilled outcomes to disk."""
+        if self.outcomes is not None:
+            self.outcomes.flush()
@@ -0,0 +1,149 @@
+import itertools
+import math
+import os
+import warnings
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+OFFICIAL_THIRDS_CSV = "data/raw/best_thirds_r32_official.csv"
+DERIVED_THIRDS_CSV = "data/derived/best_thirds_r32_derived.csv"
+
+GROUP_LETTERS = "ABCDEFGHIJKL"
+
+# the group winners that face a third-placed team, in the order of the 3rd slots
+# in create_knockouts_list (3.1 ... 3.8)
+THIRD_SLOT_OPPONENTS = ["E", "I", "D", "G", "A", "L", "B", "K"]
+
+# groups whose third-placed team may be drawn against each group winner
+# (https://en.wikipedia.org/wiki/2026_FIFA_World_Cup_knockout_stage)
+ELIGIBLE_THIRDS = {
+    "E": "ABCDF",
+    "I": "CDFGH",
+    "D": "BEFIJ",
+    "G": "AEHIJ",
+    "A": "CEFHI",
+    "L": "EHIJK",
+    "B": "EFGIJ",
+    "K": "DEIJL",
+}
+THIRD_SLOTS = [ELIGIBLE_THIRDS[g] for g in THIRD_SLOT_OPPONENTS]
+
+# fifa fixes one assignment for each of the C(12, 8) = 495 combinations of groups whose
+# thirds advance (annex of the competition regulations). the table is stored as a csv with
+# one row per combination (advancing groups, then the group sent to each 3rd slot) and
+# loaded into a lookup array indexed by the 12-bit mask of advancing groups (bit g set =
+# group g's third advances).
+#
+# lookup_thirds uses the annex table, OFFICIAL_THIRDS_CSV (transcribed from the regulations,
+# same layout, validated against ELIGIBLE_THIRDS on load). without that file it falls back,
+# with a warning, to DERIVED_THIRDS_CSV: build_derived_thirds_table derives every row from
+# ELIGIBLE_THIRDS, taking the first valid assignment when several exist. every third then
+# plays an eligible group winner, but for many combinations fifa's choice differs, so those
+# brackets are plausible rather than the real ones. running this file rebuilds the derived
+# table and counts the rows in which the annex differs from it.
+
+
+def group_mask(group_indices):
+    """Bit mask of advancing groups from group indices (0 = A, 12 bits for 2026)."""
+    mask = 0
+    for g in group_indices:
+        mask |= 1 << int(g)
+    return mask
+
+
+def assign_thirds(advancing, slots=THIRD_SLOTS):
+    """
+    Assigns the advancing groups (names) to the best-thirds slots so that every slot gets a
+    third from an eligible group; slots[k] lists the group names eligible for slot k
+    (default: the 2026 slots 3.1 ... 3.8). Returns the group name per slot.
+    """
+    def backtrack(slot, used):
+        if slot == len(slots):
+            return []
+        for group in slots[slot]:
+            if group in advancing and group not in used:
+                rest = backtrack(slot + 1, used | {group})
+                if rest is not None:
+                    return [group] + rest
+        return None
+
+    assignment = backtrack(0, frozenset())
+    if assignment is None:
+        raise ValueError(f"no valid assignment for advancing groups {''.join(sorted(advancing))}")
+    return assignment
+
+
+def derived_thirds_rows(group_names=GROUP_LETTERS, slots=THIRD_SLOTS):
+    """(advancing groups, assign_thirds of them) for every combination of len(slots) groups."""
+    return [(advancing, assign_thirds(set(advancing), slots))
+            for advancing in itertools.combinations(group_names, len(slots))]
+
+
+def thirds_table(rows, group_names=GROUP_LETTERS, slots=THIRD_SLOTS):
+    """
+    (2^groups, len(slots)) int8 lookup array from (advancing, assigned) rows:
+    table[mask, slot] = index of the group whose third plays in that slot, -1 for invalid masks.
+    """
+    group_names = list(group_names)
+    table = np.full((1 << len(group_names), len(slots)), -1, dtype=np.int8)
+    for advancing, assigned in rows:
+        if len(assigned) != len(slots) or any(g not in eligible for g, eligible in zip(assigned, slots)):
+            raise ValueError(f"invalid assignment {''.join(assigned)} when {''.join(advancing)} advance")
+        table[group_mask(group_names.index(g) for g in advancing)] = [group_names.index(g) for g in assigned]
+    return table
+
+
+def build_derived_thirds_table(path=DERIVED_THIRDS_CSV):
+    """Writes the derived 495-row assignment csv."""
+    header = "advancing," + ",".join(f"1{g}" for g in THIRD_SLOT_OPPONENTS)
+    rows = [header] + ["".join(advancing) + "," + ",".join(assigned) for advancing, assigned in derived_thirds_rows()]
+    with open(os.path.join(BASE_DIR, path), "w") as f:
+        f.write("\n".join(rows) + "\n")
+
+
+def load_thirds_table(path, group_names=GROUP_LETTERS, slots=THIRD_SLOTS):
+    """
+    Loads an assignment csv (one-letter group names) into a thirds_table lookup array,
+    checking every row against the eligible groups of the slots and that every
+    combination of advancing groups has a row.
+    """
+    if any(len(g) != 1 for g in group_names):
+        raise ValueError(f"{path}: the csv layout needs one-letter group names")
+    with open(os.path.join(BASE_DIR, path)) as f:
+        next(f)
+        rows = [(advancing, assigned) for advancing, *assigned in (line.strip().split(",") for line in f if line.strip())]
+    table = thirds_table(rows, group_names, slots)
+    n_rows = int((table[:, 0] >= 0).sum())
+    if n_rows != math.comb(len(group_names), len(slots)):
+        raise ValueError(f"{path}: {n_rows} combinations, expected {math.comb(len(group_names), len(slots))}")
+    return table
+
+
+def default_thirds_csv():
+    """OFFICIAL_THIRDS_CSV if it is present, else DERIVED_THIRDS_CSV (with a warning)."""
+    if os.path.exists(os.path.join(BASE_DIR, OFFICIAL_THIRDS_CSV)):
+        return OFFICIAL_THIRDS_CSV
+    warnings.warn(f"{OFFICIAL_THIRDS_CSV} not found, best thirds use the derived slot table "
+                  f"{DERIVED_THIRDS_CSV}, which differs from fifa's annex for many combinations")
+    return DERIVED_THIRDS_CSV
+
+
+THIRDS_CSV = default_thirds_csv()
+THIRDS_TABLE = load_thirds_table(THIRDS_CSV)
+
+
+def lookup_thirds(masks):
+    """
+    Slot assignment for one mask (-> (8,) group indices) or an array of masks
+    (-> (..., 8)), e.g. one mask per simulation.
+    """
+    return THIRDS_TABLE[masks]
+
+
+if __name__ == "__main__":
+    build_derived_thirds_table()
+    if THIRDS_CSV == OFFICIAL_THIRDS_CSV:
+        derived = load_thirds_table(DERIVED_THIRDS_CSV)
+        valid = THIRDS_TABLE[:, 0] >= 0
+        differ = int((THIRDS_TABLE[valid] != derived[valid]).any(axis=1).sum())
+        print(f"{OFFICIAL_THIRDS_CSV}: {differ} of {int(valid.sum())} combinations differ from the derived table")
@@ -0,0 +1,284 @@
+import itertools
+import math
+import numpy as np
+import pandas as pd
+
+from simulation.best_thirds import group_mask, lookup_thirds
+from simulation.world_cup_simulation import (
+    GROUP_NAMES, GROUP_PAIRS, R32_SLOTS, STAGES, WC_TEAMS, match_probabilities,
+)
+
+# exact (non-monte-carlo) stage probabilities for the batched tournament model.
+#
+# groups:      all 3^6 = 729 win/draw/loss combinations of a group are enumerated,
+#              ties on points are split evenly over the tied positions (the simulation
+#              breaks them at random).
+# best thirds: the chance that a third-placed team with x points is among the 8 best
+#              is computed exactly from the other 11 groups (ties split evenly), and so is
+#              the probability of each of the 495 combinations of advancing groups, which
+#              fixes the r32 slot of every third through the best_thirds lookup table.
+# knockouts:   for every team and group position it can reach the r32 from, the other
+#              slots are conditioned on that position (group mates exactly, other groups
+#              are independent of it) and pushed through the bracket with dynamic
+#              programming.
+#
+# approximation: inside the bracket the 32 slots are treated as independent. this ignores
+# (a) the coupling between the eight best thirds (including that which team of a group
+# finishes third is taken as independent of which combination of groups advances) and
+# (b) that every group also has a slot in the other half of the bracket, so beating e.g.
+# 1E on the way to the final changes the odds of meeting 2E in it. the error grows with
+# the skill spread; for spreads like the fitted models (sd ~0.3-0.6) it stays around
+# 0.1-0.2 percentage points per stage, i.e. comparable to the noise of a 100k-tournament
+# monte carlo run.
+
+N_POINTS = 10  # 0..9 points possible in a group of 4
+N_QUALIFYING_POSITIONS = 3  # winners, runners-up and (some) thirds reach the r32
+# posterior draws handled at once: the conditional slot distributions take ~8 MB per draw
+DRAW_CHUNK = 16
+
+# all outcome combinations of the 6 group matches: 0 = team1 win, 1 = draw, 2 = team2 win
+_OUTCOMES = np.array(list(itertools.product(range(3), repeat=len(GROUP_PAIRS))))
+
+
+def _outcome_tables():
+    """
+    Per outcome combination: points of the 4 teams, shape (729, 4), and the joint
+    finishing-position distribution of two teams with evenly split ties,
+    joint[o, t, p, u, q] = P(t finishes p-th and u finishes q-th), shape (729, 4, 4, 4, 4).
+    """
+    points = np.zeros((len(_OUTCOMES), 4), dtype=np.int64)
+    for m, (i, j) in enumerate(GROUP_PAIRS):
+        points[:, i] += np.choose(_OUTCOMES[:, m], [3, 1, 0])
+        points[:, j] += np.choose(_OUTCOMES[:, m], [0, 1, 3])
+
+    # every ordering of the 4 teams that is sorted by points is equally likely
+    orders = np.array(list(itertools.permutations(range(4))))  # orders[k, position] = team
+    sorted_points = points[:, orders]  # (729, 24, 4)
+    valid = (np.diff(sorted_points, axis=2) <= 0).all(axis=2)
+    weight = valid / valid.sum(axis=1, keepdims=True)
+
+    positions = np.argsort(orders, axis=1)  # positions[k, team] = position
+    at = np.eye(4)[positions]  # at[k, team, position]
+    joint = np.einsum("ok,ktp,kuq->otpuq", weight, at, at)
+    return points, joint
+
+
+_POINTS, _JOINT_POSITIONS = _outcome_tables()
+_POSITIONS = np.einsum("otptp->otp", _JOINT_POSITIONS)
+
+
+def _as_draws(skills):
+    """Skills as (n_draws, 48): one row per posterior draw, or a single row."""
+    skills = np.asarray(skills, dtype=np.float64)
+    if skills.shape == (len(WC_TEAMS),):
+        return skills[None, :]
+    if skills.ndim == 2 and skills.shape[0] == len(WC_TEAMS):
+        return skills.T
+    raise ValueError(f"skills must have shape (48,) or (48, n_draws), got {skills.shape}")
+
+
+def group_outcome_probabilities(skills, max_draw_prob=0.15):
+    """Probability of each of the 729 outcome combinations per group, shape (D, 12, 729)."""
+    s = skills.reshape(skills.shape[0], len(GROUP_NAMES), 4)
+    i, j = np.array(GROUP_PAIRS).T
+    p1, p_draw = match_probabilities(s[..., i] - s[..., j], max_draw_prob)
+    match_dist = np.stack([p1, p_draw, 1 - p1 - p_draw], axis=-1)  # (D, 12, 6, 3)
+
+    outcome_prob = np.ones(s.shape[:2] + (len(_OUTCOMES),))
+    for m in range(len(GROUP_PAIRS)):
+        outcome_prob *= match_dist[:, :, m, _OUTCOMES[:, m]]
+    return outcome_prob
+
+
+def _qualification_given_points(third_points):
+    """
+    P(a third-placed team of group g with x points is among the 8 best thirds), shape (D, 12, N_POINTS).
+    Runs a DP over the other groups counting how many thirds are strictly better (b) and level (e).
+    """
+    n_groups = third_points.shape[1]
+    dist = third_points.sum(axis=2)  # (D, 12, N_POINTS) third-place points per group
+    above = np.flip(np.cumsum(np.flip(dist, -1), -1), -1) - dist  # P(points > x)
+    level = dist
+
+    b, e = np.meshgrid(np.arange(n_groups), np.arange(n_groups), indexing="ij")
+    qualifies = np.where(b >= 8, 0.0, np.where(b + e < 8, 1.0, (8 - b) / (e + 1)))
+
+    result = np.zeros_like(dist)
+    for g in range(n_groups):
+        state = np.zeros(dist.shape[:1] + (N_POINTS, n_groups, n_groups))
+        state[:, :, 0, 0] = 1
+        for h in range(n_groups):
+            if h == g:
+                continue
+            pa, pl = above[:, h, :, None, None], level[:, h, :, None, None]
+            new = state * (1 - pa - pl)
+            new[:, :, 1:, :] += state[:, :, :-1, :] * pa
+            new[:, :, :, 1:] += state[:, :, :, :-1] * pl
+            state = new
+        result[:, g] = (state * qualifies).sum(axis=(2, 3))
+    return result
+
+
+# all 495 combinations of 8 advancing groups, as membership matrix and their slot assignment
+_COMBINATIONS = np.array([
+    [g in combination for g in range(len(GROUP_NAMES))]
+    for combination in itertools.combinations(range(len(GROUP_NAMES)), 8)
+])
+_COMBINATION_SLOTS = lookup_thirds(np.array([group_mask(np.flatnonzero(c)) for c in _COMBINATIONS]))
+
+
+def _combination_probabilities(third_points):
+    """
+    P(exactly the groups of each combination send their third to the r32), shape (D, 495).
+    With x the lowest points among the advancing thirds, all others must have at most x;
+    if a advancing and b other thirds are level on x, the tie goes the right way with
+    probability 1 / C(a + b, a). A DP over the groups counts a and b for every x.
+    """
+    dist = third_points.sum(axis=2)  # (D, 12, N_POINTS)
+    above = np.flip(np.cumsum(np.flip(dist, -1), -1), -1) - dist  # P(points > x)
+    below = np.cumsum(dist, -1) - dist  # P(points < x)
+    n_out = len(GROUP_NAMES) - 8
+
+    state = np.zeros((dist.shape[0], len(_COMBINATIONS), N_POINTS, 9, n_out + 1))
+    state[..., 0, 0] = 1
+    for h in range(len(GROUP_NAMES)):
+        inside = _COMBINATIONS[:, h, None, None, None]
+        level = dist[:, h, None, :, None, None]
+        new_in = state * above[:, h, None, :, None, None]
+        new_in[..., 1:, :] += state[..., :-1, :] * level
+        new_out = state * below[:, h, None, :, None, None]
+        new_out[..., 1:] += state[..., :-1] * level
+        state = np.where(inside, new_in, new_out)
+
+    a, b = np.meshgrid(np.arange(9), np.arange(n_out + 1), indexing="ij")
+    binom = np.array([[math.comb(i + j, i) for j in range(n_out + 1)] for i in range(9)])
+    tie_won = np.where(a >= 1, 1 / binom, 0)
+    return (state * tie_won).sum(axis=(2, 3, 4))
+
+
+def _slot_index():
+    """r32 slot of each (group, position) for winners/runners-up, and the 8 third-place slots."""
+    position_slot = {}
+    third_slots = []
+    for k, (group, pos) in enumerate(R32_SLOTS):
+        if group == "3rd":
+            third_slots.append(k)
+        else:
+            position_slot[(GROUP_NAMES.index(group), pos)] = k
+    return position_slot, third_slots
+
+
+_POSITION_SLOT, _THIRD_SLOTS = _slot_index()
+
+
+def conditional_r32_slots(skills, max_draw_prob=0.15):
+    """
+    R32 slot distributions conditioned on each team's group position.
+
+    Returns (weight, own, others):
+      weight[d, t, p]     P(team t reaches the r32 from group position p)
+      own[d, t, p, k]     P(t sits in slot k | t reaches the r32 from position p)
+      others[d, t, p, k]  distribution over the 48 teams of the opponent filling slot k,
+                          given t reaches the r32 from position p, shape (D, 48, 3, 32, 48)
+    """
+    n_draws, n_groups = skills.shape[0], len(GROUP_NAMES)
+    outcome_prob = group_outcome_probabilities(skills, max_draw_prob)
+    points_onehot = _POINTS[..., None] == np.arange(N_POINTS)
+
+    position_probs = np.einsum("dgo,otp->dgtp", outcome_prob, _POSITIONS)
+    joint = np.einsum("dgo,otpuq->dgtpuq", outcome_prob, _JOINT_POSITIONS)
+    third_points = np.einsum("dgo,ot,otx->dgtx", outcome_prob, _POSITIONS[:, :, 2], points_onehot)
+    joint_third = np.einsum("dgo,otpu,oux->dgtpux", outcome_prob, _JOINT_POSITIONS[..., 2], points_onehot)
+
+    qual = _qualification_given_points(third_points)
+    third_qualified = np.einsum("dgtx,dgx->dgt", third_points, qual)
+    joint_third_qualified = np.einsum("dgtpux,dgx->dgtpu", joint_third, qual)
+
+    p_cond = position_probs[..., :N_QUALIFYING_POSITIONS]  # (D, 12, 4, 3)
+    safe = np.where(p_cond > 0, p_cond, 1)
+
+    # slot_group[d, k, g]: P(third slot k goes to group g), divided by P(group g's third advances)
+    combination_probs = _combination_probabilities(third_points)
+    slot_group = np.einsum("dc,ckg->dkg", combination_probs, np.eye(len(GROUP_NAMES))[_COMBINATION_SLOTS])
+    group_qualified = third_qualified.sum(axis=2)[:, None, :]
+    slot_given_group = np.divide(slot_group, group_qualified, out=np.zeros_like(slot_group),
+                                 where=group_qualified > 0)
+
+    # unconditional slots, then overwrite what depends on the conditioning team's group
+    base = np.zeros((n_draws, len(R32_SLOTS), len(WC_TEAMS)))
+    for (g, pos), k in _POSITION_SLOT.items():
+        base[:, k, 4 * g:4 * g + 4] = position_probs[:, g, :, pos]
+    base[:, _THIRD_SLOTS] = (slot_given_group[..., None] * third_qualified[:, None]).reshape(n_draws, 8, -1)
+
+    others = np.broadcast_to(
+        base[:, None, None], (n_draws, len(WC_TEAMS), N_QUALIFYING_POSITIONS) + base.shape[1:]
+    ).copy()
+    own = np.zeros(others.shape[:-1])
+    weight = np.zeros((n_draws, len(WC_TEAMS), N_QUALIFYING_POSITIONS))
+
+    for g in range(n_groups):
+        members = slice(4 * g, 4 * g + 4)
+        cond = others[:, members]  # (D, 4 t, 3 p, 32, 48)
+        for q in range(2):
+            cond[:, :, :, _POSITION_SLOT[(g, q)], members] = joint[:, g, :, :N_QUALIFYING_POSITIONS, :, q] / safe[:, g, :, :, None]
+        group_thirds = joint_third_qualified[:, g, :, :N_QUALIFYING_POSITIONS] / safe[:, g, :, :, None]
+        group_thirds[:, :, 2] = 0  # the conditioning team is that third itself
+        for slot, k in enumerate(_THIRD_SLOTS):
+            cond[:, :, :, k, members] = group_thirds * slot_given_group[:, slot, g, None, None, None]
+
+        for t in range(4):
+            team = 4 * g + t
+            cond[:, t, :, :, team] = 0
+            own[:, team, 0, _POSITION_SLOT[(g, 0)]] = 1
+            own[:, team, 1, _POSITION_SLOT[(g, 1)]] = 1
+            own[:, team, 2, _THIRD_SLOTS] = slot_given_group[:, :, g]
+        weight[:, members, :2] = position_probs[:, g, :, :2]
+        weight[:, members, 2] = third_qualified[:, g]
+
+    mass = others.sum(axis=-1, keepdims=True)
+    others = np.divide(others, mass, out=np.zeros_like(others), where=mass > 0)
+    return weight, own, others
+
+
+def _reach_probabilities(skills, max_draw_prob):
+    """P(team reaches each stage) summed over the draws of skills (D, 48), shape (48, 7)."""
+    weight, own, others = conditional_r32_slots(skills, max_draw_prob)
+
+    # knockout win matrix: beats[d, a, b] = P(a beats b)
+    beats, _ = match_probabilities(skills[:, :, None] - skills[:, None, :], max_draw_prob=0)
+
+    # own[d, t, p, n]: P(t wins subtree n), others[d, t, p, n, u]: P(u wins subtree n)
+    reach = [weight.sum(axis=2)]  # P(reaching r32)
+    while own.shape[-1] > 1:
+        beat_left = np.einsum("dtu,dtpnu->dtpn", beats, others[:, :, :, 0::2])
+        beat_right = np.einsum("dtu,dtpnu->dtpn", beats, others[:, :, :, 1::2])
+        own = own[..., 0::2] * beat_right + own[..., 1::2] * beat_left
+
+        left, right = others[:, :, :, 0::2], others[:, :, :, 1::2]
+        others = (left * np.einsum("dab,dtpnb->dtpna", beats, right)
+                  + right * np.einsum("dab,dtpnb->dtpna", beats, left))
+        reach.append((weight[..., None] * own).sum(axis=(2, 3)))
+
+    return np.stack([np.ones_like(reach[0])] + reach, axis=-1).sum(axis=0)
+
+
+def exact_stage_probabilities(skills, max_draw_prob=0.15):
+    """
+    Exact stage probabilities for fixed skills (48,) or averaged over posterior draws (48, n_draws).
+    Returns a (48, 7) array, rows in WC_TEAMS order, columns in STAGES order:
+    the probability that each stage is the one a team reaches, as in calculate_placements.
+    Draws are processed DRAW_CHUNK at a time, so memory does not grow with n_draws.
+    """
+    skills = _as_draws(skills)
+    reach = sum(_reach_probabilities(skills[start:start + DRAW_CHUNK], max_draw_prob)
+                for start in range(0, len(skills), DRAW_CHUNK)) / len(skills)  # (48, 7)
+    exact = reach - np.append(reach[:, 1:], np.zeros((len(WC_TEAMS), 1)), axis=1)
+    return exact
+
+
+def exact_probability_table(skills, max_draw_prob=0.15, sort_by="WINNER"):
+    """exact_stage_probabilities as a prob_df-style DataFrame, teams as rows."""
+    prob_df = pd.DataFrame(exact_stage_probabilities(skills, max_draw_prob), index=WC_TEAMS, columns=STAGES)
+    if sort_by is not None:
+        prob_df = prob_df.sort_values(sort_by, ascending=False)
+    return prob_df
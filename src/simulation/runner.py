@@ -0,0 +1,89 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from simulation.tournament_format import format_stage_counts, get_format, simulate_format
+from util import instrumentation
+
+# number of tournaments per unit of work. every chunk gets its own seed,
+# so the result only depends on (seed, n, chunk_size), never on the worker count.
+DEFAULT_CHUNK_SIZE = 10_000
+
+
+def _chunk_sizes(n, chunk_size):
+    sizes = [chunk_size] * (n // chunk_size)
+    if n % chunk_size:
+        sizes.append(n % chunk_size)
+    return sizes
+
+
+def _run_chunk(skill_provider, n_sims, seed_seq, keep_stages=False, fmt="world_cup_2026"):
+    """
+    Simulates one chunk with its own generator.
+    Returns (teams, stages) stage counts, or the (n_sims, teams) stage matrix if keep_stages is set.
+    """
+    rng = np.random.default_rng(seed_seq)
+    reached = simulate_format(fmt, skill_provider, n_sims, rng)
+    return reached if keep_stages else format_stage_counts(fmt, reached)
+
+
+def _run_chunk_instrumented(skill_provider, n_sims, seed_seq, keep_stages=False, fmt="world_cup_2026"):
+    """_run_chunk in a worker process under its own Recorder; returns (result, recorder summary)."""
+    with instrumentation.instrument() as recorder:
+        result = _run_chunk(skill_provider, n_sims, seed_seq, keep_stages, fmt)
+    return result, recorder.summary()
+
+
+def run_simulations(skill_provider, n, workers=1, seed=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                    aggregator=None, fmt="world_cup_2026"):
+    """
+    Runs n tournaments with the batched engine, optionally spread over a process pool.
+
+    skill_provider: fixed skills (48,) / (48, n_sims) in WC_TEAMS order, or a callable
+                    (n_sims, rng) -> skills such as a SkillProvider. With workers > 1 it
+                    must be picklable, i.e. not a function defined in a notebook cell.
+    seed:           seed for np.random.SeedSequence, or a SeedSequence. The work is cut into chunks of
+                    chunk_size and each chunk gets a spawned child sequence, so results
+                    are bit-for-bit identical for a given seed whatever the worker count.
+
+    aggregator:     optional PlacementAggregator. If given, every chunk's per-simulation
+                    outcomes are fed to it in chunk order and the aggregator is returned.
+    fmt:            tournament format (see tournament_format.py), by default the 2026 World Cup;
+                    skills are then in fmt.teams order.
+
+    Returns the merged (48, 7) stage counts, rows in WC_TEAMS order, columns in STAGES order
+    (for other formats: fmt.teams x fmt.stages).
+    """
+    fmt = get_format(fmt)
+    sizes = _chunk_sizes(n, chunk_size)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(sizes))
+    providers = [skill_provider] * len(sizes)
+    keep_stages = [aggregator is not None] * len(sizes)
+    formats = [fmt] * len(sizes)
+
+    if workers <= 1 or len(sizes) <= 1:
+        return _merge(map(_run_chunk, providers, sizes, seeds, keep_stages, formats), aggregator, fmt)
+
+    # with instrumentation on, the workers' spans and counters are merged into the caller's
+    run_chunk = _run_chunk_instrumented if instrumentation.enabled() else _run_chunk
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(run_chunk, providers, sizes, seeds, keep_stages, formats,
+                           chunksize=max(1, len(sizes) // (4 * workers)))
+        if run_chunk is _run_chunk_instrumented:
+            results = _merge_stats(results)
+        return _merge(results, aggregator, fmt)
+
+
+def _merge_stats(results):
+    for result, summary in results:
+        instrumentation.merge(summary)
+        yield result
+
+
+def _merge(results, aggregator, fmt):
+    if aggregator is None:
+        return sum(results, np.zeros((len(fmt.teams), len(fmt.stages)), dtype=np.int64))
+    for reached in results:
+        aggregator.update(reached)
+    return aggregator
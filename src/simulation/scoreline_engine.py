@@ -0,0 +1,233 @@
+import math
+import numpy as np
+
+from simulation.best_thirds import lookup_thirds
+from simulation.world_cup_simulation import (
+    GROUP_NAMES, GROUP_PAIRS, STAGES, WC_TEAMS, _SORT4, _r32_batch,
+)
+
+# scoreline-level alternative to the win/draw/loss engine in world_cup_simulation.
+# goal rates follow the attack/defense notebooks:
+#   lambda_home = exp(alpha + attack[home] - defense[away])
+#   lambda_away = exp(alpha + attack[away] - defense[home])
+# goals are independent poisson, truncated at max_goals and renormalized.
+# all matches are on neutral ground (no home advantage term).
+#
+# group tables are ranked by points, goal difference, goals scored, then head-to-head
+# points / goal difference / goals among the teams still level, then drawing of lots.
+# head-to-head is applied once to everyone tied on the first three criteria, not
+# recursively to smaller subsets. best thirds: points, goal difference, goals, lots.
+# knockout draws are decided by a 50/50 penalty shootout.
+
+DEFAULT_MAX_GOALS = 10
+# posterior draws per step when building the (n_draws, 48, 48) knockout win matrix
+KNOCKOUT_DRAW_CHUNK = 64
+
+# bit widths of the packed ranking keys (values are shifted to be non-negative)
+_TIEBREAK_BITS = 16
+
+
+def poisson_pmf(lam, max_goals=DEFAULT_MAX_GOALS):
+    """P(k goals) for k = 0..max_goals, truncated and renormalized. Shape lam.shape + (max_goals + 1,)."""
+    k = np.arange(max_goals + 1)
+    log_fact = np.array([math.lgamma(i + 1) for i in k])
+    lam = np.asarray(lam, dtype=np.float64)[..., None]
+    pmf = np.exp(k * np.log(lam) - lam - log_fact)
+    return pmf / pmf.sum(axis=-1, keepdims=True)
+
+
+def scoreline_tensor(lambda_home, lambda_away, max_goals=DEFAULT_MAX_GOALS):
+    """P(home goals = i, away goals = j), shape lambda.shape + (max_goals + 1, max_goals + 1)."""
+    return poisson_pmf(lambda_home, max_goals)[..., :, None] * poisson_pmf(lambda_away, max_goals)[..., None, :]
+
+
+def knockout_win_probabilities(lambda_a, lambda_b, max_goals=DEFAULT_MAX_GOALS):
+    """
+    P(a beats b) with a 50/50 shootout after a draw, from the two goal pmfs (no scoreline tensor):
+    sum_i pmf_a[i] * P(b scores < i) + 0.5 * sum_i pmf_a[i] * pmf_b[i].
+    """
+    pmf_a, pmf_b = poisson_pmf(lambda_a, max_goals), poisson_pmf(lambda_b, max_goals)
+    below_b = np.cumsum(pmf_b, axis=-1) - pmf_b
+    return (pmf_a * (below_b + 0.5 * pmf_b)).sum(axis=-1)
+
+
+def alias_tables(p):
+    """
+    Walker alias tables for every row of p (rows, cells), built for all rows at once
+    (robin hood: the smallest remaining cell is topped up by the largest one).
+    Sampling a row: cell = floor(u * cells), keep it if frac(u * cells) < prob[cell], else alias[cell].
+    """
+    rows, n_cells = p.shape
+    prob = np.ones_like(p)
+    alias = np.tile(np.arange(n_cells), (rows, 1))
+    r = np.arange(rows)
+    # remaining mass per cell, done cells masked with +inf / -inf for argmin / argmax
+    for_min = p * n_cells
+    for_max = for_min.copy()
+    for _ in range(n_cells - 1):
+        small = for_min.argmin(axis=1)
+        value = for_min[r, small]
+        for_min[r, small] = np.inf
+        for_max[r, small] = -np.inf
+        large = for_max.argmax(axis=1)
+        prob[r, small] = value
+        alias[r, small] = large
+        for_min[r, large] -= 1 - value
+        for_max[r, large] -= 1 - value
+    return prob, alias
+
+
+class ScorelineModel:
+    """
+    Precomputed match distributions for one or many posterior draws.
+
+    attack, defense: (48,) or (48, n_draws) in WC_TEAMS order
+    alpha:           scalar or (n_draws,)
+
+    Per draw it keeps alias tables of the 72 group fixtures' scoreline distributions
+    (n_draws * 72 rows of G*G cells) and the knockout win matrix (n_draws, 48, 48),
+    so simulating never touches a poisson and a scoreline costs one uniform.
+    Each simulated tournament uses one randomly chosen draw for all its matches.
+    """
+
+    def __init__(self, attack, defense, alpha, max_goals=DEFAULT_MAX_GOALS):
+        attack = np.asarray(attack, dtype=np.float64).reshape(len(WC_TEAMS), -1).T  # (D, 48)
+        defense = np.asarray(defense, dtype=np.float64).reshape(len(WC_TEAMS), -1).T
+        alpha = np.broadcast_to(np.asarray(alpha, dtype=np.float64), attack.shape[:1])[:, None]
+        self.n_draws = attack.shape[0]
+        self.max_goals = max_goals
+
+        # group fixtures: flat team indices of the 72 (home, away) pairs
+        home = np.array([4 * g + i for g in range(len(GROUP_NAMES)) for i, _ in GROUP_PAIRS])
+        away = np.array([4 * g + j for g in range(len(GROUP_NAMES)) for _, j in GROUP_PAIRS])
+        self.fixtures = np.stack([home, away])
+        tensor = scoreline_tensor(
+            np.exp(alpha + attack[:, home] - defense[:, away]),
+            np.exp(alpha + attack[:, away] - defense[:, home]),
+            max_goals,
+        )
+        self.group_prob, self.group_alias = alias_tables(tensor.reshape(self.n_draws * len(home), -1))
+
+        # knockouts: P(a beats b) including penalties, all ordered pairs, KNOCKOUT_DRAW_CHUNK draws at a time
+        self.knockout_win = np.empty((self.n_draws, len(WC_TEAMS), len(WC_TEAMS)))
+        for start in range(0, self.n_draws, KNOCKOUT_DRAW_CHUNK):
+            d = slice(start, start + KNOCKOUT_DRAW_CHUNK)
+            self.knockout_win[d] = knockout_win_probabilities(
+                np.exp(alpha[d, :, None] + attack[d, :, None] - defense[d, None, :]),
+                np.exp(alpha[d, :, None] + attack[d, None, :] - defense[d, :, None]),
+                max_goals,
+            )
+
+    def sample_group_scores(self, draws, rng):
+        """
+        Samples all 72 group scorelines for every simulation.
+        draws: (n_sims,) posterior draw per simulation. Returns home and away goals, each (72, n_sims).
+        """
+        n_fixtures = self.fixtures.shape[1]
+        n_cells = self.group_prob.shape[1]
+        rows = draws[None, :] * n_fixtures + np.arange(n_fixtures)[:, None]
+        u = rng.random(rows.shape) * n_cells
+        cell = u.astype(np.int64)
+        cell = np.where(u - cell < self.group_prob[rows, cell], cell, self.group_alias[rows, cell])
+        return np.divmod(cell, self.max_goals + 1)
+
+    def simulate_stages(self, n_sims, rng=None):
+        """Same output as simulate_stages_batch: (n_sims, 48) uint8 indices into STAGES."""
+        rng = np.random.default_rng() if rng is None else rng
+        draws = rng.integers(self.n_draws, size=n_sims)
+        home_goals, away_goals = self.sample_group_scores(draws, rng)
+
+        standings, table = _rank_groups(home_goals, away_goals, self.max_goals, rng)
+        best_thirds = _best_thirds(standings, table, self.max_goals, rng)
+        teams = _r32_batch(standings, best_thirds)
+
+        reached = np.zeros((n_sims, len(WC_TEAMS)), dtype=np.uint8)
+        sims = np.arange(n_sims)
+        for stage in range(1, len(STAGES)):
+            reached[sims, teams] = stage
+            if stage < len(STAGES) - 1:
+                t1, t2 = teams[0::2], teams[1::2]
+                p1 = self.knockout_win[draws, t1, t2]
+                teams = np.where(rng.random(p1.shape) < p1, t1, t2)
+        return reached
+
+
+def _pack(fields, index, index_bits, rng):
+    """
+    Packs non-negative (value, bits) fields, most significant first, then a random
+    tie-breaker and the index into one int64 key per entry.
+    """
+    key = np.zeros(np.shape(fields[0][0]), dtype=np.int64)
+    for value, bits in fields:
+        key = (key << bits) | value.astype(np.int64)
+    tiebreak = rng.integers(0, 1 << _TIEBREAK_BITS, size=key.shape, dtype=np.int64)
+    return (((key << _TIEBREAK_BITS) | tiebreak) << index_bits) | index
+
+
+def _rank_groups(home_goals, away_goals, max_goals, rng):
+    """
+    Builds the group tables and ranks them.
+    Returns standings (4, 12, n_sims) as team indices with position first, and
+    (points, goal_difference, goals_for) of those teams in the same layout.
+    """
+    n_groups, n_sims = len(GROUP_NAMES), home_goals.shape[1]
+    gf = np.zeros((n_groups, 4, n_sims), dtype=np.int64)
+    ga = np.zeros_like(gf)
+    pts = np.zeros_like(gf)
+    # head-to-head results: h2h_*[g, i, j] = what i got against j
+    h2h_pts = np.zeros((n_groups, 4, 4, n_sims), dtype=np.int64)
+    h2h_gd = np.zeros_like(h2h_pts)
+    h2h_gf = np.zeros_like(h2h_pts)
+    hg = home_goals.reshape(n_groups, len(GROUP_PAIRS), n_sims)
+    ag = away_goals.reshape(n_groups, len(GROUP_PAIRS), n_sims)
+
+    for m, (i, j) in enumerate(GROUP_PAIRS):
+        h, a = hg[:, m], ag[:, m]
+        gf[:, i] += h
+        ga[:, i] += a
+        gf[:, j] += a
+        ga[:, j] += h
+        p_home = 3 * (h > a) + (h == a)
+        p_away = 3 * (a > h) + (h == a)
+        pts[:, i] += p_home
+        pts[:, j] += p_away
+        h2h_pts[:, i, j], h2h_pts[:, j, i] = p_home, p_away
+        h2h_gd[:, i, j], h2h_gd[:, j, i] = h - a, a - h
+        h2h_gf[:, i, j], h2h_gf[:, j, i] = h, a
+
+    gd = gf - ga
+    max_gd = 3 * max_goals  # also the most goals a team can score in its 3 matches
+    primary = (pts * (2 * max_gd + 1) + gd + max_gd) * (max_gd + 1) + gf
+    level = primary[:, :, None] == primary[:, None, :]  # (12, 4, 4, n_sims), diagonal included
+    mini_pts = (h2h_pts * level).sum(axis=2)
+    mini_gd = (h2h_gd * level).sum(axis=2)
+    mini_gf = (h2h_gf * level).sum(axis=2)
+
+    gd_bits = int(2 * max_gd).bit_length()
+    gf_bits = int(max_gd).bit_length()
+    keys = _pack([
+        (pts, 4), (gd + max_gd, gd_bits), (gf, gf_bits),
+        (mini_pts, 4), (mini_gd + max_gd, gd_bits), (mini_gf, gf_bits),
+    ], np.arange(4)[None, :, None], 2, rng)
+
+    keys = list(keys.transpose(1, 0, 2))  # position-major, like the win/draw/loss engine
+    for a, b in _SORT4:
+        keys[a], keys[b] = np.maximum(keys[a], keys[b]), np.minimum(keys[a], keys[b])
+    local = np.stack(keys) & 3  # (4, 12, n_sims)
+
+    group_of = np.arange(n_groups)[None, :, None]
+    standings = local + 4 * group_of
+    table = tuple(np.take_along_axis(v.transpose(1, 0, 2), local, axis=0) for v in (pts, gd, gf))
+    return standings, table
+
+
+def _best_thirds(standings, table, max_goals, rng):
+    """The 8 best thirds by points, goal difference, goals, lots; in r32 slot order, shape (8, n_sims)."""
+    pts, gd, gf = (v[2] for v in table)
+    max_gd = 3 * max_goals
+    keys = _pack([(pts, 4), (gd + max_gd, int(2 * max_gd).bit_length()), (gf, int(max_gd).bit_length())],
+                 np.arange(len(GROUP_NAMES))[:, None], 4, rng)
+    best_groups = np.sort(keys.T, axis=1)[:, -8:] & 15
+    masks = np.bitwise_or.reduce(1 << best_groups, axis=1)
+    slot_groups = lookup_thirds(masks).T.astype(np.int64)
+    return np.take_along_axis(standings[2], slot_groups, axis=0)
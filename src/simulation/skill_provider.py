@@ -0,0 +1,83 @@
+import numpy as np
+
+from simulation.world_cup_simulation import WC_TEAMS
+
+
+class SkillProvider:
+    """
+    Precomputed skills of the World Cup teams, one row per posterior draw.
+
+    skills[d, i] is the skill of WC_TEAMS[i] in draw d, so a tournament is simulated by
+    picking one row and indexing it, instead of rebuilding arrays on every skill_func call.
+    Instances are callable as (n_sims, rng) -> (48, n_sims) skills, which is what
+    simulate_stages_batch and run_simulations accept.
+    """
+
+    def __init__(self, skills, teams=WC_TEAMS):
+        self.teams = list(teams)
+        self.team_index = {team: i for i, team in enumerate(self.teams)}
+        self.skills = np.atleast_2d(np.asarray(skills, dtype=np.float64))
+        if self.skills.shape[1] != len(self.teams):
+            raise ValueError(f"expected {len(self.teams)} skill columns, got {self.skills.shape[1]}")
+
+    @property
+    def n_draws(self):
+        return self.skills.shape[0]
+
+    @classmethod
+    def from_samples(cls, samples, team_to_idx, teams=WC_TEAMS):
+        """From posterior skill samples (n_draws, n_teams) indexed by team_to_idx, e.g. the Elo model."""
+        samples = np.atleast_2d(np.asarray(samples, dtype=np.float64))
+        return cls(samples[:, _columns(team_to_idx, teams)], teams)
+
+    @classmethod
+    def from_posterior(cls, attack, defense, team_to_idx, attack_prior=None, defense_prior=None,
+                       shrinkage=0.0, teams=WC_TEAMS):
+        """
+        From attack/defense posterior samples (n_draws, n_teams), as in the attack/defense notebooks:
+        both are shrunk toward the prior dicts (missing teams default to 0.5), and
+        skill = adjusted attack - mean adjusted defense over all teams of the same draw.
+        """
+        attack = np.atleast_2d(np.asarray(attack, dtype=np.float64))
+        defense = np.atleast_2d(np.asarray(defense, dtype=np.float64))
+        names = sorted(team_to_idx, key=team_to_idx.get)
+
+        if shrinkage:
+            attack = attack * (1 - shrinkage) + _prior_array(attack_prior, names) * shrinkage
+            defense = defense * (1 - shrinkage) + _prior_array(defense_prior, names) * shrinkage
+
+        skills = attack[:, _columns(team_to_idx, teams)] - defense.mean(axis=1, keepdims=True)
+        return cls(skills, teams)
+
+    def sample(self, n_sims, rng=None):
+        """One random draw per simulation, returned as (48, n_sims)."""
+        rng = np.random.default_rng() if rng is None else rng
+        return self.skills[rng.integers(self.n_draws, size=n_sims)].T
+
+    def __call__(self, n_sims, rng):
+        return self.sample(n_sims, rng)
+
+    def mean(self):
+        """Posterior mean skill per team, (48,)."""
+        return self.skills.mean(axis=0)
+
+    def skill_func(self, rng=None):
+        """
+        Scalar skill function for the per-match simulate_world_cup path.
+        One draw is picked per call, so all matches of a tournament use consistent skills.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        row = self.skills[rng.integers(self.n_draws)]
+        return lambda team: row[self.team_index[team]]
+
+
+def _columns(team_to_idx, teams):
+    missing = [team for team in teams if team not in team_to_idx]
+    if missing:
+        raise ValueError(f"teams missing from the model: {missing}")
+    return np.array([team_to_idx[team] for team in teams])
+
+
+def _prior_array(prior, names):
+    prior = prior or {}
+    return np.array([prior.get(team, 0.5) for team in names])
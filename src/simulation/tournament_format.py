@@ -0,0 +1,332 @@
+import re
+import numpy as np
+
+from simulation.best_thirds import (
+    THIRDS_CSV, THIRD_SLOTS, derived_thirds_rows, load_thirds_table, thirds_table,
+)
+from simulation.world_cup_simulation import (
+    R32_SLOTS, _SORT4, _pack_keys, _random_tiebreak, _unpack_points, groups, match_probabilities, stage_counts,
+)
+from util import instrumentation
+
+# declarative tournament formats, compiled once into index arrays and run by one generic
+# vectorized executor (the batched engine of world_cup_simulation is the 2026 spec run here).
+#
+# a spec is a dict:
+#   name:        identifier
+#   groups:      {group name: [teams]}, all groups the same size. round robin, every pair
+#                plays once; tables are ranked by points, ties broken by drawing lots.
+#   best_thirds: optional. the best `count` teams ranked `position` (default 3) across the
+#                groups also qualify (points, then lots). `slots` lists for each of their
+#                bracket slots the group names whose team may be placed there; which group
+#                goes to which slot is fixed per combination of advancing groups, read from
+#                `table` (csv as in best_thirds.py) or else derived as the first assignment
+#                that respects the slots.
+#   bracket:     the first knockout round as slot references, adjacent entries play each
+#                other and the winners of adjacent matches meet in the next round:
+#                "1A" winner of group A, "2B" runner-up of group B, "3.1" first best-thirds slot
+#                (<position><group name>, so group names may be longer than one letter).
+#
+# compile_format turns a spec into a TournamentFormat: the fixture pairs within a group, a
+# sorting network for the tables, the lookup table from advancing-groups mask to slot groups,
+# and one gather index from [all group standings, best-thirds slots] into the bracket. a
+# new format is data only: the executor's loops run over these arrays (fixtures,
+# comparators, rounds), never over teams or simulations.
+
+ROUND_NAMES = {64: "R64", 32: "R32", 16: "R16", 8: "QF", 4: "SF", 2: "F"}
+
+WORLD_CUP_2026 = {
+    "name": "world_cup_2026",
+    "groups": groups,
+    "best_thirds": {"count": 8, "slots": THIRD_SLOTS, "table": THIRDS_CSV},
+    "bracket": [f"3.{pos + 1}" if group == "3rd" else f"{pos + 1}{group}" for group, pos in R32_SLOTS],
+}
+
+# the 2026 spec reads fifa's annex table (or the derived fallback, see best_thirds.py). the
+# third-place slot tables of the formats below are derived from the slots; the official
+# tables assign some combinations differently.
+EURO_2024 = {
+    "name": "euro_2024",
+    "groups": {
+        "A": ["germany", "scotland", "hungary", "switzerland"],
+        "B": ["spain", "croatia", "italy", "albania"],
+        "C": ["slovenia", "denmark", "serbia", "england"],
+        "D": ["poland", "netherlands", "austria", "france"],
+        "E": ["belgium", "slovakia", "romania", "ukraine"],
+        "F": ["turkey", "georgia", "portugal", "czech republic"],
+    },
+    "best_thirds": {"count": 4, "slots": ["ADEF", "ABC", "DEF", "ABCD"]},
+    "bracket": ["1B", "3.1", "1A", "2C", "1F", "3.2", "2D", "2E",
+                "1C", "3.3", "2A", "2B", "1E", "3.4", "1D", "2F"],
+}
+
+COPA_AMERICA_2024 = {
+    "name": "copa_america_2024",
+    "groups": {
+        "A": ["argentina", "peru", "chile", "canada"],
+        "B": ["mexico", "ecuador", "venezuela", "jamaica"],
+        "C": ["united states", "uruguay", "panama", "bolivia"],
+        "D": ["brazil", "colombia", "paraguay", "costa rica"],
+    },
+    "bracket": ["1A", "2B", "1B", "2A", "1C", "2D", "1D", "2C"],
+}
+
+AFCON_2023 = {
+    "name": "afcon_2023",
+    "groups": {
+        "A": ["equatorial guinea", "nigeria", "ivory coast", "guinea-bissau"],
+        "B": ["cape verde", "egypt", "ghana", "mozambique"],
+        "C": ["senegal", "cameroon", "guinea", "gambia"],
+        "D": ["angola", "burkina faso", "mauritania", "algeria"],
+        "E": ["mali", "south africa", "namibia", "tunisia"],
+        "F": ["morocco", "dr congo", "zambia", "tanzania"],
+    },
+    "best_thirds": {"count": 4, "slots": ["BEF", "ACD", "ABF", "CDE"]},
+    "bracket": ["2A", "2C", "1D", "3.1", "1B", "3.2", "1F", "2E",
+                "1E", "2D", "1C", "3.3", "2B", "2F", "1A", "3.4"],
+}
+
+FORMATS = {spec["name"]: spec for spec in (WORLD_CUP_2026, EURO_2024, COPA_AMERICA_2024, AFCON_2023)}
+
+
+class TournamentFormat:
+    """
+    A compiled spec (see compile_format). Teams are indexed group by group in spec order,
+    stages are GROUPS, one per knockout round (named by the number of teams left) and WINNER.
+    """
+
+    def __init__(self, name, teams, group_names, pairs, network, thirds, slot_rows, stages):
+        self.name = name
+        self.teams = teams
+        self.team_index = {team: i for i, team in enumerate(teams)}
+        self.group_names = group_names
+        self.n_groups = len(group_names)
+        self.group_size = len(teams) // len(group_names)
+        self.pairs = pairs          # (fixtures per group, 2) positions within a group
+        self.network = network      # compare-exchange pairs sorting one group table
+        self.thirds = thirds        # None or (position index, count, (2^groups, count) lookup table)
+        self.slot_rows = slot_rows  # bracket slot -> row of [standings (position-major), thirds]
+        self.stages = stages
+        self.n_group_matches = len(pairs) * self.n_groups
+        self.n_match_uniforms = self.n_group_matches + len(slot_rows) - 1
+
+    def __repr__(self):
+        return f"TournamentFormat({self.name!r}, {len(self.teams)} teams, stages {self.stages})"
+
+
+def _sorting_network(n):
+    """Compare-exchange pairs that sort n elements (odd-even transposition, optimal for 4)."""
+    if n == 4:
+        return list(_SORT4)
+    return [(i, i + 1) for step in range(n) for i in range(step % 2, n - 1, 2)]
+
+
+def _thirds_table(group_names, best_thirds):
+    """(2^groups, count) lookup: mask of advancing groups -> group index per slot, -1 if impossible."""
+    count, slots = best_thirds["count"], best_thirds["slots"]
+    if len(slots) != count:
+        raise ValueError(f"best_thirds: {count} teams but {len(slots)} slots")
+    if best_thirds.get("table"):
+        return load_thirds_table(best_thirds["table"], group_names, slots)
+    return thirds_table(derived_thirds_rows(group_names, slots), group_names, slots)
+
+
+def compile_format(spec):
+    """Compiles a spec dict (see the module comment) into a TournamentFormat."""
+    group_names = list(spec["groups"])
+    if any(not g or g[0].isdigit() for g in group_names):
+        raise ValueError(f"{spec['name']}: group names must not be empty or start with a digit, got {group_names}")
+    sizes = {len(teams) for teams in spec["groups"].values()}
+    if len(sizes) != 1:
+        raise ValueError(f"{spec['name']}: groups must have the same size, got {sorted(sizes)}")
+    size = sizes.pop()
+    teams = [team for names in spec["groups"].values() for team in names]
+    if len(set(teams)) != len(teams):
+        raise ValueError(f"{spec['name']}: a team is in several groups")
+
+    thirds = None
+    best_thirds = spec.get("best_thirds")
+    if best_thirds:
+        position = best_thirds.get("position", 3) - 1
+        thirds = (position, best_thirds["count"], _thirds_table(group_names, best_thirds))
+
+    # rows of the pool [standings (size * n_groups, position-major), best-thirds slots]
+    bracket = spec["bracket"]
+    if len(bracket) < 2 or len(bracket) & (len(bracket) - 1):
+        raise ValueError(f"{spec['name']}: the bracket needs a power of two slots, got {len(bracket)}")
+    slot_rows = []
+    for ref in bracket:
+        third = re.fullmatch(r"3\.(\d+)", ref)
+        if third:
+            k = int(third[1]) - 1
+            if thirds is None or not 0 <= k < thirds[1]:
+                raise ValueError(f"{spec['name']}: bad bracket reference {ref!r}, no best-thirds slot {k + 1}")
+            slot_rows.append(size * len(group_names) + k)
+            continue
+        # <position><group name>
+        standing = re.fullmatch(r"(\d+)(.+)", ref)
+        if standing is None or standing[2] not in group_names or not 1 <= int(standing[1]) <= size:
+            raise ValueError(f"{spec['name']}: bad bracket reference {ref!r}")
+        slot_rows.append((int(standing[1]) - 1) * len(group_names) + group_names.index(standing[2]))
+    if len(set(slot_rows)) != len(slot_rows):
+        raise ValueError(f"{spec['name']}: a bracket slot is referenced twice")
+
+    rounds = [ROUND_NAMES.get(n, f"R{n}") for n in (len(bracket) >> i for i in range(len(bracket).bit_length() - 1))]
+    pairs = np.array([(i, j) for i in range(size) for j in range(size) if i < j])
+    return TournamentFormat(spec["name"], teams, group_names, pairs, _sorting_network(size), thirds,
+                            np.array(slot_rows), ["GROUPS"] + rounds + ["WINNER"])
+
+
+_compiled = {}
+
+
+def get_format(fmt):
+    """TournamentFormat from a built-in name, a spec dict or a TournamentFormat; built-ins compile once."""
+    if isinstance(fmt, TournamentFormat):
+        return fmt
+    if isinstance(fmt, dict):
+        return compile_format(fmt)
+    if fmt not in _compiled:
+        _compiled[fmt] = compile_format(FORMATS[fmt])
+    return _compiled[fmt]
+
+
+# ============================================================
+# EXECUTOR
+# ============================================================
+def _skill_matrix(skills, n_teams, n_sims):
+    """skills as (n_teams, n_sims), or (n_teams, 1) if all simulations share them."""
+    skills = np.asarray(skills, dtype=np.float64)
+    if skills.shape == (n_teams,):
+        return skills[:, None]
+    if skills.shape == (n_teams, n_sims):
+        return skills
+    raise ValueError(f"skills must have shape ({n_teams},) or ({n_teams}, n_sims), got {skills.shape}")
+
+
+# group fixture outcomes for pinned results: first team wins, draw, second team wins
+WIN, DRAW, LOSS = 0, 1, 2
+
+
+def _group_tables(fmt, s, r, tiebreak, pinned=None, max_draw_prob=0.15):
+    """
+    Plays the round robins of some groups and ranks them.
+    s:        skills (groups, group_size, n_sims or 1)
+    r:        match uniforms (fixtures, groups, n_sims)
+    tiebreak: random tie-breakers (group_size, groups, n_sims), see _random_tiebreak
+    pinned:   optional (fixtures, groups) outcome per fixture, WIN / DRAW / LOSS or -1 to simulate
+    Returns the tables as positions within the group (position, groups, n_sims) and their points.
+    """
+    points = np.zeros(tiebreak.shape, dtype=np.int64)
+    for m, (i, j) in enumerate(fmt.pairs):
+        p1, p_draw = match_probabilities(s[:, i] - s[:, j], max_draw_prob)
+        win1 = r[m] < p1
+        draw = (r[m] < p1 + p_draw) & ~win1
+        if pinned is not None and (pinned[m] >= 0).any():
+            fixed = pinned[m][:, None]
+            win1 = np.where(fixed >= 0, fixed == WIN, win1)
+            draw = np.where(fixed >= 0, fixed == DRAW, draw)
+        points[i] += 3 * win1 + draw
+        points[j] += 3 * ~(win1 | draw) + draw
+
+    # sort by points, random order among ties (same as shuffle + stable sort)
+    with instrumentation.span("standings"):
+        bits = max(1, (fmt.group_size - 1).bit_length())
+        index = np.arange(fmt.group_size)[:, None, None]
+        keys = list(_pack_keys(points, index, bits, None, tiebreak))
+        for a, b in fmt.network:
+            keys[a], keys[b] = np.maximum(keys[a], keys[b]), np.minimum(keys[a], keys[b])
+        keys = np.stack(keys)
+    return keys & ((1 << bits) - 1), _unpack_points(keys, bits)
+
+
+def _group_stage(fmt, skills, n_sims, rng, r=None):
+    """
+    Plays every group fixture of every simulation. r: optional uniforms (fixtures, groups, n_sims).
+    Returns the standings as team indices (position, group, n_sims) and the matching points.
+    """
+    if r is None:
+        r = rng.random((len(fmt.pairs), fmt.n_groups, n_sims))
+    tiebreak = _random_tiebreak((fmt.group_size, fmt.n_groups, n_sims), rng)
+    positions, points = _group_tables(fmt, skills.reshape(fmt.n_groups, fmt.group_size, -1), r, tiebreak)
+    return positions + fmt.group_size * np.arange(fmt.n_groups)[None, :, None], points
+
+
+def _best_thirds(fmt, standings, points, rng, tiebreak=None):
+    """
+    The qualifying teams of the thirds' position in their slot order (random among ties), (count, n_sims).
+    tiebreak: optional (groups, n_sims) tie-breakers instead of drawing them from rng.
+    """
+    position, count, table = fmt.thirds
+    bits = max(1, (fmt.n_groups - 1).bit_length())
+    keys = _pack_keys(points[position], np.arange(fmt.n_groups)[:, None], bits, rng, tiebreak)
+    best_groups = np.sort(keys.T, axis=1)[:, -count:] & ((1 << bits) - 1)
+    masks = np.bitwise_or.reduce(1 << best_groups, axis=1)
+    return np.take_along_axis(standings[position], table[masks].T, axis=0)
+
+
+def _knockout_round(teams, skills, rng, u=None):
+    """Plays one knockout round; teams (2k, n_sims) -> winners (k, n_sims). u: optional (k, n_sims) uniforms."""
+    t1, t2 = teams[0::2], teams[1::2]
+    if skills.shape[1] == 1:
+        s1, s2 = skills[t1, 0], skills[t2, 0]
+    else:
+        s1, s2 = np.take_along_axis(skills, t1, axis=0), np.take_along_axis(skills, t2, axis=0)
+    p1, _ = match_probabilities(s1 - s2, max_draw_prob=0)
+    if u is None:
+        u = rng.random(p1.shape)
+    return np.where(u < p1, t1, t2)
+
+
+def simulate_format(fmt, skills, n_sims, rng=None, uniforms=None):
+    """
+    Simulates n_sims tournaments of a format (TournamentFormat, spec dict or built-in name).
+    skills:   (n_teams,) or (n_teams, n_sims) array in fmt.teams order,
+              or a callable (n_sims, rng) -> such an array, e.g. a SkillProvider over fmt.teams.
+    uniforms: optional (fmt.n_match_uniforms, n_sims) array deciding the match outcomes
+              (group matches fixture-major, then the knockout rounds in bracket order).
+              tie-breaks still come from rng.
+    Returns a (n_sims, n_teams) uint8 matrix with the index into fmt.stages each team reached.
+    """
+    fmt = get_format(fmt)
+    n_teams = len(fmt.teams)
+    with instrumentation.span("simulate_format"):
+        rng = np.random.default_rng() if rng is None else rng
+        if callable(skills):
+            with instrumentation.span("skill_draws"):
+                skills = skills(n_sims, rng)
+            instrumentation.count("skill_draws", n_sims)
+        skills = _skill_matrix(skills, n_teams, n_sims)
+
+        group_u, knockout_u = None, None
+        if uniforms is not None:
+            group_u = uniforms[:fmt.n_group_matches].reshape(len(fmt.pairs), fmt.n_groups, n_sims)
+            knockout_u = uniforms[fmt.n_group_matches:]
+
+        with instrumentation.span("group_stage"):
+            standings, points = _group_stage(fmt, skills, n_sims, rng, group_u)
+        with instrumentation.span("best_thirds"):
+            pool = standings.reshape(-1, n_sims)
+            if fmt.thirds is not None:
+                pool = np.concatenate([pool, _best_thirds(fmt, standings, points, rng)])
+            teams = pool[fmt.slot_rows]
+
+        reached = np.zeros((n_sims, n_teams), dtype=np.uint8)
+        sims = np.arange(n_sims)
+        for stage in range(1, len(fmt.stages)):
+            reached[sims, teams] = stage
+            if stage < len(fmt.stages) - 1:
+                u = None
+                if knockout_u is not None:
+                    u, knockout_u = knockout_u[:len(teams) // 2], knockout_u[len(teams) // 2:]
+                with instrumentation.span(fmt.stages[stage]):
+                    teams = _knockout_round(teams, skills, rng, u)
+
+    instrumentation.count("tournaments", n_sims)
+    instrumentation.count("matches_simulated", n_sims * fmt.n_match_uniforms)
+    return reached
+
+
+def format_stage_counts(fmt, reached):
+    """Counts how often each team reached each stage. Returns a (n_teams, n_stages) int64 array."""
+    return stage_counts(reached, len(get_format(fmt).stages))
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+
+from simulation.runner import DEFAULT_CHUNK_SIZE, _chunk_sizes
+from simulation.world_cup_simulation import N_MATCH_UNIFORMS, STAGES, WC_TEAMS, simulate_stages_batch
+
+# variance reduction for the batched engine.
+#
+# every match outcome of a tournament is decided by one uniform (N_MATCH_UNIFORMS per
+# tournament), so the uniforms can be generated up front:
+#   "mc"          independent uniforms
+#   "antithetic"  tournaments come in pairs u, 1 - u: a favourite that wins in one
+#                 tournament of the pair tends to lose in the other
+#   "sobol"       scrambled sobol points (needs scipy), in n_replicates independent
+#                 scramblings so the standard error can be estimated
+#
+# common random numbers: a seed is split into separate streams for the match uniforms,
+# the skill draws and the tie-breaks. two models run with the same seed therefore see
+# the same uniforms for every match, and compare_models can report paired differences
+# whose standard errors are much smaller than those of two independent runs.
+#
+# standard errors are computed over independent units: single tournaments (mc),
+# antithetic pairs, or sobol replicates.
+
+METHODS = ("mc", "antithetic", "sobol")
+DEFAULT_REPLICATES = 16
+
+
+class StageEstimate:
+    """Stage probabilities (48, 7) with their standard errors and the number of tournaments used."""
+
+    def __init__(self, prob, se, n_sims, teams=WC_TEAMS, stages=STAGES):
+        self.prob = prob
+        self.se = se
+        self.n_sims = n_sims
+        self.teams = list(teams)
+        self.stages = list(stages)
+
+    def to_dataframe(self, sort_by="WINNER"):
+        """prob_df as in the notebooks, plus one '<stage>_se' column per stage."""
+        prob_df = pd.DataFrame(self.prob, index=self.teams, columns=self.stages)
+        se_df = pd.DataFrame(self.se, index=self.teams, columns=[f"{s}_se" for s in self.stages])
+        prob_df = pd.concat([prob_df, se_df], axis=1)
+        if sort_by is not None:
+            prob_df = prob_df.sort_values(sort_by, ascending=False)
+        return prob_df
+
+
+def crn_streams(seed=None):
+    """Independent generators for (match uniforms, skill draws, tie-breaks) from one seed."""
+    return tuple(np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(3))
+
+
+def match_uniforms(n_sims, method="mc", rng=None, sobol_engine=None):
+    """
+    (N_MATCH_UNIFORMS, n_sims) uniforms for simulate_stages_batch.
+    antithetic needs an even n_sims: column i + n_sims / 2 mirrors column i.
+    sobol takes the next n_sims points of sobol_engine (a scipy.stats.qmc.Sobol).
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    if method == "mc":
+        return rng.random((N_MATCH_UNIFORMS, n_sims))
+    if method == "antithetic":
+        if n_sims % 2:
+            raise ValueError("antithetic sampling needs an even number of simulations")
+        u = rng.random((N_MATCH_UNIFORMS, n_sims // 2))
+        return np.concatenate([u, 1 - u], axis=1)
+    if method == "sobol":
+        sobol_engine = sobol_engine if sobol_engine is not None else sobol(rng)
+        return sobol_engine.random(n_sims).T
+    raise ValueError(f"unknown method {method!r}, expected one of {METHODS}")
+
+
+def sobol(rng):
+    """Scrambled sobol engine over the match uniforms."""
+    try:
+        from scipy.stats import qmc
+    except ImportError as e:
+        raise ImportError("method='sobol' requires scipy") from e
+    return qmc.Sobol(d=N_MATCH_UNIFORMS, scramble=True, seed=rng)
+
+
+def _one_hot(reached):
+    """(n_sims, 48) stage indices -> (n_sims, 48, 7) indicators."""
+    return np.eye(len(STAGES), dtype=np.float64)[reached]
+
+
+def _units(reached, method):
+    """Per-unit stage indicators of one chunk: single tournaments, or antithetic pair means."""
+    x = _one_hot(reached)
+    if method == "antithetic":
+        half = x.shape[0] // 2
+        x = (x[:half] + x[half:]) / 2
+    return x
+
+
+def _chunks(n_sims, method, chunk_size, n_replicates, rngs):
+    """
+    Yields (replicate, size, uniforms) per chunk. Sobol chunks of a replicate are
+    consecutive points of the same scrambled sequence.
+    """
+    uniform_rng = rngs[0]
+    if method == "sobol":
+        if n_sims % n_replicates:
+            raise ValueError("n_sims must be a multiple of n_replicates for method='sobol'")
+        for r in range(n_replicates):
+            engine = sobol(uniform_rng)
+            for size in _chunk_sizes(n_sims // n_replicates, chunk_size):
+                yield r, size, match_uniforms(size, method, sobol_engine=engine)
+        return
+    if method == "antithetic":
+        chunk_size += chunk_size % 2
+    for size in _chunk_sizes(n_sims, chunk_size):
+        yield None, size, match_uniforms(size, method, uniform_rng)
+
+
+def _simulate(skills, size, uniforms, rngs):
+    _, skill_rng, tiebreak_rng = rngs
+    if callable(skills):
+        skills = skills(size, skill_rng)
+    return simulate_stages_batch(skills, size, tiebreak_rng, uniforms=uniforms)
+
+
+def _estimate(models, n_sims, method, seed, n_replicates, chunk_size):
+    """
+    Runs every model on the same random streams and returns the mean and standard error
+    of the unit values sum(weight * indicator) over models, weights given in models.
+    """
+    # one seed sequence for all models: with seed=None every crn_streams(None) would draw
+    # its own entropy and the models would no longer share their random numbers
+    seed = np.random.SeedSequence(seed).entropy
+    streams = [crn_streams(seed) for _ in models]
+    total = np.zeros((len(WC_TEAMS), len(STAGES)))
+    total_sq = np.zeros_like(total)
+    replicate = np.zeros_like(total)
+    n_units = 0
+
+    chunks = [_chunks(n_sims, method, chunk_size, n_replicates, rngs) for rngs in streams]
+    current = None
+    for parts in zip(*chunks):
+        r, size, _ = parts[0]
+        x = sum(weight * _units(_simulate(skills, size, u, rngs), method)
+                for (skills, weight), (_, _, u), rngs in zip(models, parts, streams))
+        if method == "sobol":
+            if current is not None and r != current:
+                total += replicate
+                total_sq += replicate ** 2
+                replicate[:] = 0
+                n_units += 1
+            current = r
+            replicate += x.sum(axis=0) / (n_sims // n_replicates)
+        else:
+            total += x.sum(axis=0)
+            total_sq += (x ** 2).sum(axis=0)
+            n_units += x.shape[0]
+    if method == "sobol":
+        total += replicate
+        total_sq += replicate ** 2
+        n_units += 1
+
+    mean = total / n_units
+    var = np.maximum(total_sq / n_units - mean ** 2, 0) * n_units / max(n_units - 1, 1)
+    return mean, np.sqrt(var / n_units)
+
+
+def simulate_with_errors(skills, n_sims, method="mc", seed=None, n_replicates=DEFAULT_REPLICATES,
+                         chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stage probabilities of every team with standard errors.
+    skills: as for simulate_stages_batch (array or callable provider).
+    For method="sobol", n_sims is split into n_replicates scramblings; powers of two
+    per replicate give the best balance.
+    """
+    prob, se = _estimate([(skills, 1.0)], n_sims, method, seed, n_replicates, chunk_size)
+    return StageEstimate(prob, se, n_sims)
+
+
+def compare_models(skills_a, skills_b, n_sims, method="mc", seed=None, n_replicates=DEFAULT_REPLICATES,
+                   chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Difference of stage probabilities, model a minus model b, under common random numbers.
+    Both models are simulated with the same match uniforms and tie-breaks, and the standard
+    error is that of the paired difference.
+    """
+    diff, se = _estimate([(skills_a, 1.0), (skills_b, -1.0)], n_sims, method, seed, n_replicates, chunk_size)
+    return StageEstimate(diff, se, n_sims)
@@ -0,0 +1,269 @@
+import copy
+import numpy as np
+
+from simulation.aggregation import PlacementAggregator
+from simulation.tournament_format import (
+    DRAW, LOSS, WIN, _best_thirds, _group_tables, _knockout_round, _skill_matrix, get_format,
+)
+from simulation.world_cup_simulation import _random_tiebreak
+from util import instrumentation
+
+# live / what-if simulation: known or hypothetical results are pinned and only the
+# unresolved matches are simulated.
+#
+#   live = WhatIf(provider, n_sims=50_000, seed=0)
+#   live.set_result("mexico", "south africa", "mexico")      # after the opening match
+#   live.probabilities()
+#   live.what_if([("austria", "argentina", "austria")]).probabilities()
+#
+# every random number of the n_sims tournaments (skills, match uniforms, tie-breaks) is
+# drawn once up front, so a group's simulated tables depend only on the pins inside that
+# group. they are cached per (group, pins): after a match only its group is played again
+# and the other groups reuse their arrays. downstream, only the simulations whose group
+# tables changed get new best thirds and knockout rounds, the rest keep the outcome of the
+# last cached scenario with the same knockout pins. the common random numbers also make
+# scenarios directly comparable: the difference between two tables comes from the pins,
+# not from sampling noise.
+# without pins the result is bit-identical to simulate_format with the same seed.
+
+DEFAULT_N_SIMS = 50_000
+
+# cached per-group tables and full outcomes kept per instance family (oldest dropped first)
+MAX_CACHED_GROUPS = 512
+MAX_CACHED_OUTCOMES = 16
+
+
+def _remember(cache, key, value, limit):
+    cache[key] = value
+    while len(cache) > limit:
+        del cache[next(iter(cache))]
+    return value
+
+
+def _pin_positions(order, points, positions):
+    """
+    Places pinned teams in every simulation's table (order, points: (group_size, n_sims)):
+    each (position, team) of positions goes to its position, the unpinned teams fill the
+    free positions in their simulated order.
+    """
+    pinned_positions = [position for position, _ in positions]
+    free = [p for p in range(order.shape[0]) if p not in pinned_positions]
+    pinned = np.isin(order, [team for _, team in positions])
+    # unpinned rows first, each column keeping its simulated order
+    rows = np.argsort(pinned, axis=0, kind="stable")[:len(free)]
+    new_order, new_points = np.empty_like(order), np.empty_like(points)
+    new_order[free] = np.take_along_axis(order, rows, axis=0)
+    new_points[free] = np.take_along_axis(points, rows, axis=0)
+    for position, team in positions:
+        new_order[position] = team
+        new_points[position] = np.take_along_axis(points, np.argmax(order == team, axis=0)[None], axis=0)[0]
+    return new_order, new_points
+
+
+class WhatIf:
+    """
+    n_sims tournaments of a format (built-in name, spec or TournamentFormat) with pinned results.
+    skills: (n_teams,) / (n_teams, n_sims) in fmt.teams order, or a callable (n_sims, rng) -> such
+    an array (e.g. a SkillProvider over fmt.teams), drawn once at construction.
+    """
+
+    def __init__(self, skills, fmt="world_cup_2026", n_sims=DEFAULT_N_SIMS, seed=None):
+        self.fmt = fmt = get_format(fmt)
+        self.n_sims = n_sims
+        rng = np.random.default_rng(seed)
+        # same draw order as simulate_format
+        if callable(skills):
+            skills = skills(n_sims, rng)
+        self._skills = _skill_matrix(skills, len(fmt.teams), n_sims)
+        self._group_u = rng.random((len(fmt.pairs), fmt.n_groups, n_sims))
+        self._group_tiebreak = _random_tiebreak((fmt.group_size, fmt.n_groups, n_sims), rng)
+        self._thirds_tiebreak = None if fmt.thirds is None else _random_tiebreak((fmt.n_groups, n_sims), rng)
+        self._knockout_u = rng.random((len(fmt.slot_rows) - 1, n_sims))
+
+        self._group_pins = {}     # (group, fixture) -> WIN / DRAW / LOSS
+        self._positions = {}      # team index -> position index in its group
+        self._knockout_pins = {}  # frozenset of two team indices -> winner
+        # shared with every what_if() copy
+        self._groups = {}
+        self._outcomes = {}
+
+    # ============================================================
+    # PINS
+    # ============================================================
+    def _team(self, team):
+        if team not in self.fmt.team_index:
+            raise ValueError(f"{team!r} does not play in {self.fmt.name}")
+        return self.fmt.team_index[team]
+
+    def _fixture(self, t1, t2):
+        """(group, fixture, t1 is the fixture's first team) of a group match, or None."""
+        size = self.fmt.group_size
+        if t1 // size != t2 // size:
+            return None
+        i, j = t1 % size, t2 % size
+        m = int(np.flatnonzero((self.fmt.pairs == (min(i, j), max(i, j))).all(axis=1))[0])
+        return t1 // size, m, i < j
+
+    def set_result(self, team1, team2, outcome, knockout=False):
+        """
+        Pins a result: outcome is the winner or "draw" (group matches only).
+        A match of two teams from the same group is the group fixture unless knockout is set;
+        a knockout result applies whenever the two teams meet.
+        """
+        t1, t2 = self._team(team1), self._team(team2)
+        if outcome not in (team1, team2, "draw"):
+            raise ValueError(f"outcome must be {team1!r}, {team2!r} or 'draw', got {outcome!r}")
+        fixture = None if knockout else self._fixture(t1, t2)
+        if fixture is None:
+            if outcome == "draw":
+                raise ValueError("knockout matches cannot end in a draw")
+            self._knockout_pins[frozenset((t1, t2))] = self._team(outcome)
+            return self
+        g, m, first = fixture
+        if outcome == "draw":
+            code = DRAW
+        else:
+            code = WIN if (outcome == team1) == first else LOSS
+        self._group_pins[(g, m)] = code
+        return self
+
+    def clear_result(self, team1, team2, knockout=False):
+        t1, t2 = self._team(team1), self._team(team2)
+        fixture = None if knockout else self._fixture(t1, t2)
+        if fixture is None:
+            self._knockout_pins.pop(frozenset((t1, t2)), None)
+        else:
+            self._group_pins.pop(fixture[:2], None)
+        return self
+
+    def set_position(self, team, position):
+        """Pins the final group position (1 = group winner) of a team, e.g. when its group is decided."""
+        if not 1 <= position <= self.fmt.group_size:
+            raise ValueError(f"position must be between 1 and {self.fmt.group_size}, got {position}")
+        t = self._team(team)
+        g = t // self.fmt.group_size
+        taken = [other for other, p in self._positions.items()
+                 if p == position - 1 and other // self.fmt.group_size == g and other != t]
+        if taken:
+            raise ValueError(f"position {position} of {team}'s group is already pinned to {self.fmt.teams[taken[0]]}")
+        self._positions[t] = position - 1
+        return self
+
+    def clear_position(self, team):
+        self._positions.pop(self._team(team), None)
+        return self
+
+    def what_if(self, results=(), positions=None):
+        """
+        A copy with additional pins, sharing the random numbers and the caches:
+        results as (team1, team2, outcome) tuples, positions as {team: position}.
+        """
+        scenario = copy.copy(self)
+        scenario._group_pins = dict(self._group_pins)
+        scenario._positions = dict(self._positions)
+        scenario._knockout_pins = dict(self._knockout_pins)
+        for team1, team2, outcome in results:
+            scenario.set_result(team1, team2, outcome)
+        for team, position in (positions or {}).items():
+            scenario.set_position(team, position)
+        return scenario
+
+    # ============================================================
+    # SIMULATION
+    # ============================================================
+    def _group_key(self, g):
+        size = self.fmt.group_size
+        pins = tuple(sorted((m, code) for (gg, m), code in self._group_pins.items() if gg == g))
+        positions = tuple(sorted((p, t) for t, p in self._positions.items() if t // size == g))
+        return g, pins, positions
+
+    def _group(self, key):
+        """Team order and points of one group, (group_size, n_sims) each; cached by key."""
+        if key in self._groups:
+            instrumentation.count("what_if/group_cache_hits")
+            return self._groups[key]
+        instrumentation.count("what_if/groups_simulated")
+        g, pins, positions = key
+        fmt, size = self.fmt, self.fmt.group_size
+        pinned = np.full((len(fmt.pairs), 1), -1)
+        for m, code in pins:
+            pinned[m, 0] = code
+        s = self._skills[g * size:(g + 1) * size][None]
+        with instrumentation.span("group_stage"):
+            order, points = _group_tables(fmt, s, self._group_u[:, g:g + 1], self._group_tiebreak[:, g:g + 1], pinned)
+        order, points = order[:, 0] + g * size, points[:, 0]
+        if positions:
+            order, points = _pin_positions(order, points, positions)
+        return _remember(self._groups, key, (order, points), MAX_CACHED_GROUPS)
+
+    def _downstream(self, tables, sims=None):
+        """Best thirds and knockout rounds of the simulations sims (index array, None: all)."""
+        fmt = self.fmt
+        cols = slice(None) if sims is None else sims
+        n_sims = self.n_sims if sims is None else len(sims)
+        skills = self._skills if self._skills.shape[1] == 1 else self._skills[:, cols]
+        standings = np.stack([order[:, cols] for order, _ in tables], axis=1)
+        with instrumentation.span("best_thirds"):
+            pool = standings.reshape(-1, n_sims)
+            if fmt.thirds is not None:
+                points = np.stack([p[:, cols] for _, p in tables], axis=1)
+                pool = np.concatenate([pool, _best_thirds(fmt, standings, points, None, self._thirds_tiebreak[:, cols])])
+            teams = pool[fmt.slot_rows]
+
+        reached = np.zeros((n_sims, len(fmt.teams)), dtype=np.uint8)
+        rows = np.arange(n_sims)
+        knockout_u = self._knockout_u[:, cols]
+        for stage in range(1, len(fmt.stages)):
+            reached[rows, teams] = stage
+            if stage < len(fmt.stages) - 1:
+                n_matches = len(teams) // 2
+                u, knockout_u = knockout_u[:n_matches], knockout_u[n_matches:]
+                with instrumentation.span(fmt.stages[stage]):
+                    winners = _knockout_round(teams, skills, None, u)
+                    t1, t2 = teams[0::2], teams[1::2]
+                    for pair, winner in self._knockout_pins.items():
+                        a, b = tuple(pair)
+                        meet = ((t1 == a) & (t2 == b)) | ((t1 == b) & (t2 == a))
+                        winners[meet] = winner
+                teams = winners
+        return reached
+
+    def _changed_since(self, group_keys, base_keys, tables):
+        """Simulations whose group tables differ from those under base_keys, or None if unknown."""
+        changed = np.zeros(self.n_sims, dtype=bool)
+        for (order, points), key, base_key in zip(tables, group_keys, base_keys):
+            if key != base_key:
+                if base_key not in self._groups:
+                    return None
+                base_order, base_points = self._groups[base_key]
+                changed |= (order != base_order).any(axis=0) | (points != base_points).any(axis=0)
+        return np.flatnonzero(changed)
+
+    def simulate(self):
+        """(n_sims, n_teams) uint8 matrix of the stage index (into fmt.stages) each team reached."""
+        group_keys = tuple(self._group_key(g) for g in range(self.fmt.n_groups))
+        knockout_key = tuple(sorted((tuple(sorted(pair)), w) for pair, w in self._knockout_pins.items()))
+        key = group_keys, knockout_key
+        if key in self._outcomes:
+            instrumentation.count("what_if/outcome_cache_hits")
+            return self._outcomes[key]
+
+        with instrumentation.span("what_if"):
+            tables = [self._group(k) for k in group_keys]
+            # a simulation whose group tables are the same as in a cached outcome with the same
+            # knockout pins has the same thirds and bracket: only the others are played again
+            base = next((k for k in reversed(self._outcomes) if k[1] == knockout_key), None)
+            sims = None if base is None else self._changed_since(group_keys, base[0], tables)
+            if sims is None:
+                reached = self._downstream(tables)
+            else:
+                instrumentation.count("what_if/downstream_reused", self.n_sims - len(sims))
+                reached = self._outcomes[base].copy()
+                reached[sims] = self._downstream(tables, sims)
+        return _remember(self._outcomes, key, reached, MAX_CACHED_OUTCOMES)
+
+    def probabilities(self, sort_by="WINNER"):
+        """Stage probability table (teams x fmt.stages) under the current pins."""
+        aggregator = PlacementAggregator(self.fmt.teams, self.fmt.stages)
+        aggregator.update(self.simulate())
+        return aggregator.to_dataframe(sort_by)
@@ -1,7 +1,16 @@
+import os
+import sys
 import numpy as np
 import random
 from collections import defaultdict
 
+if __name__ == '__main__':
+    # run as a script: make the src packages importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation.best_thirds import GROUP_LETTERS, group_mask, lookup_thirds
+from util import instrumentation
+
 # dummy skill function. replace this in notebooks with actual skill functions.
 def dummy_skill_function(team):
     return np.random.normal(0, 1)
@@ -73,6 +82,10 @@ def simulate_group(team_list):
                     points[t1] += 1
                     points[t2] += 1
 
+    n_matches = len(team_list) * (len(team_list) - 1) // 2
+    instrumentation.count("matches_simulated", n_matches)
+    instrumentation.count("skill_func_calls", 2 * n_matches)
+
     # convert dict to list of dicts
     table = [{"team": team, "points": pts} for team, pts in points.items()]
 
@@ -94,8 +107,7 @@ def simulate_group_stage():
     return group_tables
 
 # collects the 8 best 3rd-placed teams from the group stage to advance.
-# note: this does not follow the official schedule, as that would be 495 distinct variations depending on groups.
-# we just pick the 8 best teams and assing randomly
+# ties on points are broken randomly.
 def pick_best_thirds(group_tables):
     # collect all 3rd-placed teams with points
     third_placed = [(table[2]['team'], table[2]['points']) for table in group_tables.values()]
@@ -123,11 +135,16 @@ def pick_best_thirds(group_tables):
     return top8
 
 # from the group stage results, create a list of matchups for the round of 32.
-# this follows the official placements (https://en.wikipedia.org/wiki/2026_FIFA_World_Cup_knockout_stage)
+# the pairings follow the official schedule (https://en.wikipedia.org/wiki/2026_FIFA_World_Cup_knockout_stage)
 def create_knockouts_list(group_tables):
-    # first, get the 8 best teams in 3rd place and shuffle them
-    best_thirds = pick_best_thirds(group_tables)
-    np.random.shuffle(best_thirds)  # shuffle so r32 ties aren’t biased
+    # first, get the 8 best teams in 3rd place and put them into their r32 slots.
+    # the slot of each third depends on which 8 groups they come from (495 combinations): fifa's
+    # annex table, or a derived fallback when it is missing (see best_thirds.py)
+    with instrumentation.span("best_thirds"):
+        best_thirds = pick_best_thirds(group_tables)
+        third_groups = {table[2]['team']: group for group, table in group_tables.items()}
+        mask = group_mask(GROUP_LETTERS.index(third_groups[team]) for team in best_thirds)
+        best_thirds = [group_tables[GROUP_LETTERS[g]][2]['team'] for g in lookup_thirds(mask)]
 
     r32 = [
         group_tables["E"][0]['team'],  best_thirds[0],                # Match 1: 1E vs 3.1
@@ -160,29 +177,32 @@ def simulate_knockouts(group_tables):
     # the winners will face again in round of 16.
     r32 = create_knockouts_list(group_tables)
 
-    # Helper to run a round
-    def run_round(teams):
-        winners = []
-        for i in range(0, len(teams), 2):
-            t1, t2 = teams[i], teams[i+1]
-            winner = simulate_knockout_match(t1, t2)
-            winners.append(winner)
+    # Helper to run a round. name is the round being played (its stage in STAGES)
+    def run_round(teams, name):
+        with instrumentation.span(name):
+            winners = []
+            for i in range(0, len(teams), 2):
+                t1, t2 = teams[i], teams[i+1]
+                winner = simulate_knockout_match(t1, t2)
+                winners.append(winner)
+        instrumentation.count("matches_simulated", len(winners))
+        instrumentation.count("skill_func_calls", 2 * len(winners))
         return winners
 
     # Round of 16
-    r16 = run_round(r32)
+    r16 = run_round(r32, "R32")
 
     # Quarterfinals
-    qf = run_round(r16)
+    qf = run_round(r16, "R16")
 
     # Semifinals
-    sf = run_round(qf)
+    sf = run_round(qf, "QF")
 
     # Final
-    final = run_round(sf)
+    final = run_round(sf, "SF")
 
     # Winner
-    champion = run_round(final)
+    champion = run_round(final, "F")
 
     return r32, r16, qf, sf, final, champion[0]
 
@@ -228,13 +248,18 @@ def calculate_placements(group_tables, r32, r16, qf, sf, f, champion):
     return placements
 
 # main function. try to call only this from other modules/notebooks.
-def simulate_world_cup(sf=dummy_skill_function, verbose=True):
+# pass a SkillProvider (skill_provider.py) to use one precomputed posterior draw per tournament,
+# sf stays as the slow path for arbitrary skill functions.
+def simulate_world_cup(sf=dummy_skill_function, verbose=True, skill_provider=None):
     global skill_func
-    skill_func = sf
+    skill_func = sf if skill_provider is None else skill_provider.skill_func()
 
-    group_tables = simulate_group_stage()
-    r32, r16, qf, sf, f, c = simulate_knockouts(group_tables)
-    placements = calculate_placements(group_tables, r32, r16, qf, sf, f, c)
+    with instrumentation.span("simulate_world_cup"):
+        with instrumentation.span("group_stage"):
+            group_tables = simulate_group_stage()
+        r32, r16, qf, sf, f, c = simulate_knockouts(group_tables)
+        placements = calculate_placements(group_tables, r32, r16, qf, sf, f, c)
+    instrumentation.count("tournaments")
 
     if verbose:
         print_group_results(group_tables)
@@ -243,6 +268,121 @@ def simulate_world_cup(sf=dummy_skill_function, verbose=True):
     return placements
 
 
+# ============================================================
+# BATCHED ENGINE
+# ============================================================
+# same tournament as above, but all simulations are played at once with numpy.
+# teams are addressed by index into WC_TEAMS (group order, then position in group),
+# stages by index into STAGES. arrays are laid out (..., n_sims) so that every
+# per-match or per-slot slice is contiguous.
+# the layout below is the 2026 spec of tournament_format.py, whose generic executor
+# runs the batch; the per-format arrays there mirror the constants here.
+
+STAGES = ["GROUPS", "R32", "R16", "QF", "SF", "F", "WINNER"]
+WC_TEAMS = [team for teams in groups.values() for team in teams]
+GROUP_NAMES = list(groups.keys())
+
+# the 6 group fixtures in the same order simulate_group plays them (i < j)
+GROUP_PAIRS = [(i, j) for i in range(4) for j in range(4) if i < j]
+
+# r32 slots in the order of create_knockouts_list.
+# (group, position) for group winners/runners-up, ("3rd", k) for the k-th best third.
+R32_SLOTS = [
+    ("E", 0), ("3rd", 0),   ("I", 0), ("3rd", 1),   ("A", 1), ("B", 1),   ("F", 0), ("C", 1),
+    ("K", 1), ("L", 1),     ("H", 0), ("J", 1),     ("D", 0), ("3rd", 2), ("G", 0), ("3rd", 3),
+    ("C", 0), ("F", 1),     ("E", 1), ("I", 1),     ("A", 0), ("3rd", 4), ("L", 0), ("3rd", 5),
+    ("J", 0), ("H", 1),     ("D", 1), ("G", 1),     ("B", 0), ("3rd", 6), ("K", 0), ("3rd", 7),
+]
+
+# sorting network for 4 elements (compare-exchange pairs), used to rank each group
+_SORT4 = [(0, 1), (2, 3), (0, 2), (1, 3), (1, 2)]
+
+# bit layout of the packed sort keys: points | random tie-break | index
+_TIEBREAK_BITS = 16
+
+# uniforms that decide match outcomes in one tournament: 72 group matches + 31 knockouts.
+# simulate_stages_batch can take them precomputed (see variance_reduction.py).
+N_GROUP_MATCHES = len(groups) * len(GROUP_PAIRS)
+N_MATCH_UNIFORMS = N_GROUP_MATCHES + len(R32_SLOTS) - 1
+
+
+def match_probabilities(skill_diff, max_draw_prob=0.15):
+    """
+    Vectorized version of the probabilities used in simulate_match.
+    Returns (p_team1_win, p_draw) arrays with the shape of skill_diff.
+    """
+    draw_prob = max_draw_prob * np.exp(-np.abs(skill_diff))
+    p_team1_win = (1 - draw_prob) / (1 + np.exp(-skill_diff))
+    return p_team1_win, draw_prob
+
+
+def _random_tiebreak(shape, rng):
+    return rng.integers(0, 1 << _TIEBREAK_BITS, size=shape, dtype=np.int64)
+
+
+def _pack_keys(points, index, index_bits, rng, tiebreak=None):
+    """
+    Packs points, a random tie-breaker and the index into one int64 per entry,
+    so that sorting the keys sorts by points with random order among ties.
+    tiebreak: optional precomputed tie-breakers (see _random_tiebreak), otherwise drawn from rng.
+    """
+    if tiebreak is None:
+        tiebreak = _random_tiebreak(points.shape, rng)
+    return (points.astype(np.int64) << (_TIEBREAK_BITS + index_bits)) | (tiebreak << index_bits) | index
+
+
+def _unpack_points(keys, index_bits):
+    return keys >> (_TIEBREAK_BITS + index_bits)
+
+
+def _r32_batch(standings, best_thirds):
+    """Fills the 32 r32 slots with team indices, shape (32, n_sims)."""
+    return np.stack([
+        best_thirds[pos] if group == "3rd" else standings[pos, GROUP_NAMES.index(group)]
+        for group, pos in R32_SLOTS
+    ])
+
+
+def simulate_stages_batch(skills, n_sims, rng=None, uniforms=None):
+    """
+    Simulates n_sims tournaments at once.
+    skills:   (48,) or (48, n_sims) array in WC_TEAMS order,
+              or a callable (n_sims, rng) -> such an array, e.g. a SkillProvider.
+    uniforms: optional (N_MATCH_UNIFORMS, n_sims) array deciding the match outcomes
+              (72 group matches, fixture-major, then the knockout rounds in bracket order).
+              tie-breaks still come from rng.
+    Returns a (n_sims, 48) uint8 matrix with the index into STAGES each team reached.
+    """
+    # the generic executor running the 2026 spec (imported here, it builds on this module)
+    from simulation.tournament_format import simulate_format
+
+    return simulate_format("world_cup_2026", skills, n_sims, rng, uniforms)
+
+
+def stage_counts(reached, n_stages=len(STAGES)):
+    """
+    Counts how often each team reached each stage, reached being (n_sims, n_teams) stage indices.
+    Returns a (n_teams, n_stages) int64 array, (48, 7) for the world cup.
+    """
+    n_teams = reached.shape[1]
+    flat = reached.astype(np.int64) + n_stages * np.arange(n_teams)
+    counts = np.bincount(flat.ravel(), minlength=n_teams * n_stages)
+    return counts.reshape(n_teams, n_stages)
+
+
+def simulate_world_cup_batch(skills, n_sims, rng=None):
+    """
+    Batched counterpart of simulate_world_cup.
+    Returns dict {team_name: {stage: count}} over n_sims tournaments,
+    i.e. the Counter of calculate_placements results per team.
+    """
+    counts = stage_counts(simulate_stages_batch(skills, n_sims, rng))
+    return {
+        team: {stage: int(counts[t, s]) for s, stage in enumerate(STAGES)}
+        for t, team in enumerate(WC_TEAMS)
+    }
+
+
 # for testing
 if __name__ == '__main__':
     simulate_world_cup()
\ No newline at end of file
@@ -0,0 +1,244 @@
+import json
+import os
+import signal
+import threading
+import time
+from collections import defaultdict
+
+# opt-in instrumentation of the hot paths (simulation engines, model fits).
+# the instrumented code calls the module functions span / count / observe; while no
+# Recorder is active they return immediately (span hands out one shared no-op context), so
+# the cost of leaving the calls in is a function call per stage, not per match.
+#
+#   with instrument(profile=True) as rec:
+#       run_simulations(provider, 100_000)
+#   print(rec.report())
+#   rec.to_json("stats.json")
+#
+# spans nest: a span opened inside another is recorded under "outer/inner".
+# the profiler samples the python stack on SIGPROF (cpu time, unix main thread only), so
+# time spent inside numpy / torch is charged to the python line that called it.
+
+PROFILE_INTERVAL = 0.005
+
+_active = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        stack = self.recorder._stack
+        self.path = f"{stack[-1]}/{self.name}" if stack else self.name
+        stack.append(self.path)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add_time(self.path, time.perf_counter() - self.start)
+        self.recorder._stack.pop()
+        return False
+
+
+class _Sampler:
+    """Stack-sampling profiler on the process cpu-time timer."""
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = defaultdict(int)
+        self.total_counts = defaultdict(int)
+        self._previous = None
+
+    @staticmethod
+    def _key(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self, signum, frame):
+        self.samples += 1
+        if frame is None:
+            return
+        self.self_counts[self._key(frame.f_code)] += 1
+        seen = set()
+        while frame is not None:
+            key = self._key(frame.f_code)
+            if key not in seen:
+                seen.add(key)
+                self.total_counts[key] += 1
+            frame = frame.f_back
+
+    def start(self):
+        if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+            raise RuntimeError("the sampling profiler needs signal.setitimer (unix) and the main thread")
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+
+    def summary(self, top=None):
+        rows = sorted(self.total_counts.items(), key=lambda kv: -kv[1])[:top]
+        return {"interval": self.interval, "samples": self.samples,
+                "functions": [{"function": key, "self": self.self_counts.get(key, 0), "total": n}
+                              for key, n in rows]}
+
+
+class Recorder:
+    """
+    Collects what the instrumented code reports while it is active (see instrument()).
+    spans:        {path: [calls, seconds]}
+    counters:     {name: total}
+    observations: {name: [count, sum, min, max]}, e.g. per-iteration NUTS tree depths
+    """
+
+    def __init__(self, profile=False, interval=PROFILE_INTERVAL):
+        self.spans = {}
+        self.counters = defaultdict(int)
+        self.observations = {}
+        self.sampler = _Sampler(interval) if profile else None
+        self._stack = []
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def add_time(self, path, seconds, calls=1):
+        entry = self.spans.setdefault(path, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def observe(self, name, value):
+        entry = self.observations.get(name)
+        if entry is None:
+            self.observations[name] = [1, value, value, value]
+        else:
+            entry[0] += 1
+            entry[1] += value
+            entry[2] = min(entry[2], value)
+            entry[3] = max(entry[3], value)
+
+    def merge(self, summary):
+        """Adds the summary() of another recorder, e.g. from a worker process."""
+        for path, s in summary["spans"].items():
+            self.add_time(path, s["seconds"], s["calls"])
+        for name, n in summary["counters"].items():
+            self.count(name, n)
+        for name, o in summary["observations"].items():
+            entry = self.observations.setdefault(name, [0, 0.0, o["min"], o["max"]])
+            entry[0] += o["count"]
+            entry[1] += o["mean"] * o["count"]
+            entry[2] = min(entry[2], o["min"])
+            entry[3] = max(entry[3], o["max"])
+
+    def summary(self, top=30):
+        """Json-able dict of spans, counters, observations and (if profiling) the top functions."""
+        out = {
+            "spans": {path: {"calls": calls, "seconds": seconds} for path, (calls, seconds) in self.spans.items()},
+            "counters": dict(self.counters),
+            "observations": {name: {"count": n, "mean": total / n, "min": lo, "max": hi}
+                             for name, (n, total, lo, hi) in self.observations.items()},
+        }
+        if self.sampler is not None:
+            out["profile"] = self.sampler.summary(top)
+        return out
+
+    def to_json(self, path=None, top=30):
+        """The summary as a json string, also written to path if given."""
+        text = json.dumps(self.summary(top), indent=1)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def report(self, top=20):
+        """The summary as a text table."""
+        lines = ["SPANS:"]
+        for path, (calls, seconds) in sorted(self.spans.items()):
+            lines.append(f"  {path:<45} {calls:>9} calls {seconds:10.4f}s  {1e3 * seconds / calls:9.3f} ms/call")
+        if self.counters:
+            lines.append("COUNTERS:")
+            lines += [f"  {name:<45} {n:>12}" for name, n in self.counters.items()]
+        if self.observations:
+            lines.append("OBSERVATIONS:")
+            lines += [f"  {name:<45} n={n:<8} mean {total / n:8.3f}  min {lo:g}  max {hi:g}"
+                      for name, (n, total, lo, hi) in self.observations.items()]
+        if self.sampler is not None:
+            profile = self.sampler.summary(top)
+            lines.append(f"PROFILE ({profile['samples']} samples every {1e3 * profile['interval']:g} ms cpu):")
+            lines.append(f"  {'self':>6} {'total':>6}  function")
+            lines += [f"  {row['self']:>6} {row['total']:>6}  {row['function']}" for row in profile["functions"]]
+        return "\n".join(lines)
+
+
+class instrument:
+    """
+    Context manager that activates a Recorder (and returns it from __enter__).
+    profile=True also runs the sampling profiler every interval seconds of cpu time.
+    """
+
+    def __init__(self, profile=False, interval=PROFILE_INTERVAL):
+        self.recorder = Recorder(profile, interval)
+
+    def __enter__(self):
+        global _active
+        self._previous, _active = _active, self.recorder
+        if self.recorder.sampler is not None:
+            self.recorder.sampler.start()
+        return self.recorder
+
+    def __exit__(self, *exc):
+        global _active
+        if self.recorder.sampler is not None:
+            self.recorder.sampler.stop()
+        _active = self._previous
+        return False
+
+
+# ============================================================
+# HOOKS FOR THE INSTRUMENTED CODE
+# ============================================================
+def enabled():
+    return _active is not None
+
+
+def span(name):
+    """Timing span around a stage: `with span("group_stage"): ...`."""
+    return _NULL_SPAN if _active is None else _active.span(name)
+
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
+
+
+def observe(name, value):
+    if _active is not None:
+        _active.observe(name, value)
+
+
+def add_time(name, seconds):
+    """Time measured elsewhere, recorded as a span under the currently open span."""
+    if _active is not None:
+        stack = _active._stack
+        _active.add_time(f"{stack[-1]}/{name}" if stack else name, seconds)
+
+
+def merge(summary):
+    if _active is not None and summary is not None:
+        _active.merge(summary)
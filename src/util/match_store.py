@@ -0,0 +1,201 @@
+import json
+import numpy as np
+import pandas as pd
+import os
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+STORE_DIR = "data/processed/match_store"
+
+# columnar binary copy of results_full.csv, one .npy file per column, written by
+# util/preprocessing.py and memory-mapped on load.
+# team and tournament names are stored once in teams.json / tournaments.json; a name's
+# code is its position in the list. codes are only ever appended, so a team keeps its code
+# across rebuilds and every model indexes teams the same way.
+# rows are sorted by date, so any date window is a contiguous (zero-copy) slice.
+
+EPOCH = np.datetime64("1970-01-01", "D")
+
+COLUMNS = {
+    "days": np.int32,         # days since 1970-01-01
+    "home": np.int16,         # team codes
+    "away": np.int16,
+    "home_score": np.uint8,
+    "away_score": np.uint8,
+    "tournament": np.int16,   # tournament codes
+    "neutral": np.bool_,
+}
+
+
+def _path(store_dir, name):
+    return os.path.join(BASE_DIR, store_dir, name)
+
+
+def _load_names(store_dir, name):
+    path = _path(store_dir, name)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_names(store_dir, name, names):
+    with open(_path(store_dir, name), "w") as f:
+        json.dump(names, f, ensure_ascii=False, indent=0)
+
+
+def _encode(values, names):
+    """Codes of values in names, appending unseen values (in order of first appearance) to names."""
+    known = set(names)
+    names.extend(v for v in pd.unique(values) if v not in known)
+    return pd.Categorical(values, categories=names).codes
+
+
+def encode_matches(df, teams, tournaments):
+    """Columns of a cleaned results dataframe as typed arrays; extends teams / tournaments in place."""
+    codes = _encode(np.concatenate([df["home_team"].to_numpy(), df["away_team"].to_numpy()]), teams)
+    return {
+        "days": (pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]") - EPOCH).astype(np.int32),
+        "home": codes[:len(df)].astype(np.int16),
+        "away": codes[len(df):].astype(np.int16),
+        "home_score": df["home_score"].to_numpy().astype(np.uint8),
+        "away_score": df["away_score"].to_numpy().astype(np.uint8),
+        "tournament": _encode(df["tournament"].to_numpy(), tournaments).astype(np.int16),
+        "neutral": df["neutral"].to_numpy().astype(np.bool_),
+    }
+
+
+def write_match_store(df, store_dir=STORE_DIR, append=False):
+    """
+    Writes the cleaned, date-sorted results dataframe as the columnar store.
+    append=True adds df's rows after the existing ones. Existing team / tournament codes
+    are kept in both cases.
+    """
+    os.makedirs(_path(store_dir, ""), exist_ok=True)
+    teams = _load_names(store_dir, "teams.json")
+    tournaments = _load_names(store_dir, "tournaments.json")
+    columns = encode_matches(df, teams, tournaments)
+    if len(teams) > np.iinfo(np.int16).max or len(tournaments) > np.iinfo(np.int16).max:
+        raise ValueError("too many distinct teams or tournaments for int16 codes")
+
+    for name, values in columns.items():
+        path = _path(store_dir, f"{name}.npy")
+        if append and os.path.exists(path):
+            values = np.concatenate([np.load(path), values])
+        np.save(path, values.astype(COLUMNS[name]))
+    _save_names(store_dir, "teams.json", teams)
+    _save_names(store_dir, "tournaments.json", tournaments)
+
+
+def team_row_index(home, away, n_teams):
+    """
+    CSR index of the rows each team plays in: rows[indptr[t]:indptr[t + 1]] are the
+    (ascending) rows of team t, as home or away side.
+    """
+    n = len(home)
+    team = np.concatenate([home, away]).astype(np.int64)
+    row = np.concatenate([np.arange(n), np.arange(n)])
+    order = np.argsort(team * n + row, kind="stable")
+    indptr = np.zeros(n_teams + 1, dtype=np.int64)
+    np.cumsum(np.bincount(team, minlength=n_teams), out=indptr[1:])
+    return indptr, row[order]
+
+
+class MatchStore:
+    """
+    Matches as typed numpy arrays (views of the memory-mapped store), plus the shared
+    team / tournament dictionaries. Slicing with window() does not copy.
+    """
+
+    def __init__(self, columns, teams, tournaments):
+        self.columns = columns
+        self.teams = teams
+        self.tournaments = tournaments
+        self.team_to_idx = {team: i for i, team in enumerate(teams)}
+        self._team_rows = None
+
+    def __len__(self):
+        return len(self.columns["days"])
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns", {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @property
+    def n_teams(self):
+        return len(self.teams)
+
+    @property
+    def dates(self):
+        return EPOCH + self.columns["days"].astype("timedelta64[D]")
+
+    def window(self, since=None, until=None):
+        """Matches with since <= date < until (dates as strings or datetimes), as a view."""
+        days = self.columns["days"]
+        lo = 0 if since is None else np.searchsorted(days, _day_number(since), side="left")
+        hi = len(days) if until is None else np.searchsorted(days, _day_number(until), side="left")
+        return MatchStore({k: v[lo:hi] for k, v in self.columns.items()}, self.teams, self.tournaments)
+
+    def team_rows(self):
+        """CSR (indptr, rows) of every team's matches in this store, cached."""
+        if self._team_rows is None:
+            self._team_rows = team_row_index(self.home, self.away, self.n_teams)
+        return self._team_rows
+
+    def matches_of(self, team):
+        """Row indices of one team's matches (name or code)."""
+        t = self.team_to_idx[team] if isinstance(team, str) else team
+        indptr, rows = self.team_rows()
+        return rows[indptr[t]:indptr[t + 1]]
+
+    def present_teams(self):
+        """Codes of the teams with at least one match in this store."""
+        indptr, _ = self.team_rows()
+        return np.flatnonzero(np.diff(indptr))
+
+    def to_torch(self):
+        """
+        The tensors the notebooks build by hand: long team indices, float goals and
+        home advantage indicator (1 - neutral). torch is only imported here.
+        """
+        import torch
+
+        return {
+            "home_idx": torch.from_numpy(self.home.astype(np.int64)),
+            "away_idx": torch.from_numpy(self.away.astype(np.int64)),
+            "home_goals": torch.from_numpy(self.home_score.astype(np.float32)),
+            "away_goals": torch.from_numpy(self.away_score.astype(np.float32)),
+            "home_adv_indicator": torch.from_numpy((~self.neutral).astype(np.float32)),
+        }
+
+    def to_dataframe(self):
+        """Back to the results csv layout (without city / country)."""
+        home_goals, away_goals = self.home_score.astype(int), self.away_score.astype(int)
+        teams, tournaments = np.array(self.teams, dtype=object), np.array(self.tournaments, dtype=object)
+        return pd.DataFrame({
+            "date": pd.to_datetime(self.dates),
+            "home_team": teams[self.home],
+            "away_team": teams[self.away],
+            "result": np.select([home_goals > away_goals, home_goals < away_goals], ["home_win", "away_win"], "draw"),
+            "home_score": home_goals,
+            "away_score": away_goals,
+            "tournament": tournaments[self.tournament],
+            "neutral": np.asarray(self.neutral),
+        })
+
+
+def _day_number(date):
+    return (np.datetime64(pd.Timestamp(date).date(), "D") - EPOCH).astype(np.int64)
+
+
+def load_match_store(store_dir=STORE_DIR, since=None, until=None, mmap_mode="r"):
+    """
+    Memory-maps the store. since / until select a date window, e.g.
+    load_match_store(since=CUTOFF_10Y) for the matches of results_last_10yrs.csv.
+    """
+    columns = {name: np.load(_path(store_dir, f"{name}.npy"), mmap_mode=mmap_mode) for name in COLUMNS}
+    store = MatchStore(columns, _load_names(store_dir, "teams.json"), _load_names(store_dir, "tournaments.json"))
+    if since is not None or until is not None:
+        store = store.window(since, until)
+    return store
@@ -1,26 +1,55 @@
+import hashlib
+import json
+import sys
+import numpy as np
 import pandas as pd
 import os
 
+if __name__ == "__main__":
+    # run as a script: make the src packages importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.match_store import STORE_DIR, write_match_store
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 RAW_CSV = "data/raw/results_raw.csv"
 OUT_FULL = "data/processed/results_full.csv"
 OUT_10Y = "data/processed/results_last_10yrs.csv"
 OUT_5Y = "data/processed/results_last_5yrs.csv"
 
+# incremental runs: how far the raw file has been processed, and one hash per cleaned row
+# in results_full.csv so appended rows can be de-duplicated without re-reading it
+STATE_JSON = "data/processed/preprocessing_state.json"
+ROW_HASHES = "data/processed/preprocessing_row_hashes.npy"
+
 CUTOFF_10Y = "2016-06-01"
 CUTOFF_5Y = "2021-06-01"
 
+WINDOWS = {OUT_10Y: CUTOFF_10Y, OUT_5Y: CUTOFF_5Y}
+
+CHUNK_SIZE = 20_000
+
+REQUIRED_COLUMNS = ["date","home_team","away_team","home_score","away_score",
+                    "tournament","city","country","neutral"]
+
+COLUMN_ORDER = [
+        "date", "home_team", "away_team",
+         "result", "home_score", "away_score",
+        "tournament", "city", "country", "neutral"
+    ]
+
 def load_and_validate(path: str) -> pd.DataFrame:
     path = os.path.join(BASE_DIR, path)
     df = pd.read_csv(path)
-    required = ["date","home_team","away_team","home_score","away_score",
-                "tournament","city","country","neutral"]
-    for c in required:
-        if c not in df.columns:
-            raise ValueError(f"Missing required column: {c}")
+    validate_columns(df.columns)
     return df
 
-def clean_and_validate(df: pd.DataFrame) -> pd.DataFrame:
+def validate_columns(columns):
+    for c in REQUIRED_COLUMNS:
+        if c not in columns:
+            raise ValueError(f"Missing required column: {c}")
+
+def clean_and_validate(df: pd.DataFrame, verbose: bool = True) -> pd.DataFrame:
     df = df.copy()
 
     # parse date
@@ -34,24 +63,28 @@ def clean_and_validate(df: pd.DataFrame) -> pd.DataFrame:
     df["home_score"] = df["home_score"].astype(int)
     df["away_score"] = df["away_score"].astype(int)
 
-    def get_result(row):
-        if row.home_score > row.away_score:
-            return "home_win"
-        elif row.home_score < row.away_score:
-            return "away_win"
-        else:
-            return "draw"
+    df["result"] = np.select(
+        [df["home_score"] > df["away_score"], df["home_score"] < df["away_score"]],
+        ["home_win", "away_win"],
+        default="draw",
+    )
 
-    df["result"] = df.apply(get_result, axis=1)
+    # strip whitespace and lowercase everything
+    for col in ["home_team", "away_team", "tournament", "city", "country"]:
+        df[col] = df[col].str.strip().str.lower()
 
-    # strip whitespace from team names
-    df["home_team"] = df["home_team"].str.strip()
-    df["away_team"] = df["away_team"].str.strip()
+    # raw chunks read without a header may not infer booleans on their own
+    if df["neutral"].dtype != bool:
+        df["neutral"] = df["neutral"].astype(str).str.strip().str.upper() == "TRUE"
 
-    # lowercase everything
-    for col in ["home_team", "away_team", "result", "tournament", "city", "country"]:
-        df[col] = df[col].str.strip().str.lower()
+    if verbose:
+        warn_home_advantage(df)
+
+    df = df[COLUMN_ORDER]
+    df = df.drop_duplicates().reset_index(drop=True)
+    return df
 
+def warn_home_advantage(df: pd.DataFrame):
     # validate home advantage: if neutral==False, home_team should equal country
     # note: there are exceptions to this due to historic events or countries that aren't formally recognized. a few examples:
     # 21624 1997-01-12  DR Congo    Congo       Zaïre       -->
@@ -62,37 +95,164 @@ def clean_and_validate(df: pd.DataFrame) -> pd.DataFrame:
         print(f"Warning: {len(invalid_adv)} rows state home advantage but country != home_team:")
         print(invalid_adv[["date","home_team","away_team","country"]])
 
-
-    column_order = [
-            "date", "home_team", "away_team",
-             "result", "home_score", "away_score", 
-            "tournament", "city", "country", "neutral"
-        ]
-
-    df = df[column_order]
-    df = df.drop_duplicates().reset_index(drop=True)
-    return df
-
 def filter_by_cutoff(df: pd.DataFrame, cutoff_date: str) -> pd.DataFrame:
     cutoff = pd.to_datetime(cutoff_date)
     return df[df["date"] >= cutoff].reset_index(drop=True)
 
-def main():
-    df_raw = load_and_validate(RAW_CSV)
-    df_clean = clean_and_validate(df_raw)
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """One uint64 fingerprint per cleaned row, used to drop duplicates across chunks and runs."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+# ============================================================
+# STREAMING / INCREMENTAL PIPELINE
+# ============================================================
+def read_raw_chunks(path: str = RAW_CSV, offset: int = 0, chunk_size: int = CHUNK_SIZE):
+    """
+    Streams the raw csv from byte offset (0 = the start, past the header otherwise).
+    Yields dataframes of at most chunk_size rows.
+    """
+    path = os.path.join(BASE_DIR, path)
+    with open(path, "rb") as f:
+        header = f.readline().decode().strip().split(",")
+        validate_columns(header)
+        if offset:
+            f.seek(offset)
+        for chunk in pd.read_csv(f, names=header, header=None, chunksize=chunk_size):
+            yield chunk
+
+def raw_position(path: str = RAW_CSV):
+    """Byte size of the raw file and a fingerprint of its last line."""
+    path = os.path.join(BASE_DIR, path)
+    size = os.path.getsize(path)
+    return size, _line_fingerprint(path, size)
+
+def _line_fingerprint(path, offset):
+    """sha1 of the line that ends at byte offset, to check the processed prefix is unchanged."""
+    with open(path, "rb") as f:
+        f.seek(max(0, offset - 4096))
+        tail = f.read(offset - max(0, offset - 4096))
+    return hashlib.sha1(tail.rstrip(b"\r\n").rsplit(b"\n", 1)[-1]).hexdigest()
+
+def load_state():
+    path = os.path.join(BASE_DIR, STATE_JSON)
+    if not os.path.exists(path) or not os.path.exists(os.path.join(BASE_DIR, ROW_HASHES)):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _save_state(state, hashes):
+    with open(os.path.join(BASE_DIR, STATE_JSON), "w") as f:
+        json.dump(state, f, indent=2)
+    np.save(os.path.join(BASE_DIR, ROW_HASHES), hashes)
 
-    # full
-    df_clean.to_csv(os.path.join(BASE_DIR, OUT_FULL), index=False)
+def _can_resume(state, path):
+    """The raw file still starts with the processed bytes, and the outputs exist."""
+    full_path = os.path.join(BASE_DIR, path)
+    if state is None or state["raw_path"] != path:
+        return False
+    if os.path.getsize(full_path) < state["raw_offset"]:
+        return False
+    if _line_fingerprint(full_path, state["raw_offset"]) != state["raw_last_line"]:
+        return False
+    return all(os.path.exists(os.path.join(BASE_DIR, p)) for p in [OUT_FULL, *WINDOWS])
 
-    # last 10 years
-    df_10y = filter_by_cutoff(df_clean, CUTOFF_10Y)
-    df_10y.to_csv(os.path.join(BASE_DIR,OUT_10Y), index=False)
+def process_chunks(chunks, seen_hashes):
+    """
+    Cleans raw chunks and drops rows already in seen_hashes (earlier chunks or runs).
+    Returns the new cleaned rows and the updated hash array.
+    """
+    parts = []
+    for chunk in chunks:
+        clean = clean_and_validate(chunk, verbose=False)  # also drops duplicates within the chunk
+        h = row_hashes(clean)
+        keep = ~np.isin(h, seen_hashes)
+        parts.append(clean[keep])
+        seen_hashes = np.concatenate([seen_hashes, h[keep]])
+    if not parts:
+        return pd.DataFrame(columns=COLUMN_ORDER), seen_hashes
+    return pd.concat(parts, ignore_index=True), seen_hashes
 
-    # last 5 years
-    df_5y = filter_by_cutoff(df_clean, CUTOFF_5Y)
-    df_5y.to_csv(os.path.join(BASE_DIR,OUT_5Y), index=False)
+def _write(df, path, append):
+    df.to_csv(os.path.join(BASE_DIR, path), mode="a" if append else "w", header=not append, index=False)
 
-    print(f"Saved cleaned datasets: full={len(df_clean)}, 10yr={len(df_10y)}, 5yr={len(df_5y)} rows")
+def update_windows(new_rows, state, full_rebuild):
+    """
+    Appends new rows to the 10y/5y windows. If a cutoff moved later since the last run the
+    window is trimmed first; if it moved earlier the window is rebuilt from the full dataset.
+    """
+    sizes = {}
+    for path, cutoff in WINDOWS.items():
+        previous = None if full_rebuild else state["cutoffs"].get(path)
+        if full_rebuild:
+            window, append = filter_by_cutoff(new_rows, cutoff), False
+        elif previous is None or pd.to_datetime(cutoff) < pd.to_datetime(previous):
+            # results_full.csv already contains new_rows at this point
+            full = pd.read_csv(os.path.join(BASE_DIR, OUT_FULL), parse_dates=["date"])
+            window, append = filter_by_cutoff(full, cutoff), False
+        else:
+            if cutoff != previous:
+                old = pd.read_csv(os.path.join(BASE_DIR, path), parse_dates=["date"])
+                _write(filter_by_cutoff(old, cutoff), path, append=False)
+            window, append = filter_by_cutoff(new_rows, cutoff), True
+        _write(window, path, append)
+        with open(os.path.join(BASE_DIR, path)) as f:
+            sizes[path] = sum(1 for _ in f) - 1
+    return sizes
+
+def update_match_store(new_rows, append):
+    """
+    Mirrors results_full.csv into the columnar match store. Appends while the new rows keep
+    the store sorted by date, otherwise rewrites it from results_full.csv (stable date sort).
+    """
+    days_path = os.path.join(BASE_DIR, STORE_DIR, "days.npy")
+    if append and os.path.exists(days_path):
+        if len(new_rows) == 0:
+            return
+        last_day = np.load(days_path, mmap_mode="r")[-1]
+        first_day = (new_rows["date"].iloc[0] - pd.Timestamp("1970-01-01")).days
+        if new_rows["date"].is_monotonic_increasing and first_day >= last_day:
+            write_match_store(new_rows, append=True)
+            return
+    full = new_rows if not append else pd.read_csv(os.path.join(BASE_DIR, OUT_FULL), parse_dates=["date"])
+    write_match_store(full.sort_values("date", kind="stable"))
+
+def run(path: str = RAW_CSV, incremental: bool = True, chunk_size: int = CHUNK_SIZE):
+    """
+    Processes the raw csv into the three datasets.
+    With incremental=True and a matching saved state, only rows appended to the raw file
+    since the last run are read, cleaned and appended. Anything else (first run, edited or
+    truncated raw file, missing outputs) triggers a full rebuild, streamed in chunks.
+    """
+    state = load_state()
+    resume = incremental and _can_resume(state, path)
+    offset = state["raw_offset"] if resume else 0
+    seen = np.load(os.path.join(BASE_DIR, ROW_HASHES)) if resume else np.zeros(0, dtype=np.uint64)
+    raw_size, raw_last_line = raw_position(path)
+
+    chunks = read_raw_chunks(path, offset, chunk_size) if raw_size > offset else iter(())
+    new_rows, hashes = process_chunks(chunks, seen)
+    warn_home_advantage(new_rows)
+
+    _write(new_rows, OUT_FULL, append=resume)
+    sizes = update_windows(new_rows, state, full_rebuild=not resume)
+    update_match_store(new_rows, append=resume)
+
+    _save_state({
+        "raw_path": path,
+        "raw_offset": raw_size,
+        "raw_last_line": raw_last_line,
+        "rows": int(len(hashes)),
+        "last_date": str(new_rows["date"].max().date()) if len(new_rows) else (state or {}).get("last_date"),
+        "cutoffs": dict(WINDOWS),
+    }, hashes)
+
+    mode = "appended" if resume else "rebuilt"
+    print(f"Saved cleaned datasets ({mode} {len(new_rows)} rows): full={len(hashes)}, "
+          f"10yr={sizes[OUT_10Y]}, 5yr={sizes[OUT_5Y]} rows")
+    return new_rows
+
+def main():
+    run()
 
 if __name__ == "__main__":
     main()
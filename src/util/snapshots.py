@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from util.team_aggregates import TeamLong
+
+# as-of-date team features for backtesting, e.g. what the stats looked like before each
+# past world cup. a snapshot at date c uses the matches strictly before c.
+#
+# all snapshot dates are computed in one sweep over the matches:
+#   counts and goal sums: every team-match entry is binned by the first snapshot it belongs
+#     to, and a cumulative sum over the snapshot axis gives the running totals.
+#   decayed aggregates: sum over past matches of w * exp(-decay_lambda * days_before_c).
+#     moving from snapshot c_prev to c multiplies the running sums by
+#     exp(-decay_lambda * (c - c_prev)) and adds the matches in between.
+
+COUNT_FEATURES = [
+    "matches", "wins", "draws", "losses",
+    "home_wins", "home_losses", "away_wins", "away_losses",
+    "goals_for", "goals_against",
+]
+DECAYED_FEATURES = ["decayed_matches", "decayed_goals_for", "decayed_goals_against"]
+FEATURES = COUNT_FEATURES + DECAYED_FEATURES
+
+
+class Snapshots:
+    """values[d, t, f]: feature f of team t as of dates[d] (matches before that date)."""
+
+    def __init__(self, values, dates, teams, features=FEATURES):
+        self.values = values
+        self.dates = dates
+        self.teams = np.asarray(teams, dtype=object)
+        self.features = list(features)
+        self.team_to_idx = {team: i for i, team in enumerate(self.teams)}
+
+    def _date_index(self, date):
+        """Index of the last snapshot on or before date."""
+        d = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date)), side="right") - 1
+        if d < 0:
+            raise KeyError(f"no snapshot on or before {date}")
+        return d
+
+    def at(self, date):
+        """Team x feature table of the last snapshot on or before date."""
+        return pd.DataFrame(self.values[self._date_index(date)], index=self.teams, columns=self.features)
+
+    def team(self, team):
+        """Date x feature history of one team."""
+        return pd.DataFrame(self.values[:, self.team_to_idx[team]], index=self.dates, columns=self.features)
+
+    def feature(self, name):
+        """Date x team history of one feature."""
+        return pd.DataFrame(self.values[:, :, self.features.index(name)], index=self.dates, columns=self.teams)
+
+    def decayed_means(self):
+        """(dates, teams, 2) decayed average goals for / against, NaN before a team's first match."""
+        f = [self.features.index(n) for n in DECAYED_FEATURES]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.values[..., f[1:]] / self.values[..., f[:1]]
+
+
+def team_snapshots(df, dates, decay_lambda=0.001, match_weights=None):
+    """
+    Snapshots of COUNT_FEATURES and DECAYED_FEATURES for every team at every date.
+    df:            results dataframe (date, home_team, away_team, home_score, away_score)
+    dates:         snapshot dates, any order; they are sorted in the result
+    decay_lambda:  per-day decay of the decayed aggregates (DECAY_LAMBDA in extended_stats)
+    match_weights: optional per-match weights for the decayed aggregates, e.g. tournament importance
+    Returns a Snapshots with values of shape (len(dates), n_teams, len(FEATURES)).
+    """
+    long = TeamLong(df)
+    cutoffs = np.unique(pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]"))
+    day = long.dates.astype("datetime64[D]")
+
+    # first snapshot each entry counts toward; len(cutoffs) = after the last one
+    interval = np.searchsorted(cutoffs, day, side="right")
+    n_dates, n_teams = len(cutoffs), long.n_teams
+    used = interval < n_dates
+    cell = interval[used] * n_teams + long.codes[used]
+
+    gf, ga = long.goals_for, long.goals_against
+    indicators = [
+        np.ones_like(gf, dtype=bool), gf > ga, gf == ga, gf < ga,
+        long.is_home & (gf > ga), long.is_home & (gf < ga),
+        ~long.is_home & (gf > ga), ~long.is_home & (gf < ga),
+    ]
+    counts = np.stack(
+        [np.bincount(cell, weights=x[used], minlength=n_dates * n_teams) for x in indicators]
+        + [np.bincount(cell, weights=x[used], minlength=n_dates * n_teams) for x in (gf, ga)],
+        axis=-1,
+    ).reshape(n_dates, n_teams, len(COUNT_FEATURES))
+    counts = np.cumsum(counts, axis=0)
+
+    # decayed sums: contribution of each entry at its first snapshot, then carried forward
+    w = np.ones(len(gf)) if match_weights is None else np.tile(np.asarray(match_weights, dtype=np.float64), 2)
+    age = (cutoffs[np.minimum(interval, n_dates - 1)] - day).astype(np.float64)
+    contrib = w[used] * np.exp(-decay_lambda * age[used])
+    new = np.stack(
+        [np.bincount(cell, weights=contrib * x, minlength=n_dates * n_teams) for x in (1.0, gf[used], ga[used])],
+        axis=-1,
+    ).reshape(n_dates, n_teams, len(DECAYED_FEATURES))
+    step = np.exp(-decay_lambda * np.diff(cutoffs).astype(np.float64))
+    decayed = np.empty_like(new)
+    running = np.zeros(new.shape[1:])
+    for d in range(n_dates):
+        running = running * (step[d - 1] if d else 1.0) + new[d]
+        decayed[d] = running
+
+    values = np.concatenate([counts, decayed], axis=-1)
+    return Snapshots(values, cutoffs, long.teams)
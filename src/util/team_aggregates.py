@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+# per-team aggregation helpers shared by the experiment scripts.
+# matches are melted into a long, team-perspective layout once (2 rows per match: the home
+# side, then the away side) and aggregated with bincount, instead of filtering the whole
+# dataframe once per team.
+
+
+class TeamLong:
+    """
+    Team-perspective view of a results dataframe with n matches, as flat arrays of length 2n:
+    entry i < n is the home side of match i, entry n + i the away side.
+    team codes follow the first appearance in concat([home_team, away_team]), i.e. the
+    order of pd.concat([df["home_team"], df["away_team"]]).unique().
+    """
+
+    def __init__(self, df):
+        self.n_matches = len(df)
+        self.codes, self.teams = pd.factorize(
+            np.concatenate([df["home_team"].to_numpy(), df["away_team"].to_numpy()]))
+        self.teams = np.asarray(self.teams, dtype=object)
+        home, away = df["home_score"].to_numpy(), df["away_score"].to_numpy()
+        self.goals_for = np.concatenate([home, away])
+        self.goals_against = np.concatenate([away, home])
+        self.is_home = np.repeat([True, False], self.n_matches)
+        self.dates = pd.to_datetime(df["date"]).to_numpy() if "date" in df else None
+        if self.dates is not None:
+            self.dates = np.concatenate([self.dates, self.dates])
+
+    @property
+    def n_teams(self):
+        return len(self.teams)
+
+    def count(self, mask, weights=None):
+        """Per-team sum of weights (or number of entries) over the masked entries."""
+        w = None if weights is None else np.asarray(weights)[mask]
+        return np.bincount(self.codes[mask], weights=w, minlength=self.n_teams)
+
+    def present(self, mask):
+        """Codes of the teams with entries in mask, in order of first appearance."""
+        codes = self.codes[mask]
+        _, first = np.unique(codes, return_index=True)
+        return codes[np.sort(first)]
+
+    def window_masks(self, as_of=None, windows=None):
+        """
+        Entry masks per window. Without windows a single mask (key None) for all matches
+        before as_of. A window is a start date (matches on or after it) or a (start, end)
+        pair with end exclusive, either side may be None; as_of caps every window's end.
+        """
+        if windows is None:
+            windows = [None]
+        masks = {}
+        for window in windows:
+            start, end = window if isinstance(window, tuple) else (window, None)
+            if as_of is not None:
+                end = as_of if end is None else min(pd.Timestamp(end), pd.Timestamp(as_of))
+            mask = np.ones(2 * self.n_matches, dtype=bool)
+            if start is not None:
+                mask &= self.dates >= np.datetime64(pd.Timestamp(start))
+            if end is not None:
+                mask &= self.dates < np.datetime64(pd.Timestamp(end))
+            masks[window] = mask
+        return masks
+
+
+def grouped_weighted_median(groups, values, weights, n_groups=None, order=None):
+    """
+    Weighted median of values per group, all groups at once; same definition as
+    extended_stats.weighted_median (first sorted value where the cumulative weight
+    reaches half the group's total). NaN for empty groups.
+    order: optional precomputed np.lexsort((values, groups)); it does not depend on the
+           weights, so it can be reused for many weightings of the same values.
+    """
+    groups = np.asarray(groups)
+    n_groups = int(groups.max()) + 1 if n_groups is None else n_groups
+    if order is None:
+        order = np.lexsort((values, groups))
+    g, v, w = groups[order], np.asarray(values)[order], np.asarray(weights, dtype=np.float64)[order]
+
+    size = np.bincount(g, minlength=n_groups)
+    start = np.concatenate([[0], np.cumsum(size)[:-1]])
+    within = _segmented_cumsum(w, start, size)
+    total = np.zeros(n_groups)
+    total[size > 0] = within[start[size > 0] + size[size > 0] - 1]
+
+    # within a group the running weight only grows, so the median sits after
+    # the entries that are still below the cutoff
+    below = within < total[g] / 2.0
+    pos = start + np.bincount(g, weights=below, minlength=n_groups).astype(np.int64)
+    medians = np.full(n_groups, np.nan)
+    nonempty = size > 0
+    medians[nonempty] = v[np.minimum(pos[nonempty], start[nonempty] + size[nonempty] - 1)]
+    return medians
+
+
+def _segmented_cumsum(w, start, size):
+    """
+    Running sum of w restarting at every group start. Steps through the k-th entry of all
+    groups at once, so every group is summed from its own start (no global cumsum, which
+    would lose tiny weights of a group next to large ones).
+    """
+    within = np.empty_like(w)
+    by_size = np.argsort(-size, kind="stable")
+    sorted_size = size[by_size]
+    running = np.zeros(len(size))
+    for k in range(int(sorted_size[0]) if len(size) else 0):
+        active = by_size[:np.searchsorted(-sorted_size, -k, side="left")]
+        idx = start[active] + k
+        running[active] += w[idx]
+        within[idx] = running[active]
+    return within
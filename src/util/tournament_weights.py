@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+# tournament importance weights of a match, shared by the experiment scripts
+# (extended_stats) and the rating models (models/elo.py).
+
+MAJOR_TOURNAMENTS = [
+    "fifa world cup", "fifa world cup qualification",
+    "uefa euro", "uefa euro qualification",
+    "copa américa", "copa américa qualification",
+    "african cup of nations", "african cup of nations qualification",
+    "afc asian cup", "afc asian cup qualification",
+    "gold cup", "gold cup qualification",
+    "uefa nations league", "concacaf nations league"
+]
+FRIENDLIES = ["friendly", "kirin challenge cup", "three nations cup", "tri nation tournament", "tri-nations series", "island games", "fifa series"]
+MINOR_REGIONAL = ["baltic cup", "saff cup", "aff championship", "aff championship qualification",
+                  "conifa world football cup qualification", "conifa asia cup",
+                  "conifa south america football cup", "conifa africa football cup"]
+
+
+def get_tournament_weight(name):
+    t = str(name).lower()
+    if t in MAJOR_TOURNAMENTS:
+        if "world cup" in t: return 1.5
+        if "euro" in t or "copa américa" in t or "african cup" in t or "afc asian cup" in t or "gold cup" in t: return 1.3
+        return 1.2
+    elif t in FRIENDLIES:
+        return 1.0
+    elif t in MINOR_REGIONAL:
+        return 0.9
+    return 1.0
+
+
+def tournament_weights(tournaments):
+    """Importance weight per match; get_tournament_weight runs once per distinct tournament."""
+    codes, names = pd.factorize(pd.Series(tournaments), use_na_sentinel=False)
+    return np.array([get_tournament_weight(name) for name in names])[codes]